@@ -0,0 +1,54 @@
+"""Add identification jobs queue
+
+Revision ID: 3f1c2a9b7e41
+Revises: d6254284c879
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7e41'
+down_revision: Union[str, None] = 'd6254284c879'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # init_db() may already have created it from the model
+    if sa.inspect(op.get_bind()).has_table('identification_jobs'):
+        return
+    op.create_table(
+        'identification_jobs',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('user_id', sa.String(length=100), nullable=True),
+        sa.Column('tier', sa.String(length=20), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('image_data', sa.LargeBinary(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_identification_jobs_id'), 'identification_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_identification_jobs_user_id'), 'identification_jobs', ['user_id'], unique=False)
+    op.create_index(op.f('ix_identification_jobs_status'), 'identification_jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_identification_jobs_created_at'), 'identification_jobs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_identification_jobs_created_at'), table_name='identification_jobs')
+    op.drop_index(op.f('ix_identification_jobs_status'), table_name='identification_jobs')
+    op.drop_index(op.f('ix_identification_jobs_user_id'), table_name='identification_jobs')
+    op.drop_index(op.f('ix_identification_jobs_id'), table_name='identification_jobs')
+    op.drop_table('identification_jobs')
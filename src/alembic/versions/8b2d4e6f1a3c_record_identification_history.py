@@ -0,0 +1,59 @@
+"""Record identification history from the API
+
+Revision ID: 8b2d4e6f1a3c
+Revises: 3f1c2a9b7e41
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d4e6f1a3c'
+down_revision: Union[str, None] = '3f1c2a9b7e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The initial migration is empty and tables come from init_db(); a fresh
+    # database gets these columns from the model directly
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('identifications'):
+        return
+    # init_db() with the current model already created these columns
+    if 'request_id' in {column['name'] for column in inspector.get_columns('identifications')}:
+        return
+    # Batch mode recreates the table on SQLite, which cannot alter column nullability
+    with op.batch_alter_table('identifications') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.add_column(sa.Column('request_id', sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column('api_user_id', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('tier', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('species_code', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('model_version', sa.String(length=100), nullable=True))
+        batch_op.create_index(batch_op.f('ix_identifications_request_id'), ['request_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_identifications_api_user_id'), ['api_user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_identifications_species_code'), ['species_code'], unique=False)
+        batch_op.create_index(batch_op.f('ix_identifications_created_at'), ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('identifications'):
+        return
+    with op.batch_alter_table('identifications') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_identifications_created_at'))
+        batch_op.drop_index(batch_op.f('ix_identifications_species_code'))
+        batch_op.drop_index(batch_op.f('ix_identifications_api_user_id'))
+        batch_op.drop_index(batch_op.f('ix_identifications_request_id'))
+        batch_op.drop_column('model_version')
+        batch_op.drop_column('species_code')
+        batch_op.drop_column('tier')
+        batch_op.drop_column('api_user_id')
+        batch_op.drop_column('request_id')
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
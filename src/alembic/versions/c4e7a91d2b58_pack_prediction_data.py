@@ -0,0 +1,125 @@
+"""Pack prediction_data into a binary column
+
+Revision ID: c4e7a91d2b58
+Revises: 8b2d4e6f1a3c
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import json
+import logging
+import struct
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e7a91d2b58'
+down_revision: Union[str, None] = '8b2d4e6f1a3c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same layout as ml.predictions.PREDICTION_DTYPE: uint16 species_codes id, float16 confidence
+RECORD = struct.Struct('<He')
+MAX_SPECIES_CODE_ID = 65535
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # init_db() may already have created it from the model
+    if not sa.inspect(bind).has_table('species_codes'):
+        op.create_table(
+            'species_codes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('code', sa.String(length=100), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_species_codes_code'), 'species_codes', ['code'], unique=True)
+
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('identifications'):
+        return
+    # init_db() may also have created identifications with the binary column already
+    columns = {column['name']: column['type'] for column in inspector.get_columns('identifications')}
+    if isinstance(columns.get('prediction_data'), sa.LargeBinary):
+        return
+
+    # Re-encode existing JSON rows, registering their species codes as they appear
+    codes = {}
+    packed = []
+    unreadable = []
+    for row_id, data in bind.execute(sa.text('SELECT id, prediction_data FROM identifications WHERE prediction_data IS NOT NULL')):
+        try:
+            predictions = json.loads(data)
+        except (TypeError, ValueError):
+            # Keep the original text, as bytes, rather than lose it
+            unreadable.append(row_id)
+            packed.append({'id': row_id, 'data': data.encode('utf-8') if isinstance(data, str) else data})
+            continue
+        blob = b''
+        for prediction in predictions:
+            code = prediction.get('species_id')
+            if code is None:
+                continue
+            if code not in codes:
+                # Let the database assign the id so its sequence stays ahead of the rows written here
+                bind.execute(sa.text('INSERT INTO species_codes (code) VALUES (:code)'), {'code': code})
+                codes[code] = bind.execute(sa.text('SELECT id FROM species_codes WHERE code = :code'), {'code': code}).scalar_one()
+                if codes[code] > MAX_SPECIES_CODE_ID:
+                    raise ValueError(f'species_codes id {codes[code]} for {code!r} does not fit the packed uint16 format')
+            blob += RECORD.pack(codes[code], float(prediction.get('confidence', 0.0)))
+        packed.append({'id': row_id, 'data': blob})
+
+    with op.batch_alter_table('identifications') as batch_op:
+        batch_op.alter_column(
+            'prediction_data', existing_type=sa.Text(), type_=sa.LargeBinary(), existing_nullable=True,
+            postgresql_using="convert_to(prediction_data, 'UTF8')"
+        )
+
+    if unreadable:
+        logger.warning(
+            f'Left {len(unreadable)} identifications with unparseable prediction_data unconverted, ids: '
+            f'{", ".join(str(row_id) for row_id in unreadable)}'
+        )
+    if packed:
+        bind.execute(sa.text('UPDATE identifications SET prediction_data = :data WHERE id = :id').bindparams(sa.bindparam('data', type_=sa.LargeBinary())), packed)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if sa.inspect(bind).has_table('identifications'):
+        codes = dict(bind.execute(sa.text('SELECT id, code FROM species_codes')).all())
+        unpacked = []
+        for row_id, data in bind.execute(sa.text('SELECT id, prediction_data FROM identifications WHERE prediction_data IS NOT NULL')):
+            try:
+                records = list(RECORD.iter_unpack(data))
+            except struct.error:
+                records = None
+            # Rows the upgrade could not parse hold their original text, which does not
+            # unpack into registered species ids
+            if records is None or any(index not in codes for index, _ in records):
+                unpacked.append({'id': row_id, 'data': bytes(data).decode('utf-8', errors='replace')})
+                continue
+            unpacked.append({'id': row_id, 'data': json.dumps([
+                {'species_id': codes[index], 'confidence': round(confidence, 3)}
+                for index, confidence in records
+            ])})
+
+        with op.batch_alter_table('identifications') as batch_op:
+            batch_op.alter_column(
+                'prediction_data', existing_type=sa.LargeBinary(), type_=sa.Text(), existing_nullable=True,
+                # Every row is rewritten below, and packed rows are not valid text
+                postgresql_using='NULL'
+            )
+
+        if unpacked:
+            bind.execute(sa.text('UPDATE identifications SET prediction_data = :data WHERE id = :id'), unpacked)
+
+    op.drop_index(op.f('ix_species_codes_code'), table_name='species_codes')
+    op.drop_table('species_codes')
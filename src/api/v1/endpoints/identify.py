@@ -1,13 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import asyncio
+import functools
 import time
+from datetime import datetime, timedelta
 import uuid
 from PIL import Image
-import io
+import json
 import logging
+import tarfile
+import zipfile
+import zlib
 from config import settings
+from ml.executor import inference_executor, InferenceQueueFull
+from ml.batching import BatchScheduler
+from ml.cache import ResultCache, content_hash
+from ml.phash import NearDuplicateIndex, dhash
+from ml.decode import ImageDecodeError, decode_model_input, read_image_info
+from ml.roi import decode_roi_for_model
+from ml.singleflight import SingleFlight
+from ml.models import ModelNotAvailable
+from ml.registry import ModelManager
+from ml.jobs import JobQueue
+from ml.priority import AdmissionRejected, TierScheduler
+from ml.upload import UploadTooLarge, read_upload
+from ml.history import IdentificationWriter
+from ml.predictions import candidate_statistics, top_species_counts
 
 logger = logging.getLogger(__name__)
 
@@ -30,76 +50,73 @@ class IdentificationResponse(BaseModel):
     image_info: dict
     metadata: dict
 
-# Mock ML model for demonstration
-class MockMLModel:
-    def __init__(self):
-        # Mock Indonesian plant species data
-        self.mock_species = [
-            {
-                "species_id": "dendrobium_nobile",
-                "scientific_name": "Dendrobium nobile",
-                "common_name": "Noble Dendrobium",
-                "family": "Orchidaceae",
-                "genus": "Dendrobium"
-            },
-            {
-                "species_id": "ficus_benjamina",
-                "scientific_name": "Ficus benjamina",
-                "common_name": "Weeping Fig",
-                "family": "Moraceae",
-                "genus": "Ficus"
-            },
-            {
-                "species_id": "hibiscus_rosa_sinensis",
-                "scientific_name": "Hibiscus rosa-sinensis",
-                "common_name": "Chinese Hibiscus",
-                "family": "Malvaceae",
-                "genus": "Hibiscus"
-            },
-            {
-                "species_id": "plumeria_rubra",
-                "scientific_name": "Plumeria rubra",
-                "common_name": "Frangipani",
-                "family": "Apocynaceae",
-                "genus": "Plumeria"
-            },
-            {
-                "species_id": "bougainvillea_spectabilis",
-                "scientific_name": "Bougainvillea spectabilis",
-                "common_name": "Great Bougainvillea",
-                "family": "Nyctaginaceae",
-                "genus": "Bougainvillea"
-            }
-        ]
+class BatchIdentificationItem(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str  # completed, failed
+    results: List[IdentificationResult] = []
+    image_info: dict = {}
+    cache_match: Optional[str] = None  # exact, near_duplicate, coalesced
+    processing_time: float = 0.0
+    model_version: Optional[str] = None
+    decoded_pixels: int = 0
+    error: Optional[str] = None
     
-    def predict(self, image_data: bytes) -> List[IdentificationResult]:
-        """Mock prediction - returns random species with confidence scores"""
-        import random
-        
-        # Simulate processing time
-        time.sleep(0.1)
-        
-        # Generate mock results
-        results = []
-        selected_species = random.sample(self.mock_species, min(3, len(self.mock_species)))
-        
-        for i, species in enumerate(selected_species):
-            confidence = random.uniform(0.6, 0.95) if i == 0 else random.uniform(0.3, 0.7)
-            results.append(IdentificationResult(
-                species_id=species["species_id"],
-                scientific_name=species["scientific_name"],
-                common_name=species["common_name"],
-                confidence=round(confidence, 3),
-                family=species["family"],
-                genus=species["genus"]
-            ))
-        
-        # Sort by confidence
-        results.sort(key=lambda x: x.confidence, reverse=True)
-        return results
+    model_config = {"protected_namespaces": ()}
+
+class IdentificationJobResponse(BaseModel):
+    job_id: str
+    status: str  # pending, processing, completed, failed
+    filename: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    result: Optional[IdentificationResponse] = None
+    error: Optional[str] = None
+
+class IdentificationOutcome(BaseModel):
+    image_info: dict
+    results: List[IdentificationResult]
+    model_version: str
+    cache_match: Optional[str] = None  # exact, near_duplicate, coalesced
+    similar_observations: Optional[List[dict]] = None
+    tta_views: Optional[int] = None  # augmented views averaged per prediction, None without TTA
+    roi: Optional[List[int]] = None  # (left, top, right, bottom) region the model saw, None for the full frame
+    decoded_pixels: int = 0  # pixels decoded for this request, 0 for exact cache hits
+    
+    model_config = {"protected_namespaces": ()}
+
+# Active identification model, hot-swapped from the model registry when one is configured
+model_manager = ModelManager.from_settings()
+
+# Concurrent requests share batched predict calls on the inference pool
+batch_scheduler = BatchScheduler.from_settings(model_manager.predict_batch, inference_executor)
+
+# Test-time augmentation: every queued image contributes TTA_VIEWS views to one batched forward pass
+tta_scheduler = BatchScheduler.from_settings(
+    functools.partial(model_manager.predict_augmented, views=settings.TTA_VIEWS),
+    inference_executor
+)
 
-# Initialize mock model
-ml_model = MockMLModel()
+# Results of previously seen uploads, keyed by content hash and model version
+result_cache = ResultCache.from_settings() if settings.RESULT_CACHE_ENABLED else None
+
+# Perceptual hashes of previously predicted uploads, pointing at their result cache entries
+near_duplicate_index = (
+    NearDuplicateIndex.from_settings()
+    if settings.PHASH_ENABLED and result_cache is not None
+    else None
+)
+
+# Identical uploads in flight at the same time share one identification
+single_flight = SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+
+# Inference slots handed out by tier, so paid traffic is served ahead of free-tier bursts
+tier_scheduler = TierScheduler.from_settings()
+
+# Identification history, buffered and bulk-inserted off the request path
+history_writer = IdentificationWriter.from_settings()
 
 def validate_image(file: UploadFile) -> tuple[bool, str]:
     """Validate uploaded image file"""
@@ -113,24 +130,435 @@ def validate_image(file: UploadFile) -> tuple[bool, str]:
     
     return True, "Valid"
 
-def process_image(image_data: bytes) -> dict:
-    """Process and analyze image"""
+def prepare_image(image_data: bytes) -> Tuple[dict, Image.Image, Optional[int], dict]:
+    """Validate an upload from its header, then decode it once at model input resolution
+    
+    Returns the image info, the decoded model input, its perceptual hash when
+    near-duplicate lookup is enabled, and decode details: the pixel count decoded
+    and the region of interest when ROI cropping is enabled and found one. Raises
+    ImageDecodeError for invalid uploads.
+    """
+    image_info = read_image_info(image_data)
+    if settings.ROI_ENABLED:
+        model_input, decoded_pixels, roi = decode_roi_for_model(image_data)
+    else:
+        (model_input, decoded_pixels), roi = decode_model_input(image_data), None
+    
+    phash = None
+    if near_duplicate_index is not None:
+        # A zero hash has no horizontal detail at all and would match every other flat image
+        phash = dhash(model_input) or None
+    return image_info, model_input, phash, {"decoded_pixels": decoded_pixels, "roi": list(roi) if roi else None}
+
+async def run_identification(
+    image_data: bytes,
+    tier: Optional[str] = None,
+    deadline: Optional[float] = None,
+    digest: Optional[str] = None,
+    tta: bool = False
+) -> IdentificationOutcome:
+    """Identify an image through the result caches and the shared inference pipeline
+    
+    The outcome holds the unfiltered predictions, the model version that produced
+    them and how they were matched: "exact" or "near_duplicate" for cache hits,
+    "coalesced" when an identical upload already in flight produced them, or None
+    when this request ran the model. Only requests that have to run the model wait
+    for a tier-prioritized inference slot, and are shed if deadline (a
+    time.monotonic() value) passes first; a request coalesced onto one that was shed
+    is retried under its own tier and deadline. Pass digest when the upload was already
+    hashed while it was read. With tta the model averages several augmented views;
+    those results are cached separately from plain ones.
+    """
+    digest = digest or content_hash(image_data)
+    cache_key = ResultCache.make_key(digest, cache_version(model_manager.version, tta))
+    
+    if result_cache is not None:
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            return cached_outcome(cached, cached["image_info"], "exact")
+    
+    if single_flight is None:
+        return await identify_prioritized(image_data, digest, tier, deadline, tta)
+    
+    # The cache key carries the model version and the TTA views, so plain and TTA
+    # requests for one image never share a flight
+    while True:
+        led = False
+        
+        def lead():
+            nonlocal led
+            led = True
+            return identify_prioritized(image_data, digest, tier, deadline, tta)
+        
+        try:
+            outcome, coalesced = await single_flight.do(cache_key, lead)
+        except AdmissionRejected:
+            # A flight is admitted under its leader's tier and deadline; when the leader
+            # is shed, each follower retries under its own, leading or joining a new flight
+            if led:
+                raise
+            continue
+        return outcome.model_copy(update={"cache_match": "coalesced"}) if coalesced else outcome
+
+def cache_version(model_version: str, tta: bool) -> str:
+    """Version part of the result cache key; ROI cropping and TTA views change results too"""
+    version = f"{model_version}+roi" if settings.ROI_ENABLED else model_version
+    return f"{version}+tta{settings.TTA_VIEWS}" if tta else version
+
+def cached_outcome(cached: dict, image_info: dict, cache_match: str) -> IdentificationOutcome:
+    return IdentificationOutcome(
+        image_info=image_info,
+        results=[IdentificationResult(**r) for r in cached["results"]],
+        model_version=cached.get("model_version", model_manager.version),
+        cache_match=cache_match,
+        similar_observations=cached.get("similar_observations"),
+        tta_views=cached.get("tta_views"),
+        roi=cached.get("roi")
+    )
+
+async def identify_prioritized(
+    image_data: bytes,
+    digest: str,
+    tier: Optional[str],
+    deadline: Optional[float] = None,
+    tta: bool = False
+) -> IdentificationOutcome:
+    async with tier_scheduler.slot(tier, deadline):
+        return await identify_uncached(image_data, digest, tta)
+
+async def identify_uncached(image_data: bytes, digest: str, tta: bool = False) -> IdentificationOutcome:
+    """Decode and predict an image that missed the exact result cache"""
+    # Decode on the inference pool so the event loop stays free
+    image_info, model_input, phash, decoded = await inference_executor.run(prepare_image, image_data)
+    
+    if result_cache is not None and phash is not None:
+        match = near_duplicate_index.lookup(phash)
+        if match is not None:
+            match_digest, similarity = match
+            model_version = model_manager.version
+            cached = await result_cache.get(ResultCache.make_key(match_digest, cache_version(model_version, tta)))
+            if cached is not None:
+                logger.info(f"Near-duplicate cache hit (similarity {similarity:.3f})")
+                cached = {**cached, "image_info": image_info, "model_version": model_version, "roi": decoded["roi"]}
+                await result_cache.set(ResultCache.make_key(digest, cache_version(model_version, tta)), cached)
+                outcome = cached_outcome(cached, image_info, "near_duplicate")
+                return outcome.model_copy(update={"decoded_pixels": decoded["decoded_pixels"]})
+    
+    # The model may be swapped while this waits, so cache under the version that actually answered
+    # TTA requests batch only with each other, so every batch is one model call of uniform views
+    scheduler = tta_scheduler if tta else batch_scheduler
+    model_version, predictions = await scheduler.submit(model_input)
+    similar = await find_similar_observations(model_input, model_version)
+    tta_views = settings.TTA_VIEWS if tta else None
+    
+    if result_cache is not None:
+        await result_cache.set(ResultCache.make_key(digest, cache_version(model_version, tta)), {
+            "image_info": image_info,
+            "results": predictions,
+            "model_version": model_version,
+            "similar_observations": similar,
+            "tta_views": tta_views,
+            "roi": decoded["roi"]
+        })
+        if phash is not None:
+            near_duplicate_index.add(phash, digest)
+    
+    return IdentificationOutcome(
+        image_info=image_info,
+        results=[IdentificationResult(**r) for r in predictions],
+        model_version=model_version,
+        similar_observations=similar,
+        tta_views=tta_views,
+        **decoded
+    )
+
+async def find_similar_observations(model_input: Image.Image, model_version: str) -> Optional[List[dict]]:
+    """Look up past identifications with similar images when the active model indexes them"""
+    if settings.SIMILAR_OBSERVATIONS_K <= 0 or not model_manager.current.has_observations:
+        return None
+    version, matches = await inference_executor.run(
+        model_manager.similar_observations, [model_input], settings.SIMILAR_OBSERVATIONS_K
+    )
+    # Embeddings from different model versions are not comparable
+    return matches[0] if version == model_version else None
+
+def request_deadline(request: Request) -> float:
+    """Deadline for a synchronous identification, optionally shortened by the X-Request-Timeout header"""
+    timeout = settings.ADMISSION_DEFAULT_DEADLINE_SECONDS
+    header = request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            timeout = min(float(header), settings.ADMISSION_MAX_DEADLINE_SECONDS)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+        if timeout <= 0:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be positive")
+    return time.monotonic() + timeout
+
+async def read_image_upload(file: UploadFile) -> Tuple[bytes, str]:
+    """Stream an upload into memory, rejecting oversized or non-image data early"""
     try:
-        image = Image.open(io.BytesIO(image_data))
-        return {
-            "width": image.width,
-            "height": image.height,
-            "format": image.format,
-            "mode": image.mode,
-            "size_bytes": len(image_data)
-        }
-    except Exception as e:
+        return await read_upload(file)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds maximum limit of {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+        )
+    except ImageDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
 
+def busy_exception(e: InferenceQueueFull) -> HTTPException:
+    retry_after = getattr(e, "retry_after", 1)
+    return HTTPException(
+        status_code=503,
+        detail="Identification service is busy, please retry shortly",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def filter_results(results: List[IdentificationResult]) -> List[IdentificationResult]:
+    """Drop predictions below the configured confidence threshold"""
+    return [
+        result for result in results 
+        if result.confidence >= settings.CONFIDENCE_THRESHOLD
+    ]
+
+# Batch uploads
+BATCH_TIERS = {"professional", "enterprise", "partner"}
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip"
+}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Raised by a corrupt, truncated, encrypted or unsupported archive member: bad CRCs
+# (BadZipFile), broken deflate or gzip streams, and zipfile's RuntimeError and
+# NotImplementedError for passwords and unknown compression methods
+ARCHIVE_READ_ERRORS = (
+    zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError, RuntimeError, NotImplementedError
+)
+
+def is_archive(file: UploadFile) -> bool:
+    """Check whether an upload is a zip/tar archive of images"""
+    filename = (file.filename or "").lower()
+    return file.content_type in ARCHIVE_CONTENT_TYPES or filename.endswith(ARCHIVE_EXTENSIONS)
+
+def iter_archive_images(fileobj) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """Yield (name, image bytes, error) for every image member of a zip or tar archive"""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if member.file_size > settings.MAX_FILE_SIZE:
+                    yield member.filename, None, "File size exceeds maximum limit"
+                    continue
+                # A bad member fails on its own; the rest of the archive is still read
+                try:
+                    data = archive.read(member)
+                except ARCHIVE_READ_ERRORS as e:
+                    yield member.filename, None, f"Unreadable archive member: {str(e)}"
+                    continue
+                yield member.filename, data, None
+        return
+    
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if member.size > settings.MAX_FILE_SIZE:
+                yield member.name, None, "File size exceeds maximum limit"
+                continue
+            try:
+                data = archive.extractfile(member).read()
+            except ARCHIVE_READ_ERRORS as e:
+                yield member.name, None, f"Unreadable archive member: {str(e)}"
+                continue
+            yield member.name, data, None
+
+async def iter_batch_images(files: List[UploadFile]) -> AsyncIterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """Yield (name, image bytes, error) for every image in a batch upload"""
+    for upload in files:
+        if is_archive(upload):
+            members = iter_archive_images(upload.file)
+            try:
+                while True:
+                    # Archive reads are plain file I/O, keep them off the inference pool
+                    entry = await asyncio.to_thread(next, members, None)
+                    if entry is None:
+                        break
+                    yield entry
+            except ARCHIVE_READ_ERRORS as e:
+                # The archive itself is unreadable past this point, e.g. a truncated tar stream
+                yield upload.filename, None, f"Invalid archive: {str(e)}"
+            continue
+        
+        is_valid, validation_message = validate_image(upload)
+        if not is_valid:
+            yield upload.filename, None, validation_message
+            continue
+        try:
+            image_data, _ = await read_upload(upload)
+        except UploadTooLarge:
+            yield upload.filename, None, f"File size exceeds maximum limit of {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+            continue
+        except ImageDecodeError as e:
+            yield upload.filename, None, f"Invalid image format: {str(e)}"
+            continue
+        yield upload.filename, image_data, None
+
+async def stream_batch_identification(files: List[UploadFile], request_id: str, user_info: Optional[dict] = None) -> AsyncIterator[str]:
+    """Identify a batch of images, yielding one NDJSON line per image as it completes"""
+    start_time = time.time()
+    user_info = user_info or {}
+    tier = user_info.get("tier")
+    completed = asyncio.Queue()
+    semaphore = asyncio.Semaphore(settings.BATCH_REQUEST_CONCURRENCY)
+    summary = {"total": 0, "succeeded": 0, "failed": 0, "truncated": False}
+    
+    async def identify_item(index: int, filename: str, image_data: Optional[bytes], error: Optional[str]):
+        item_start = time.time()
+        try:
+            if error:
+                item = BatchIdentificationItem(index=index, filename=filename, status="failed", error=error)
+            else:
+                digest = content_hash(image_data)
+                outcome = await run_identification(image_data, tier, digest=digest)
+                record_identification(request_id, outcome, digest, user_info, time.time() - item_start)
+                item = BatchIdentificationItem(
+                    index=index,
+                    filename=filename,
+                    status="completed",
+                    results=filter_results(outcome.results),
+                    image_info=outcome.image_info,
+                    cache_match=outcome.cache_match,
+                    model_version=outcome.model_version,
+                    decoded_pixels=outcome.decoded_pixels
+                )
+        except ImageDecodeError as e:
+            item = BatchIdentificationItem(index=index, filename=filename, status="failed", error=f"Invalid image format: {str(e)}")
+        except InferenceQueueFull:
+            item = BatchIdentificationItem(index=index, filename=filename, status="failed", error="Identification service is busy")
+        except ModelNotAvailable:
+            item = BatchIdentificationItem(index=index, filename=filename, status="failed", error="Identification model is not available")
+        except Exception as e:
+            logger.error(f"Error identifying {filename} in batch {request_id}: {str(e)}")
+            item = BatchIdentificationItem(index=index, filename=filename, status="failed", error=f"Error processing image: {str(e)}")
+        finally:
+            semaphore.release()
+        item.processing_time = round(time.time() - item_start, 4)
+        await completed.put(item)
+    
+    async def produce():
+        tasks = []
+        try:
+            async for filename, image_data, error in iter_batch_images(files):
+                if len(tasks) >= settings.BATCH_MAX_IMAGES:
+                    summary["truncated"] = True
+                    break
+                # Bound in-flight images so one large batch cannot flood the inference queue
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(identify_item(len(tasks), filename, image_data, error)))
+            await asyncio.gather(*tasks)
+        finally:
+            await completed.put(None)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await completed.get()
+            if item is None:
+                break
+            summary["total"] += 1
+            summary["succeeded" if item.status == "completed" else "failed"] += 1
+            yield item.model_dump_json() + "\n"
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+    
+    summary["processing_time"] = round(time.time() - start_time, 4)
+    logger.info(f"Batch identification {request_id} completed: {summary}")
+    yield json.dumps({"request_id": request_id, "done": True, **summary}) + "\n"
+
+def build_identification_response(request_id: str, start_time: float, outcome: IdentificationOutcome, user_info: dict) -> IdentificationResponse:
+    """Assemble the identify response, filtering results by the confidence threshold"""
+    filtered_results = filter_results(outcome.results)
+    
+    return IdentificationResponse(
+        request_id=request_id,
+        timestamp=time.time(),
+        results=filtered_results,
+        processing_time=round(time.time() - start_time, 4),
+        image_info=outcome.image_info,
+        metadata={
+            "user_id": user_info.get("user_id"),
+            "tier": user_info.get("tier"),
+            "confidence_threshold": settings.CONFIDENCE_THRESHOLD,
+            "total_candidates": len(outcome.results),
+            "filtered_candidates": len(filtered_results),
+            "model_version": outcome.model_version,
+            "cache_hit": outcome.cache_match is not None,
+            "cache_match": outcome.cache_match,
+            "similar_observations": outcome.similar_observations,
+            "tta_views": outcome.tta_views,
+            "roi": outcome.roi,
+            "decoded_pixels": outcome.decoded_pixels
+        }
+    )
+
+def record_identification(request_id: str, outcome: IdentificationOutcome, digest: str, user_info: dict, processing_time: float):
+    """Queue an identification for the history table without waiting on the database
+    
+    Uploads are not stored, so the image is referenced by its content hash. The
+    ranked candidates are packed into prediction_data by the writer.
+    """
+    top = outcome.results[0] if outcome.results else None
+    history_writer.record({
+        "request_id": request_id,
+        "api_user_id": user_info.get("user_id"),
+        "tier": user_info.get("tier"),
+        "image_path": f"sha256:{digest}",
+        "species_code": top.species_id if top else None,
+        "confidence_score": top.confidence if top else 0.0,
+        "predictions": [(r.species_id, r.confidence) for r in outcome.results],
+        "processing_time": round(processing_time, 4),
+        "model_version": outcome.model_version,
+        "status": "completed",
+        "created_at": datetime.utcnow()
+    })
+
+async def process_identification_job(job: dict) -> dict:
+    """Run a queued identification job; the job id doubles as the request id"""
+    start_time = time.time()
+    digest = content_hash(job["image_data"])
+    outcome = await run_identification(job["image_data"], job["tier"], digest=digest)
+    user_info = {"user_id": job["user_id"], "tier": job["tier"]}
+    response = build_identification_response(job["id"], start_time, outcome, user_info)
+    record_identification(job["id"], outcome, digest, user_info, response.processing_time)
+    return response.model_dump()
+
+# Persistent queue for ?async=true identifications, drained by a bounded worker pool
+job_queue = JobQueue(
+    process_identification_job,
+    workers=settings.JOB_WORKERS,
+    poll_seconds=settings.JOB_POLL_SECONDS,
+    stale_seconds=settings.JOB_STALE_SECONDS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_exceptions=(InferenceQueueFull, ModelNotAvailable)
+)
+
 @router.post("/", response_model=IdentificationResponse)
 async def identify_plant(
     request: Request,
-    file: UploadFile = File(..., description="Plant image file (JPEG, PNG, WebP)")
+    file: UploadFile = File(..., description="Plant image file (JPEG, PNG, WebP)"),
+    async_mode: bool = Query(False, alias="async", description="Queue the image and return a job id immediately"),
+    tta: bool = Query(False, description="Average predictions over flipped and cropped views (slower, more accurate)")
 ):
     """Identify plant species from uploaded image"""
     start_time = time.time()
@@ -143,45 +571,60 @@ async def identify_plant(
     if not is_valid:
         raise HTTPException(status_code=400, detail=validation_message)
     
+    # Get user info from request state (set by auth middleware)
+    user_info = getattr(request.state, 'user', {})
+    
+    if tta and user_info.get("tier") not in settings.tta_tiers_list:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Test-time augmentation is available on these tiers: {', '.join(settings.tta_tiers_list)}"
+        )
+    if tta and async_mode:
+        raise HTTPException(status_code=400, detail="Test-time augmentation is not available for async jobs")
+    
+    if async_mode:
+        image_data, _ = await read_image_upload(file)
+        job_id = await job_queue.enqueue(image_data, file.filename, user_info.get("user_id"), user_info.get("tier"))
+        logger.info(f"Queued identification request {request_id} as job {job_id}")
+        return JSONResponse(
+            status_code=202,
+            content={
+                "job_id": job_id,
+                "status": "pending",
+                "status_url": f"{settings.API_V1_STR}/identify/jobs/{job_id}"
+            }
+        )
+    
+    # Requests the queue could not serve in time were already shed by AdmissionMiddleware,
+    # before the body was received; the deadline still bounds the wait for a slot
+    deadline = request_deadline(request)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
-        # Process image
-        image_info = process_image(image_data)
-        
-        # Run ML prediction
-        results = ml_model.predict(image_data)
+        # Read image data, hashing it as it streams in
+        image_data, digest = await read_image_upload(file)
         
-        # Filter results by confidence threshold
-        filtered_results = [
-            result for result in results 
-            if result.confidence >= settings.CONFIDENCE_THRESHOLD
-        ]
+        # Decode and run ML prediction
+        outcome = await run_identification(image_data, user_info.get("tier"), deadline, digest, tta=tta)
         
-        processing_time = time.time() - start_time
-        
-        # Get user info from request state (set by auth middleware)
-        user_info = getattr(request.state, 'user', {})
-        
-        response = IdentificationResponse(
-            request_id=request_id,
-            timestamp=time.time(),
-            results=filtered_results,
-            processing_time=round(processing_time, 4),
-            image_info=image_info,
-            metadata={
-                "user_id": user_info.get("user_id"),
-                "tier": user_info.get("tier"),
-                "confidence_threshold": settings.CONFIDENCE_THRESHOLD,
-                "total_candidates": len(results),
-                "filtered_candidates": len(filtered_results)
-            }
-        )
+        response = build_identification_response(request_id, start_time, outcome, user_info)
+        record_identification(request_id, outcome, digest, user_info, response.processing_time)
         
-        logger.info(f"Identification completed for request {request_id} in {processing_time:.4f}s")
+        logger.info(f"Identification completed for request {request_id} in {response.processing_time:.4f}s")
         return response
         
+    except HTTPException:
+        raise
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
+    except InferenceQueueFull as e:
+        logger.warning(f"Rejected identification request {request_id}: {str(e)}")
+        raise busy_exception(e)
+    except ModelNotAvailable as e:
+        logger.error(f"Identification model unavailable for request {request_id}: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Identification model is not available"
+        )
     except Exception as e:
         logger.error(f"Error processing identification request {request_id}: {str(e)}")
         raise HTTPException(
@@ -189,15 +632,96 @@ async def identify_plant(
             detail=f"Error processing image: {str(e)}"
         )
 
+@router.post("/batch")
+async def identify_plant_batch(
+    request: Request,
+    files: List[UploadFile] = File(..., description="Plant image files (JPEG, PNG, WebP) or zip/tar archives of images")
+):
+    """Identify many plant images in one request, streaming NDJSON results as they complete"""
+    user_info = getattr(request.state, 'user', {})
+    if user_info.get("tier") not in BATCH_TIERS:
+        raise HTTPException(
+            status_code=403,
+            detail="Batch processing requires a Professional, Enterprise or Partner tier"
+        )
+    
+    request_id = str(uuid.uuid4())
+    logger.info(f"Processing batch identification request {request_id} with {len(files)} uploads")
+    
+    return StreamingResponse(
+        stream_batch_identification(files, request_id, user_info),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": request_id}
+    )
+
+@router.get("/jobs/{job_id}", response_model=IdentificationJobResponse)
+async def get_identification_job(
+    request: Request,
+    job_id: str,
+    wait: float = Query(0, ge=0, le=settings.JOB_MAX_WAIT_SECONDS, description="Seconds to long-poll for completion")
+):
+    """Get the status and result of an asynchronous identification job"""
+    job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    
+    user_info = getattr(request.state, 'user', {})
+    if job is None or job["user_id"] != user_info.get("user_id"):
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    
+    return IdentificationJobResponse(**job)
+
+def identification_statistics(since: Optional[datetime], limit: int) -> dict:
+    db = history_writer.session_factory()
+    try:
+        return {
+            "top_species": top_species_counts(db, since, limit),
+            "candidates": candidate_statistics(db, history_writer.codebook, since, limit)
+        }
+    finally:
+        db.close()
+
+@router.get("/stats")
+async def get_identification_statistics(
+    days: Optional[int] = Query(None, ge=1, le=365, description="Only count identifications from the last N days"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum species per list")
+):
+    """Most identified species and how often each appears among the ranked candidates
+    
+    Aggregated over the identification history: top species from the indexed
+    columns in SQL, candidates from the packed prediction_data decoded in chunks.
+    Records still buffered by the history writer are not counted yet.
+    """
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    statistics = await asyncio.to_thread(identification_statistics, since, limit)
+    return {
+        "since": since.isoformat() if since else None,
+        **statistics,
+        "timestamp": time.time()
+    }
+
 @router.get("/status")
 async def get_identification_status():
     """Get identification service status"""
     return {
         "service": "Plant Identification",
-        "status": "operational",
-        "model_version": "mock-v1.0",
+        "status": "degraded" if model_manager.state == "failed" else "operational",
+        "model_version": model_manager.version,
+        "model": model_manager.get_status(),
         "supported_formats": settings.ALLOWED_IMAGE_TYPES,
         "max_file_size_mb": settings.MAX_FILE_SIZE / (1024*1024),
         "confidence_threshold": settings.CONFIDENCE_THRESHOLD,
+        "roi_enabled": settings.ROI_ENABLED,
+        "inference": inference_executor.get_stats(),
+        "batching": batch_scheduler.get_stats(),
+        "tta": {
+            "views": settings.TTA_VIEWS,
+            "tiers": settings.tta_tiers_list,
+            **tta_scheduler.get_stats()
+        },
+        "cache": result_cache.get_stats() if result_cache is not None else {"enabled": False},
+        "near_duplicates": near_duplicate_index.get_stats() if near_duplicate_index is not None else {"enabled": False},
+        "single_flight": single_flight.get_stats() if single_flight is not None else {"enabled": False},
+        "jobs": job_queue.get_stats(),
+        "priority": tier_scheduler.get_stats(),
+        "history": history_writer.get_stats(),
         "timestamp": time.time()
     }
\ No newline at end of file
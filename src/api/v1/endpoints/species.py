@@ -1,8 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import time
 import logging
+from catalog.store import SpeciesStore
+from catalog.search import SearchIndex
+from catalog.fuzzy import TrigramIndex
+from catalog.suggest import SuggestIndex
 
 logger = logging.getLogger(__name__)
 
@@ -30,183 +34,185 @@ class SpeciesListResponse(BaseModel):
     page: int
     per_page: int
     total_pages: int
+    facets: Optional[Dict[str, Dict[str, int]]] = None
 
 class SpeciesSearchResponse(BaseModel):
     results: List[SpeciesInfo]
     query: str
     total_results: int
     search_time: float
+    facets: Optional[Dict[str, Dict[str, int]]] = None
 
-# Mock species database
-class MockSpeciesDatabase:
-    def __init__(self):
-        self.species_data = [
-            {
-                "species_id": "dendrobium_nobile",
-                "scientific_name": "Dendrobium nobile",
-                "common_name": "Noble Dendrobium",
-                "local_names": ["Anggrek Dendrobium", "Anggrek Mulia"],
-                "family": "Orchidaceae",
-                "genus": "Dendrobium",
-                "description": "Epiphytic orchid with pseudobulbs and fragrant flowers",
-                "habitat": "Tropical forests, epiphytic on trees",
-                "distribution": ["Sumatra", "Java", "Kalimantan", "Sulawesi"],
-                "conservation_status": "Least Concern",
-                "uses": ["Ornamental", "Traditional medicine"],
-                "characteristics": {
-                    "height": "30-60 cm",
-                    "flower_color": "White, pink, purple",
-                    "blooming_season": "Dry season",
-                    "growth_habit": "Epiphytic"
-                },
-                "images": ["dendrobium_nobile_1.jpg", "dendrobium_nobile_2.jpg"]
-            },
-            {
-                "species_id": "ficus_benjamina",
-                "scientific_name": "Ficus benjamina",
-                "common_name": "Weeping Fig",
-                "local_names": ["Beringin Kecil", "Pohon Karet Hias"],
-                "family": "Moraceae",
-                "genus": "Ficus",
-                "description": "Small to medium-sized tree with glossy leaves",
-                "habitat": "Tropical and subtropical regions",
-                "distribution": ["Java", "Sumatra", "Bali", "Nusa Tenggara"],
-                "conservation_status": "Least Concern",
-                "uses": ["Ornamental", "Indoor plant", "Bonsai"],
-                "characteristics": {
-                    "height": "2-10 m",
-                    "leaf_shape": "Oval, glossy",
-                    "growth_habit": "Tree/shrub",
-                    "light_requirement": "Bright indirect light"
-                },
-                "images": ["ficus_benjamina_1.jpg", "ficus_benjamina_2.jpg"]
-            },
-            {
-                "species_id": "hibiscus_rosa_sinensis",
-                "scientific_name": "Hibiscus rosa-sinensis",
-                "common_name": "Chinese Hibiscus",
-                "local_names": ["Kembang Sepatu", "Bunga Raya"],
-                "family": "Malvaceae",
-                "genus": "Hibiscus",
-                "description": "Flowering shrub with large, colorful flowers",
-                "habitat": "Tropical gardens and landscapes",
-                "distribution": ["Throughout Indonesia"],
-                "conservation_status": "Least Concern",
-                "uses": ["Ornamental", "Traditional medicine", "Hair care"],
-                "characteristics": {
-                    "height": "1-4 m",
-                    "flower_color": "Red, pink, yellow, white, orange",
-                    "flower_size": "8-15 cm diameter",
-                    "blooming_season": "Year-round"
-                },
-                "images": ["hibiscus_rosa_sinensis_1.jpg", "hibiscus_rosa_sinensis_2.jpg"]
-            },
-            {
-                "species_id": "plumeria_rubra",
-                "scientific_name": "Plumeria rubra",
-                "common_name": "Frangipani",
-                "local_names": ["Kamboja", "Bunga Kamboja"],
-                "family": "Apocynaceae",
-                "genus": "Plumeria",
-                "description": "Deciduous tree with fragrant, waxy flowers",
-                "habitat": "Tropical and subtropical regions",
-                "distribution": ["Java", "Bali", "Sumatra", "Sulawesi"],
-                "conservation_status": "Least Concern",
-                "uses": ["Ornamental", "Religious ceremonies", "Perfume"],
-                "characteristics": {
-                    "height": "3-8 m",
-                    "flower_color": "White, yellow, pink, red",
-                    "fragrance": "Strong, sweet",
-                    "leaf_type": "Deciduous"
-                },
-                "images": ["plumeria_rubra_1.jpg", "plumeria_rubra_2.jpg"]
-            },
-            {
-                "species_id": "bougainvillea_spectabilis",
-                "scientific_name": "Bougainvillea spectabilis",
-                "common_name": "Great Bougainvillea",
-                "local_names": ["Bunga Kertas", "Bugenvil"],
-                "family": "Nyctaginaceae",
-                "genus": "Bougainvillea",
-                "description": "Thorny ornamental vine with colorful bracts",
-                "habitat": "Tropical and subtropical gardens",
-                "distribution": ["Throughout Indonesia"],
-                "conservation_status": "Least Concern",
-                "uses": ["Ornamental", "Hedge plant", "Traditional medicine"],
-                "characteristics": {
-                    "height": "1-12 m (climbing)",
-                    "bract_color": "Purple, pink, red, orange, white",
-                    "growth_habit": "Climbing vine",
-                    "thorns": "Present"
-                },
-                "images": ["bougainvillea_spectabilis_1.jpg", "bougainvillea_spectabilis_2.jpg"]
-            }
-        ]
-    
-    def get_species_by_id(self, species_id: str) -> Optional[dict]:
-        """Get species by ID"""
-        for species in self.species_data:
-            if species["species_id"] == species_id:
-                return species
-        return None
-    
-    def search_species(self, query: str, limit: int = 10) -> List[dict]:
-        """Search species by name or characteristics"""
-        query_lower = query.lower()
-        results = []
-        
-        for species in self.species_data:
-            # Search in scientific name, common name, and local names
-            if (query_lower in species["scientific_name"].lower() or
-                query_lower in species["common_name"].lower() or
-                any(query_lower in name.lower() for name in species["local_names"]) or
-                query_lower in species["family"].lower() or
-                query_lower in species["genus"].lower()):
-                results.append(species)
-        
-        return results[:limit]
-    
-    def get_species_list(self, page: int = 1, per_page: int = 10, family: str = None) -> tuple[List[dict], int]:
-        """Get paginated species list with optional family filter"""
-        filtered_data = self.species_data
-        
-        if family:
-            filtered_data = [s for s in self.species_data if s["family"].lower() == family.lower()]
-        
-        total = len(filtered_data)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        
-        return filtered_data[start_idx:end_idx], total
+class SpeciesSuggestion(BaseModel):
+    species_id: str
+    name: str
+
+class SpeciesSuggestResponse(BaseModel):
+    prefix: str
+    suggestions: List[SpeciesSuggestion]
+
+# Sample catalogue served when SPECIES_CATALOG_PATH is not set
+MOCK_SPECIES_DATA = [
+    {
+        "species_id": "dendrobium_nobile",
+        "scientific_name": "Dendrobium nobile",
+        "common_name": "Noble Dendrobium",
+        "local_names": ["Anggrek Dendrobium", "Anggrek Mulia"],
+        "family": "Orchidaceae",
+        "genus": "Dendrobium",
+        "description": "Epiphytic orchid with pseudobulbs and fragrant flowers",
+        "habitat": "Tropical forests, epiphytic on trees",
+        "distribution": ["Sumatra", "Java", "Kalimantan", "Sulawesi"],
+        "conservation_status": "Least Concern",
+        "uses": ["Ornamental", "Traditional medicine"],
+        "characteristics": {
+            "height": "30-60 cm",
+            "flower_color": "White, pink, purple",
+            "blooming_season": "Dry season",
+            "growth_habit": "Epiphytic"
+        },
+        "images": ["dendrobium_nobile_1.jpg", "dendrobium_nobile_2.jpg"]
+    },
+    {
+        "species_id": "ficus_benjamina",
+        "scientific_name": "Ficus benjamina",
+        "common_name": "Weeping Fig",
+        "local_names": ["Beringin Kecil", "Pohon Karet Hias"],
+        "family": "Moraceae",
+        "genus": "Ficus",
+        "description": "Small to medium-sized tree with glossy leaves",
+        "habitat": "Tropical and subtropical regions",
+        "distribution": ["Java", "Sumatra", "Bali", "Nusa Tenggara"],
+        "conservation_status": "Least Concern",
+        "uses": ["Ornamental", "Indoor plant", "Bonsai"],
+        "characteristics": {
+            "height": "2-10 m",
+            "leaf_shape": "Oval, glossy",
+            "growth_habit": "Tree/shrub",
+            "light_requirement": "Bright indirect light"
+        },
+        "images": ["ficus_benjamina_1.jpg", "ficus_benjamina_2.jpg"]
+    },
+    {
+        "species_id": "hibiscus_rosa_sinensis",
+        "scientific_name": "Hibiscus rosa-sinensis",
+        "common_name": "Chinese Hibiscus",
+        "local_names": ["Kembang Sepatu", "Bunga Raya"],
+        "family": "Malvaceae",
+        "genus": "Hibiscus",
+        "description": "Flowering shrub with large, colorful flowers",
+        "habitat": "Tropical gardens and landscapes",
+        "distribution": ["Throughout Indonesia"],
+        "conservation_status": "Least Concern",
+        "uses": ["Ornamental", "Traditional medicine", "Hair care"],
+        "characteristics": {
+            "height": "1-4 m",
+            "flower_color": "Red, pink, yellow, white, orange",
+            "flower_size": "8-15 cm diameter",
+            "blooming_season": "Year-round"
+        },
+        "images": ["hibiscus_rosa_sinensis_1.jpg", "hibiscus_rosa_sinensis_2.jpg"]
+    },
+    {
+        "species_id": "plumeria_rubra",
+        "scientific_name": "Plumeria rubra",
+        "common_name": "Frangipani",
+        "local_names": ["Kamboja", "Bunga Kamboja"],
+        "family": "Apocynaceae",
+        "genus": "Plumeria",
+        "description": "Deciduous tree with fragrant, waxy flowers",
+        "habitat": "Tropical and subtropical regions",
+        "distribution": ["Java", "Bali", "Sumatra", "Sulawesi"],
+        "conservation_status": "Least Concern",
+        "uses": ["Ornamental", "Religious ceremonies", "Perfume"],
+        "characteristics": {
+            "height": "3-8 m",
+            "flower_color": "White, yellow, pink, red",
+            "fragrance": "Strong, sweet",
+            "leaf_type": "Deciduous"
+        },
+        "images": ["plumeria_rubra_1.jpg", "plumeria_rubra_2.jpg"]
+    },
+    {
+        "species_id": "bougainvillea_spectabilis",
+        "scientific_name": "Bougainvillea spectabilis",
+        "common_name": "Great Bougainvillea",
+        "local_names": ["Bunga Kertas", "Bugenvil"],
+        "family": "Nyctaginaceae",
+        "genus": "Bougainvillea",
+        "description": "Thorny ornamental vine with colorful bracts",
+        "habitat": "Tropical and subtropical gardens",
+        "distribution": ["Throughout Indonesia"],
+        "conservation_status": "Least Concern",
+        "uses": ["Ornamental", "Hedge plant", "Traditional medicine"],
+        "characteristics": {
+            "height": "1-12 m (climbing)",
+            "bract_color": "Purple, pink, red, orange, white",
+            "growth_habit": "Climbing vine",
+            "thorns": "Present"
+        },
+        "images": ["bougainvillea_spectabilis_1.jpg", "bougainvillea_spectabilis_2.jpg"]
+    }
+]
+
+# Indexed species store: O(1) lookups by id and O(page) listings by family or genus
+species_db = SpeciesStore.from_settings(MOCK_SPECIES_DATA)
+
+# Ranked full-text search over names, family and genus, kept in sync with the store
+search_index = SearchIndex(fuzzy=TrigramIndex())
+species_db.subscribe(search_index)
+
+# Name completions for the search box, also kept in sync with the store
+suggest_index = SuggestIndex()
+species_db.subscribe(suggest_index)
+
+# Facet names exposed by the API and the indexed store fields they count
+FACET_FIELDS = {
+    "family": "family",
+    "genus": "genus",
+    "conservation_status": "conservation_status",
+    "island": "distribution"
+}
 
-# Initialize mock database
-species_db = MockSpeciesDatabase()
+def get_facets(species_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """Species counts per facet value over the given species, or the whole catalogue"""
+    facets = species_db.facets(species_ids, FACET_FIELDS.values())
+    return {name: facets[field] for name, field in FACET_FIELDS.items()}
 
 @router.get("/stats")
 async def get_database_stats():
     """Get database statistics"""
-    total_species = len(species_db.species_data)
-    families = set(species["family"] for species in species_db.species_data)
-    genera = set(species["genus"] for species in species_db.species_data)
-    
-    conservation_status = {}
-    for species in species_db.species_data:
-        status = species["conservation_status"]
-        conservation_status[status] = conservation_status.get(status, 0) + 1
-    
     return {
-        "total_species": total_species,
-        "total_families": len(families),
-        "total_genera": len(genera),
-        "conservation_status_distribution": conservation_status,
+        "total_species": len(species_db),
+        "total_families": len(species_db.counts("family")),
+        "total_genera": len(species_db.counts("genus")),
+        "conservation_status_distribution": species_db.counts("conservation_status"),
+        "island_distribution": species_db.counts("distribution"),
         "database_version": "mock-v1.0",
         "last_updated": time.time()
     }
 
+@router.get("/suggest", response_model=SpeciesSuggestResponse)
+async def suggest_species(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Typed prefix of a name"),
+    limit: int = Query(8, ge=1, le=20, description="Maximum suggestions")
+):
+    """Complete a typed prefix to species names for autocomplete
+    
+    Matches the start of any word of a scientific, common or local name and
+    returns only ids and the matched names, one per species, so it can be
+    called on every keystroke.
+    """
+    suggestions = suggest_index.suggest(prefix, limit)
+    return SpeciesSuggestResponse(
+        prefix=prefix,
+        suggestions=[SpeciesSuggestion(species_id=species_id, name=name) for species_id, name in suggestions]
+    )
+
 @router.get("/{species_id}", response_model=SpeciesInfo)
 async def get_species(species_id: str):
     """Get detailed information about a specific species"""
-    species_data = species_db.get_species_by_id(species_id)
+    species_data = species_db.get(species_id)
     
     if not species_data:
         raise HTTPException(
@@ -220,56 +226,84 @@ async def get_species(species_id: str):
 async def list_species(
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(10, ge=1, le=100, description="Items per page"),
-    family: Optional[str] = Query(None, description="Filter by plant family")
+    family: Optional[str] = Query(None, description="Filter by plant family"),
+    genus: Optional[str] = Query(None, description="Filter by genus"),
+    conservation_status: Optional[str] = Query(None, description="Filter by conservation status"),
+    island: Optional[str] = Query(None, description="Filter by island in the species distribution"),
+    facets: bool = Query(False, description="Include species counts per facet value for the filtered list")
 ):
     """Get paginated list of species"""
-    species_list, total = species_db.get_species_list(page, per_page, family)
+    species_ids = species_db.filter_ids(
+        family=family, genus=genus, conservation_status=conservation_status, distribution=island
+    )
+    offset = (page - 1) * per_page
+    total = len(species_ids)
     total_pages = (total + per_page - 1) // per_page
     
-    species_objects = [SpeciesInfo(**species) for species in species_list]
+    species_objects = [SpeciesInfo(**species_db.get(species_id)) for species_id in species_ids[offset:offset + per_page]]
+    filtered = family or genus or conservation_status or island
     
     return SpeciesListResponse(
         species=species_objects,
         total=total,
         page=page,
         per_page=per_page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        facets=get_facets(species_ids if filtered else None) if facets else None
     )
 
 @router.get("/search/", response_model=SpeciesSearchResponse)
 async def search_species(
     q: str = Query(..., min_length=2, description="Search query"),
-    limit: int = Query(10, ge=1, le=50, description="Maximum results")
+    limit: int = Query(10, ge=1, le=50, description="Maximum results"),
+    family: Optional[str] = Query(None, description="Filter by plant family"),
+    genus: Optional[str] = Query(None, description="Filter by genus"),
+    conservation_status: Optional[str] = Query(None, description="Filter by conservation status"),
+    island: Optional[str] = Query(None, description="Filter by island in the species distribution"),
+    facets: bool = Query(False, description="Include species counts per facet value over all matches")
 ):
-    """Search species by name or characteristics"""
-    start_time = time.time()
+    """Search species by scientific, common and local names, family and genus
     
-    results = species_db.search_species(q, limit)
-    search_time = time.time() - start_time
+    Every query word must match; the last may be a partial word, and words
+    of four letters or more tolerate one or two typos. Results are ranked by
+    field-weighted BM25 and total_results counts all matches. Filters come
+    from the store's indexes, and facets count only the matching species.
+    """
+    start_time = time.perf_counter()
     
-    species_objects = [SpeciesInfo(**species) for species in results]
+    within = None
+    if family or genus or conservation_status or island:
+        within = species_db.filter_ids(
+            family=family, genus=genus, conservation_status=conservation_status, distribution=island
+        )
+    facet_counts = None
+    if facets:
+        # One matching pass serves both the ranked page and the facet counts
+        species_ids, total, matched_ids = search_index.search_with_matches(q, limit, within=within)
+        facet_counts = get_facets(matched_ids)
+    else:
+        species_ids, total = search_index.search(q, limit, within=within)
+    search_time = time.perf_counter() - start_time
+    
+    species_objects = [SpeciesInfo(**species_db.get(species_id)) for species_id in species_ids]
     
     return SpeciesSearchResponse(
         results=species_objects,
         query=q,
-        total_results=len(results),
-        search_time=round(search_time, 4)
+        total_results=total,
+        search_time=round(search_time, 6),
+        facets=facet_counts
     )
 
 @router.get("/families/list")
 async def list_families():
     """Get list of all plant families in the database"""
-    families = list(set(species["family"] for species in species_db.species_data))
-    families.sort()
-    
-    family_counts = {}
-    for family in families:
-        count = len([s for s in species_db.species_data if s["family"] == family])
-        family_counts[family] = count
+    family_counts = species_db.counts("family")
+    families = sorted(family_counts)
     
     return {
         "families": families,
-        "family_counts": family_counts,
+        "family_counts": {family: family_counts[family] for family in families},
         "total_families": len(families),
-        "total_species": len(species_db.species_data)
+        "total_species": len(species_db)
     }
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Benchmark the IVF-PQ observation index against brute-force cosine search.
+
+Builds an index over synthetic clustered embeddings (the shape real image
+embeddings take), saves and memory-maps it, then reports recall@k against exact
+search and per-query latency for several nprobe values.
+
+Usage (from src/):
+    python -m benchmarks.bench_ann [--vectors 1000000] [--dim 64] [--queries 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from ml.ann import IVFPQIndex, build_index
+
+def make_embeddings(count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random cluster centres, generated in blocks"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        stop = min(start + 100000, count)
+        block = centres[rng.integers(0, clusters, stop - start)] + rng.normal(scale=0.6, size=(stop - start, dim))
+        vectors[start:stop] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+def brute_force(vectors: np.ndarray, queries: np.ndarray, k: int):
+    """Exact top-k per query, timed one query at a time like the identify path"""
+    top, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = vectors @ query
+        top.append(np.argpartition(-scores, k - 1)[:k])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return np.array(top), latencies[len(latencies) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--m", type=int, default=16)
+    args = parser.parse_args()
+    
+    vectors = make_embeddings(args.vectors, args.dim, clusters=args.vectors // 500)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.vectors, args.queries, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(f"Dataset: {args.vectors} x {args.dim} float32 ({vectors.nbytes / (1024 * 1024):.0f}MB), {args.queries} queries, k={args.k}")
+    
+    truth, brute_latency = brute_force(vectors, queries, args.k)
+    truth_sets = [set(row) for row in truth]
+    print(f"Brute force (float32 in RAM): {brute_latency * 1000:.1f} ms/query p50")
+    
+    start = time.perf_counter()
+    index = build_index(vectors, np.arange(args.vectors), nlist=args.nlist, m=args.m)
+    print(f"Build: {time.perf_counter() - start:.1f}s (nlist={args.nlist}, m={args.m})")
+    
+    with tempfile.TemporaryDirectory() as path:
+        index.save(path)
+        del index
+        
+        print()
+        print(f"{'nprobe':>8}{'rerank':>8}{'recall@k':>10}{'ms/query p50':>14}{'ms/query p95':>14}{'speedup':>9}")
+        for rerank in (0, 4):
+            index = IVFPQIndex.load(path)
+            if not rerank:
+                index.vectors = None
+            index.rerank = max(rerank, 1)
+            for nprobe in (4, 8, 16, 32):
+                latencies = []
+                found = []
+                for query in queries:
+                    query_start = time.perf_counter()
+                    ids, _ = index.search(query[None, :], args.k, nprobe=nprobe)
+                    latencies.append(time.perf_counter() - query_start)
+                    found.append(ids[0])
+                recall = np.mean([len(truth_set & set(row)) / args.k for truth_set, row in zip(truth_sets, found)])
+                latencies.sort()
+                p50 = latencies[len(latencies) // 2]
+                p95 = latencies[int(len(latencies) * 0.95)]
+                print(f"{nprobe:>8}{rerank:>8}{recall:>10.3f}{p50 * 1000:>14.2f}{p95 * 1000:>14.2f}{brute_latency / p50:>8.1f}x")
+        
+        code_mb = os.path.getsize(os.path.join(path, "codes.npy")) / (1024 * 1024)
+        vector_mb = os.path.getsize(os.path.join(path, "vectors.npy")) / (1024 * 1024)
+        print()
+        print(f"Index size: {code_mb:.0f}MB PQ codes, {vector_mb:.0f}MB float16 vectors for re-ranking")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Benchmark the identify decode stage on large camera photos.
+
+Compares the previous approach (full decode, then resize to model input) with
+ml.decode.decode_for_model, which reduces JPEGs at decode time via draft mode,
+and with the ml.roi region-of-interest path (draft, saliency, cropped decode).
+Each run happens in a fresh process so peak RSS reflects a single decode.
+
+Usage (from src/):
+    python -m benchmarks.bench_decode [--width 4000] [--height 3000] [--runs 5]
+"""
+
+import argparse
+import io
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from config import settings
+from ml.decode import decode_for_model, read_image_info, scaled_size
+from ml.roi import decode_roi_for_model
+
+def make_camera_photo(width: int, height: int) -> bytes:
+    """Build a noisy, high-quality JPEG that compresses like a real camera photo"""
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    photo = Image.blend(noise, gradient, 0.5)
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+def full_decode(image_data: bytes) -> Image.Image:
+    """Previous path: open and fully decode, then resize to the model input size"""
+    image = Image.open(io.BytesIO(image_data))
+    image.load()
+    image = image.convert("RGB")
+    return image.resize(scaled_size(image.width, image.height, settings.MODEL_INPUT_SIZE), Image.Resampling.BILINEAR)
+
+def draft_decode(image_data: bytes) -> Image.Image:
+    """New path: header-only validation plus reduced decode"""
+    read_image_info(image_data)
+    return decode_for_model(image_data)
+
+def roi_decode(image_data: bytes) -> Image.Image:
+    """ROI path: draft for saliency, then decode only as finely as the region needs"""
+    read_image_info(image_data)
+    return decode_roi_for_model(image_data)[0]
+
+def measure(name: str, image_data: bytes, runs: int) -> dict:
+    decode = {"full": full_decode, "draft": draft_decode, "roi": roi_decode}[name]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    cpu_times = []
+    for _ in range(runs):
+        start = time.process_time()
+        image = decode(image_data)
+        cpu_times.append(time.process_time() - start)
+    
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "name": name,
+        "output_size": image.size,
+        "cpu_ms": sorted(cpu_times)[len(cpu_times) // 2] * 1000,
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_delta_mb": (rss_after - rss_before) / 1024
+    }
+
+def run_isolated(name: str, image_data: bytes, runs: int) -> dict:
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(measure, name, image_data, runs).result()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    
+    image_data = make_camera_photo(args.width, args.height)
+    print(f"Test photo: {args.width}x{args.height} JPEG, {len(image_data) / (1024 * 1024):.1f}MB")
+    print(f"Model input size: {settings.MODEL_INPUT_SIZE}px")
+    print()
+    
+    results = [run_isolated(name, image_data, args.runs) for name in ("full", "draft", "roi")]
+    print(f"{'path':<8}{'output':>14}{'cpu ms (p50)':>16}{'peak RSS +MB':>16}")
+    for result in results:
+        width, height = result["output_size"]
+        print(f"{result['name']:<8}{f'{width}x{height}':>14}{result['cpu_ms']:>16.1f}{result['peak_rss_delta_mb']:>16.1f}")
+    
+    full, draft = results[:2]
+    print()
+    print(f"CPU speedup: {full['cpu_ms'] / draft['cpu_ms']:.1f}x")
+    if draft["peak_rss_delta_mb"] > 0:
+        print(f"Peak memory reduction: {full['peak_rss_delta_mb'] / draft['peak_rss_delta_mb']:.1f}x")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
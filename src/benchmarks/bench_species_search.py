@@ -0,0 +1,128 @@
+"""
+Benchmark /species/search/ on a synthetic catalogue of Indonesian flora.
+
+Generates Latin binomials, English common names and Indonesian local names
+from syllable and word pools, builds the species store with its inverted
+index, and compares ranked index search with the previous substring scan for
+single-word, multi-word, partial-word, old-spelling and misspelled queries.
+Also times /species/suggest prefix completion for 1 to 5 typed characters.
+
+Usage (from src/):
+    python -m benchmarks.bench_species_search [--species 100000] [--queries 500]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog.store import SpeciesStore
+from catalog.search import SearchIndex
+from catalog.fuzzy import TrigramIndex
+from catalog.suggest import SuggestIndex
+
+SYLLABLES = ["ar", "bo", "ca", "den", "dro", "fi", "gan", "hi", "lan", "ma", "ne", "pal", "ri", "sa", "to", "tri", "zin", "phy", "lo", "cus"]
+EPITHETS = ["nobile", "benjamina", "rubra", "alba", "indica", "javanica", "sumatrana", "celebica", "montana", "sinensis", "elegans", "minor"]
+COMMON_WORDS = ["Noble", "Weeping", "Red", "White", "Giant", "Dwarf", "Mountain", "Forest", "Swamp", "Orchid", "Fig", "Palm", "Fern", "Tree"]
+LOCAL_WORDS = ["Anggrek", "Bunga", "Kembang", "Pohon", "Beringin", "Kamboja", "Melati", "Pakis", "Rotan", "Bambu", "Merah", "Putih", "Hutan", "Gunung", "Sepatu", "Kertas"]
+FAMILIES = [f"{random.Random(i).choice(SYLLABLES).capitalize()}{random.Random(i + 1).choice(SYLLABLES)}aceae" for i in range(400)]
+
+def make_catalogue(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    genera = sorted({"".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize() for _ in range(count // 10)})
+    species = []
+    for i in range(count):
+        genus = rng.choice(genera)
+        epithet = f"{rng.choice(EPITHETS)}{i}" if i % 3 else rng.choice(EPITHETS)
+        species.append({
+            "species_id": f"sp{i}",
+            "scientific_name": f"{genus} {epithet} {i}",
+            "common_name": " ".join(rng.sample(COMMON_WORDS, 2)),
+            "local_names": [" ".join(rng.sample(LOCAL_WORDS, 2)) for _ in range(rng.randint(1, 3))],
+            "family": rng.choice(FAMILIES),
+            "genus": genus,
+            "conservation_status": rng.choice(["Least Concern", "Vulnerable", "Endangered"])
+        })
+    return species, genera
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Swap two adjacent letters or drop one, as a hurried typist would"""
+    i = rng.randrange(1, len(word) - 1)
+    if rng.random() < 0.5:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + word[i + 1:]
+
+def substring_scan(store: SpeciesStore, query: str, limit: int = 10):
+    """Previous /search/ implementation: substring match over every species"""
+    query_lower = query.lower()
+    results = []
+    for species in store:
+        if (query_lower in species["scientific_name"].lower() or
+            query_lower in species["common_name"].lower() or
+            any(query_lower in name.lower() for name in species["local_names"]) or
+            query_lower in species["family"].lower() or
+            query_lower in species["genus"].lower()):
+            results.append(species)
+    return results[:limit]
+
+def time_queries(search, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return statistics.median(latencies) * 1e6, latencies[int(0.99 * (len(latencies) - 1))] * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    
+    species, genera = make_catalogue(args.species)
+    start = time.perf_counter()
+    store = SpeciesStore(species)
+    index = SearchIndex(fuzzy=TrigramIndex())
+    store.subscribe(index)
+    suggest_index = SuggestIndex()
+    store.subscribe(suggest_index)
+    print(f"Catalogue: {len(store)} species, store + index built in {time.perf_counter() - start:.2f}s")
+    
+    rng = random.Random(1)
+    workloads = {
+        "genus": [rng.choice(genera) for _ in range(args.queries)],
+        "local 2-word": [" ".join(rng.sample(LOCAL_WORDS, 2)) for _ in range(args.queries)],
+        "genus+epithet": [f"{rng.choice(genera)} {rng.choice(EPITHETS)}" for _ in range(args.queries)],
+        "partial word": [rng.choice(genera)[:5] for _ in range(args.queries)],
+        "old spelling": [rng.choice(["Boenga Poetih", "Kembang Sepatoe", "Anggrek Oetan"]) for _ in range(args.queries)],
+        "typo": [f"{misspell(rng.choice(LOCAL_WORDS), rng)} {rng.choice(LOCAL_WORDS)}" for _ in range(args.queries)]
+    }
+    
+    # Warm the per-term arrays as steady-state traffic would
+    for queries in workloads.values():
+        for query in queries:
+            index.search(query)
+    
+    print(f"{'workload':<16}{'index p50 us':>14}{'index p99 us':>14}{'scan p50 us':>14}")
+    for name, queries in workloads.items():
+        index_p50, index_p99 = time_queries(index.search, queries)
+        scan_p50, _ = time_queries(lambda q: substring_scan(store, q), queries[:10])
+        print(f"{name:<16}{index_p50:>14.1f}{index_p99:>14.1f}{scan_p50:>14.0f}")
+    
+    # The first lookup merges every name into the sorted arrays
+    start = time.perf_counter()
+    suggest_index.suggest("a")
+    print(f"\nSuggest index merged in {time.perf_counter() - start:.2f}s")
+    print(f"{'typed chars':<16}{'suggest p50 us':>16}{'suggest p99 us':>16}")
+    for length in (1, 2, 3, 5):
+        prefixes = [rng.choice(genera + LOCAL_WORDS)[:length] for _ in range(args.queries)]
+        p50, p99 = time_queries(suggest_index.suggest, prefixes)
+        print(f"{length:<16}{p50:>16.1f}{p99:>16.1f}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
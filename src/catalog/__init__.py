@@ -0,0 +1 @@
+# Species catalogue package
\ No newline at end of file
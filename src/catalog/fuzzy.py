@@ -0,0 +1,158 @@
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Words shorter than this are not corrected; one edit already changes most of them
+MIN_FUZZY_LENGTH = 4
+# Candidates passing the trigram filter that are verified with edit distance, best overlap first
+MAX_VERIFIED_CANDIDATES = 200
+
+def trigrams(word: str) -> Set[str]:
+    """Character trigrams of a word padded with two '$' on each side"""
+    padded = f"$${word}$$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_edits(word: str) -> int:
+    """Typos tolerated for a word of this length"""
+    if len(word) < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(word) < 6 else 2
+
+def bounded_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Edit distance counting adjacent transpositions as one edit, or None above limit
+    
+    Only the diagonal band of width 2 * limit + 1 is filled and a row whose
+    minimum already exceeds the limit stops the computation, so each check costs
+    O(len * limit) rather than O(len^2).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if a == b:
+        return 0
+    
+    big = limit + 1
+    previous2: Optional[List[int]] = None
+    previous = [j if j <= limit else big for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [big] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = min(value, big)
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return None
+        previous2, previous = previous, current
+    return previous[len(b)] if previous[len(b)] <= limit else None
+
+class TrigramIndex:
+    """Trigram index over a term vocabulary for typo-tolerant lookups
+    
+    Candidate terms are those sharing enough trigrams with the query word to be
+    within the edit bound: by the q-gram lemma, k edits remove at most 3k of
+    either word's distinct padded trigrams, or 4k when the edits are adjacent
+    transpositions, which bounded_distance counts as one edit. Overlaps are counted with numpy over
+    per-trigram term id arrays, and only the surviving candidates, capped at
+    MAX_VERIFIED_CANDIDATES, are checked with the banded edit distance.
+    """
+    
+    def __init__(self):
+        self._term_ids: Dict[str, int] = {}
+        self._terms: List[Optional[str]] = []
+        self._free_ids: List[int] = []
+        # term id -> length and number of distinct trigrams
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._gram_counts = np.zeros(0, dtype=np.int32)
+        self._postings: Dict[str, Set[int]] = {}
+        # trigram -> sorted term ids, built lazily
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._term_ids)
+    
+    def add_term(self, term: str):
+        with self._lock:
+            if term in self._term_ids:
+                return
+            if self._free_ids:
+                term_id = self._free_ids.pop()
+                self._terms[term_id] = term
+            else:
+                term_id = len(self._terms)
+                self._terms.append(term)
+                if term_id >= len(self._lengths):
+                    grow = np.zeros(max(1024, len(self._lengths)), dtype=np.int32)
+                    self._lengths = np.concatenate([self._lengths, grow])
+                    self._gram_counts = np.concatenate([self._gram_counts, grow])
+            grams = trigrams(term)
+            self._term_ids[term] = term_id
+            self._lengths[term_id] = len(term)
+            self._gram_counts[term_id] = len(grams)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(term_id)
+                self._arrays.pop(gram, None)
+    
+    def remove_term(self, term: str):
+        with self._lock:
+            term_id = self._term_ids.pop(term, None)
+            if term_id is None:
+                return
+            self._terms[term_id] = None
+            self._free_ids.append(term_id)
+            for gram in trigrams(term):
+                ids = self._postings[gram]
+                ids.discard(term_id)
+                if not ids:
+                    del self._postings[gram]
+                self._arrays.pop(gram, None)
+    
+    def _gram_array(self, gram: str) -> np.ndarray:
+        array = self._arrays.get(gram)
+        if array is None:
+            with self._lock:
+                array = np.array(sorted(self._postings.get(gram, ())), dtype=np.int64)
+                self._arrays[gram] = array
+        return array
+    
+    def correct(self, word: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Vocabulary terms within the edit bound of word, closest first"""
+        limit = max_edits(word) if limit is None else limit
+        if limit <= 0:
+            return []
+        
+        grams = trigrams(word)
+        arrays = [self._gram_array(gram) for gram in grams if gram in self._postings]
+        if not arrays:
+            return []
+        ids, overlap = np.unique(np.concatenate(arrays), return_counts=True)
+        
+        # q-gram lemma: each edit removes at most 3 distinct trigrams from either side,
+        # a transposition of adjacent letters up to 4
+        lengths = self._lengths[ids]
+        required = np.maximum(len(grams), self._gram_counts[ids]) - 4 * limit
+        keep = (overlap >= required) & (np.abs(lengths - len(word)) <= limit)
+        ids, overlap = ids[keep], overlap[keep]
+        if len(ids) > MAX_VERIFIED_CANDIDATES:
+            best = np.argpartition(-overlap, MAX_VERIFIED_CANDIDATES - 1)[:MAX_VERIFIED_CANDIDATES]
+            ids = ids[best]
+        
+        matches = []
+        for term_id in ids:
+            term = self._terms[term_id]
+            if term is None:
+                continue
+            distance = bounded_distance(word, term, limit)
+            if distance is not None:
+                matches.append((term, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
\ No newline at end of file
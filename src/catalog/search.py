@@ -0,0 +1,304 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from typing import Any, Collection, Dict, List, Optional, Tuple
+import numpy as np
+from catalog.fuzzy import TrigramIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Field boosts for BM25F: a hit in the Latin name says more than one in the family
+FIELD_WEIGHTS = {
+    "scientific_name": 3.0,
+    "common_name": 2.0,
+    "local_names": 2.0,
+    "genus": 1.5,
+    "family": 1.0
+}
+
+# Pre-1972 Indonesian spellings (Van Ophuijsen / Soewandi) and their modern forms,
+# so "Boenga Tjempaka" finds "Bunga Cempaka"
+OLD_SPELLINGS = (("tj", "c"), ("dj", "j"), ("nj", "ny"), ("sj", "sy"), ("oe", "u"), ("ch", "kh"))
+
+# Most vocabulary terms a trailing partial word expands to
+MAX_PREFIX_EXPANSIONS = 64
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+COMPOUND_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)+")
+
+def normalize_text(text: str) -> str:
+    """Fold case, diacritics, ligatures and old Indonesian spellings
+    
+    The same folding is applied to indexed text and queries, so rewriting a
+    Latin "ch" or "oe" never stops a name from matching itself.
+    """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = text.replace("æ", "ae").replace("œ", "oe")
+    for old, new in OLD_SPELLINGS:
+        text = text.replace(old, new)
+    return text
+
+def tokenize(text: str) -> List[str]:
+    """Split folded text into terms; hyphenated words also yield their joined form
+    
+    "rosa-sinensis" gives rosa, sinensis and rosasinensis, and Indonesian
+    reduplications such as "kupu-kupu" give kupu twice and kupukupu.
+    """
+    text = normalize_text(text)
+    tokens = TOKEN_PATTERN.findall(text)
+    tokens.extend(match.replace("-", "") for match in COMPOUND_PATTERN.findall(text))
+    return tokens
+
+def field_text(species: Dict[str, Any], field: str) -> str:
+    value = species.get(field)
+    if value is None:
+        return ""
+    return " ".join(value) if isinstance(value, (list, tuple)) else str(value)
+
+class SearchIndex:
+    """Inverted index over species names with field-weighted BM25 (BM25F) ranking
+    
+    Postings map each term to the species containing it with per-field term
+    frequencies. Queries are AND over their terms: posting lists are intersected
+    starting from the shortest, so only species matching every term are scored.
+    The last query term also matches as a prefix when it is not a full term.
+    With a fuzzy TrigramIndex, a query term found neither way is replaced by the
+    vocabulary terms within a few typos of it, each scored down by its distance.
+    Per-term sorted doc id and weight arrays are built on first use and
+    invalidated when the term's postings change, or for every term when average
+    field lengths drift from those the weights were computed with.
+    """
+    
+    def __init__(
+        self,
+        field_weights: Dict[str, float] = FIELD_WEIGHTS,
+        k1: float = 1.2,
+        b: float = 0.75,
+        fuzzy: Optional[TrigramIndex] = None
+    ):
+        self.fields = tuple(field_weights)
+        self.boosts = np.array([field_weights[f] for f in self.fields], dtype=np.float32)
+        self.k1 = k1
+        self.b = b
+        self.fuzzy = fuzzy
+        
+        self._doc_ids: Dict[str, int] = {}
+        self._species_ids: List[Optional[str]] = []
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_lengths: Dict[int, Tuple[int, ...]] = {}
+        self._length_totals = [0] * len(self.fields)
+        # term -> doc -> term frequency per field
+        self._postings: Dict[str, Dict[int, Tuple[int, ...]]] = {}
+        # Sorted terms for prefix lookups; new terms wait in _new_terms until the next prefix query,
+        # and removed terms stay until then too, filtered out by the postings check
+        self._vocabulary: List[str] = []
+        self._new_terms: List[str] = []
+        # term -> (sorted doc ids, BM25F pseudo-frequencies), built lazily
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._norm_lengths: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+    
+    # Store listener interface
+    
+    def add(self, species: Dict[str, Any]):
+        field_tokens = [tokenize(field_text(species, field)) for field in self.fields]
+        lengths = tuple(len(tokens) for tokens in field_tokens)
+        frequencies: Dict[str, List[int]] = {}
+        for i, tokens in enumerate(field_tokens):
+            for token in tokens:
+                frequencies.setdefault(token, [0] * len(self.fields))[i] += 1
+        
+        with self._lock:
+            doc = len(self._species_ids)
+            self._species_ids.append(species["species_id"])
+            self._doc_ids[species["species_id"]] = doc
+            self._doc_terms[doc] = tuple(frequencies)
+            self._doc_lengths[doc] = lengths
+            for i, length in enumerate(lengths):
+                self._length_totals[i] += length
+            for term, tf in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._new_terms.append(term)
+                    if self.fuzzy is not None:
+                        self.fuzzy.add_term(term)
+                postings[doc] = tuple(tf)
+                self._arrays.pop(term, None)
+            self._check_drift()
+    
+    def remove(self, species: Dict[str, Any]):
+        with self._lock:
+            doc = self._doc_ids.pop(species["species_id"], None)
+            if doc is None:
+                return
+            self._species_ids[doc] = None
+            for i, length in enumerate(self._doc_lengths.pop(doc)):
+                self._length_totals[i] -= length
+            for term in self._doc_terms.pop(doc):
+                postings = self._postings[term]
+                del postings[doc]
+                if not postings:
+                    del self._postings[term]
+                    if self.fuzzy is not None:
+                        self.fuzzy.remove_term(term)
+                self._arrays.pop(term, None)
+            self._check_drift()
+    
+    def update(self, old: Dict[str, Any], new: Dict[str, Any]):
+        if all(field_text(old, field) == field_text(new, field) for field in self.fields):
+            return
+        self.remove(old)
+        self.add(new)
+    
+    # Scoring
+    
+    def _average_lengths(self) -> np.ndarray:
+        docs = max(1, len(self._doc_ids))
+        return np.maximum(np.array(self._length_totals, dtype=np.float32) / docs, 1.0)
+    
+    def _check_drift(self):
+        # Cached weights use the average lengths of when they were built; rebuild all past 10% drift
+        current = self._average_lengths()
+        if self._norm_lengths is None or np.any(np.abs(current - self._norm_lengths) > 0.1 * self._norm_lengths):
+            self._norm_lengths = current
+            self._arrays.clear()
+    
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is not None:
+            return arrays
+        with self._lock:
+            postings = self._postings.get(term, {})
+            docs = np.fromiter(postings, dtype=np.int64, count=len(postings))
+            tf = np.array(list(postings.values()), dtype=np.float32).reshape(len(postings), len(self.fields))
+            lengths = np.array([self._doc_lengths[doc] for doc in postings], dtype=np.float32).reshape(tf.shape)
+            norm = 1 - self.b + self.b * lengths / self._norm_lengths
+            weights = (tf / norm) @ self.boosts
+            order = np.argsort(docs)
+            arrays = (docs[order], weights[order].astype(np.float32))
+            self._arrays[term] = arrays
+        return arrays
+    
+    def _term_scores(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        docs, weights = self._term_arrays(term)
+        idf = math.log(1 + (len(self._doc_ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+        return docs, idf * weights * (self.k1 + 1) / (weights + self.k1)
+    
+    def _best_scores(self, alternatives: List[Tuple[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Best weighted score per doc over alternative terms for one query word"""
+        if not alternatives:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scored = [self._term_scores(term) for term, _ in alternatives]
+        docs = np.concatenate([d for d, _ in scored])
+        scores = np.concatenate([s * weight for (_, s), (_, weight) in zip(scored, alternatives)])
+        order = np.lexsort((-scores, docs))
+        docs, scores = docs[order], scores[order]
+        first = np.ones(len(docs), dtype=bool)
+        first[1:] = docs[1:] != docs[:-1]
+        return docs[first], scores[first].astype(np.float32)
+    
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        """Vocabulary terms starting with prefix, at most MAX_PREFIX_EXPANSIONS"""
+        if self._new_terms:
+            with self._lock:
+                self._vocabulary = sorted(term for term in set(self._vocabulary).union(self._new_terms) if term in self._postings)
+                self._new_terms = []
+        
+        terms = []
+        for term in self._vocabulary[bisect.bisect_left(self._vocabulary, prefix):]:
+            if not term.startswith(prefix) or len(terms) >= MAX_PREFIX_EXPANSIONS:
+                break
+            if term in self._postings:
+                terms.append(term)
+        return terms
+    
+    def _corrections(self, word: str) -> List[Tuple[str, float]]:
+        """Vocabulary terms within a few typos of word, weighted 1 / (1 + distance)"""
+        if self.fuzzy is None:
+            return []
+        return [(term, 1 / (1 + distance)) for term, distance in self.fuzzy.correct(word) if term in self._postings]
+    
+    def _match(self, query: str, within: Optional[Collection[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Docs matching every query term with their summed scores, optionally only those of within"""
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return empty
+        
+        groups = []
+        for i, term in enumerate(terms):
+            if term in self._postings:
+                groups.append(self._term_scores(term))
+                continue
+            alternatives = []
+            if i == len(terms) - 1:
+                alternatives = [(expansion, 1.0) for expansion in self._prefix_terms(term)]
+            if not alternatives:
+                alternatives = self._corrections(term)
+            if not alternatives:
+                return empty
+            groups.append(self._best_scores(alternatives))
+        
+        # Intersect from the shortest posting list, summing scores of the survivors
+        groups.sort(key=lambda group: len(group[0]))
+        docs, scores = groups[0]
+        scores = scores.astype(np.float32, copy=True)
+        for group_docs, group_scores in groups[1:]:
+            if not len(docs) or not len(group_docs):
+                docs, scores = docs[:0], scores[:0]
+                break
+            if len(docs) * 16 < len(group_docs):
+                # Few survivors: binary-search them in the longer list
+                positions = np.minimum(np.searchsorted(group_docs, docs), len(group_docs) - 1)
+                found = group_docs[positions] == docs
+                matched = group_scores[positions[found]]
+            else:
+                # Comparable sizes: scatter into a dense array, cheaper than random binary searches;
+                # BM25 scores are always positive, so zero marks a miss
+                dense = np.zeros(len(self._species_ids), dtype=np.float32)
+                dense[group_docs] = group_scores
+                matched = dense[docs]
+                found = matched > 0
+                matched = matched[found]
+            docs = docs[found]
+            scores = scores[found] + matched
+        
+        if within is not None:
+            allowed = np.fromiter((self._doc_ids[i] for i in within if i in self._doc_ids), dtype=np.int64)
+            keep = np.isin(docs, allowed)
+            docs, scores = docs[keep], scores[keep]
+        return docs, scores
+    
+    def search(self, query: str, limit: int = 10, offset: int = 0, within: Optional[Collection[str]] = None) -> Tuple[List[str], int]:
+        """Ids of the best-scoring species matching every query term, and how many matched
+        
+        within restricts the results to the given species ids, such as those
+        passing catalogue filters.
+        """
+        docs, scores = self._match(query, within)
+        return self._top(docs, scores, limit, offset), len(docs)
+    
+    def search_with_matches(
+        self, query: str, limit: int = 10, offset: int = 0, within: Optional[Collection[str]] = None
+    ) -> Tuple[List[str], int, List[str]]:
+        """Like search(), also returning the ids of every match, unranked, from the same pass"""
+        docs, scores = self._match(query, within)
+        return self._top(docs, scores, limit, offset), len(docs), [self._species_ids[doc] for doc in docs]
+    
+    def _top(self, docs: np.ndarray, scores: np.ndarray, limit: int, offset: int) -> List[str]:
+        total = len(docs)
+        wanted = offset + limit
+        if wanted < total:
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            docs, scores = docs[top], scores[top]
+        # Highest score first, earlier catalogue entries breaking ties
+        order = np.lexsort((docs, -scores))[offset:wanted]
+        return [self._species_ids[doc] for doc in docs[order]]
\ No newline at end of file
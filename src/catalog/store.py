@@ -0,0 +1,247 @@
+import bisect
+import json
+import threading
+from collections import Counter
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields with a secondary index from normalized value to species ids; list fields
+# such as distribution (islands) file the species under each of their values
+INDEXED_FIELDS = ("family", "genus", "conservation_status", "distribution")
+
+def index_key(value: str) -> str:
+    """Normalize a name for lookups: case-insensitive, whitespace collapsed"""
+    return " ".join(str(value).split()).casefold()
+
+def index_keys(value: Any) -> Dict[str, str]:
+    """Normalized keys of a scalar or list field value, each with its first spelling"""
+    if value is None:
+        return {}
+    values = value if isinstance(value, (list, tuple)) else [value]
+    keys: Dict[str, str] = {}
+    for item in values:
+        if item is not None:
+            keys.setdefault(index_key(item), item)
+    return keys
+
+class SpeciesStore:
+    """In-memory species catalogue with hash and secondary indexes
+    
+    Species are held by id in catalogue order, with a unique index on scientific
+    name and a secondary index per INDEXED_FIELDS value listing its species ids in
+    the same order, so lookups are O(1) and filtered pages are O(page) no matter
+    how large the catalogue is. Counts per value are the index list lengths, and
+    facets() counts values over a subset of species from the keys each is filed
+    under, so neither touches the rest of the catalogue. All changes go through
+    add(), update() and remove(), which keep every index consistent; stored
+    records must not be mutated in place. Removals and re-filings cost O(n) in the lists they touch,
+    which suits a catalogue that is read far more often than it is edited.
+    Derived indexes subscribe() to receive every change as it is applied.
+    """
+    
+    def __init__(self, species: Iterable[Dict[str, Any]] = (), indexed_fields: Tuple[str, ...] = INDEXED_FIELDS):
+        self.indexed_fields = indexed_fields
+        
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._order: List[str] = []
+        # species id -> position in the catalogue, never reused
+        self._sequence: Dict[str, int] = {}
+        self._next_sequence = 0
+        self._by_scientific_name: Dict[str, str] = {}
+        # field -> normalized value -> species ids in catalogue order
+        self._secondary: Dict[str, Dict[str, List[str]]] = {field: {} for field in indexed_fields}
+        # field -> normalized value -> spelling as first added, for display
+        self._labels: Dict[str, Dict[str, str]] = {field: {} for field in indexed_fields}
+        # species id -> field -> normalized values it is filed under
+        self._filed: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._listeners: List[Any] = []
+        self._lock = threading.RLock()
+        self.version = 0
+        
+        for record in species:
+            self.add(record)
+    
+    @classmethod
+    def from_json(cls, path: str) -> "SpeciesStore":
+        with open(path, encoding="utf-8") as f:
+            species = json.load(f)
+        store = cls(species)
+        logger.info(f"Loaded {len(store)} species from {path}")
+        return store
+    
+    @classmethod
+    def from_settings(cls, default: Iterable[Dict[str, Any]] = ()) -> "SpeciesStore":
+        """Load SPECIES_CATALOG_PATH when set, otherwise the given sample catalogue"""
+        if settings.SPECIES_CATALOG_PATH:
+            return cls.from_json(settings.SPECIES_CATALOG_PATH)
+        return cls(default)
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def __contains__(self, species_id: str) -> bool:
+        return species_id in self._by_id
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self._by_id[species_id] for species_id in list(self._order))
+    
+    def subscribe(self, listener: Any):
+        """Keep a derived index in sync: it receives add(record) for every current
+        species, then add, update(old, new) and remove(record) for each change"""
+        with self._lock:
+            for species_id in self._order:
+                listener.add(self._by_id[species_id])
+            self._listeners.append(listener)
+    
+    # Index maintenance, called with the lock held
+    
+    def _file(self, field: str, key: str, label: str, species_id: str):
+        # Insert by catalogue position so every list stays in catalogue order
+        bisect.insort(self._secondary[field].setdefault(key, []), species_id, key=self._sequence.__getitem__)
+        self._labels[field].setdefault(key, label)
+    
+    def _unfile(self, field: str, key: str, species_id: str):
+        ids = self._secondary[field][key]
+        ids.remove(species_id)
+        if not ids:
+            del self._secondary[field][key]
+            del self._labels[field][key]
+    
+    def _refile(self, species_id: str, record: Optional[Dict[str, Any]]):
+        """File a species under its record's values, moving it only where they changed"""
+        old = self._filed.pop(species_id, {})
+        new = {}
+        for field in self.indexed_fields:
+            keys = index_keys(record.get(field)) if record is not None else {}
+            previous = old.get(field, ())
+            for key in previous:
+                if key not in keys:
+                    self._unfile(field, key, species_id)
+            for key, label in keys.items():
+                if key not in previous:
+                    self._file(field, key, label, species_id)
+            new[field] = tuple(keys)
+        if record is not None:
+            self._filed[species_id] = new
+    
+    def _check_unique(self, species: Dict[str, Any], replacing: Optional[str] = None):
+        owner = self._by_scientific_name.get(index_key(species["scientific_name"]))
+        if owner is not None and owner != replacing:
+            raise ValueError(f"Scientific name '{species['scientific_name']}' already belongs to '{owner}'")
+    
+    # Changes
+    
+    def add(self, species: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a new species; its species_id and scientific name must be unused"""
+        record = dict(species)
+        species_id = record["species_id"]
+        with self._lock:
+            if species_id in self._by_id:
+                raise ValueError(f"Species '{species_id}' already exists")
+            self._check_unique(record)
+            
+            self._by_id[species_id] = record
+            self._sequence[species_id] = self._next_sequence
+            self._next_sequence += 1
+            self._order.append(species_id)
+            self._by_scientific_name[index_key(record["scientific_name"])] = species_id
+            self._refile(species_id, record)
+            for listener in self._listeners:
+                listener.add(record)
+            self.version += 1
+        return record
+    
+    def update(self, species_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply changes to a species, re-filing it only in the indexes whose value changed"""
+        with self._lock:
+            current = self._by_id.get(species_id)
+            if current is None:
+                raise KeyError(species_id)
+            if changes.get("species_id", species_id) != species_id:
+                raise ValueError("species_id cannot be changed; remove and add the species instead")
+            record = {**current, **changes}
+            self._check_unique(record, replacing=species_id)
+            
+            old_name, new_name = index_key(current["scientific_name"]), index_key(record["scientific_name"])
+            if old_name != new_name:
+                del self._by_scientific_name[old_name]
+                self._by_scientific_name[new_name] = species_id
+            self._refile(species_id, record)
+            self._by_id[species_id] = record
+            for listener in self._listeners:
+                listener.update(current, record)
+            self.version += 1
+        return record
+    
+    def remove(self, species_id: str) -> Dict[str, Any]:
+        """Remove a species from the catalogue and every index"""
+        with self._lock:
+            record = self._by_id.pop(species_id, None)
+            if record is None:
+                raise KeyError(species_id)
+            self._order.remove(species_id)
+            self._refile(species_id, None)
+            del self._sequence[species_id]
+            del self._by_scientific_name[index_key(record["scientific_name"])]
+            for listener in self._listeners:
+                listener.remove(record)
+            self.version += 1
+        return record
+    
+    # Lookups
+    
+    def get(self, species_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(species_id)
+    
+    def get_by_scientific_name(self, name: str) -> Optional[Dict[str, Any]]:
+        species_id = self._by_scientific_name.get(index_key(name))
+        return self._by_id.get(species_id) if species_id is not None else None
+    
+    def ids_by(self, field: str, value: str) -> List[str]:
+        """Species ids with the given value of an indexed field, in catalogue order"""
+        return self._secondary[field].get(index_key(value), [])
+    
+    def counts(self, field: str) -> Dict[str, int]:
+        """Number of species per value of an indexed field, keyed by display spelling"""
+        labels = self._labels[field]
+        return {labels[key]: len(ids) for key, ids in self._secondary[field].items()}
+    
+    def filter_ids(self, **filters: Optional[str]) -> List[str]:
+        """Species ids matching every given indexed field value, in catalogue order"""
+        filters = {field: index_key(value) for field, value in filters.items() if value}
+        if not filters:
+            return self._order
+        lists = sorted((self._secondary[field].get(key, []) for field, key in filters.items()), key=len)
+        ids = lists[0]
+        if len(lists) > 1:
+            # Walk the shortest list, checking the others through the keys each species is filed under
+            ids = [
+                species_id for species_id in ids
+                if all(key in self._filed[species_id][field] for field, key in filters.items())
+            ]
+        return ids
+    
+    def page(self, offset: int = 0, limit: int = 10, **filters: Optional[str]) -> Tuple[List[Dict[str, Any]], int]:
+        """A page of species in catalogue order and the total matching, optionally filtered by indexed fields"""
+        ids = self.filter_ids(**filters)
+        return [self._by_id[species_id] for species_id in ids[offset:offset + limit]], len(ids)
+    
+    def facets(self, species_ids: Optional[Collection[str]] = None, fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Number of species per value of each indexed field, most common first
+        
+        Without species_ids these are the maintained counts for the whole
+        catalogue; otherwise only the given species are counted, in O(len(species_ids)).
+        """
+        facets = {}
+        for field in fields or self.indexed_fields:
+            if species_ids is None:
+                counts = self.counts(field)
+            else:
+                labels = self._labels[field]
+                counter = Counter(key for species_id in species_ids for key in self._filed[species_id][field])
+                counts = {labels[key]: count for key, count in counter.items()}
+            facets[field] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+        return facets
\ No newline at end of file
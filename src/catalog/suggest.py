@@ -0,0 +1,162 @@
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from catalog.search import TOKEN_PATTERN, normalize_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rank of a completion by the kind of name it completes
+SUGGEST_WEIGHTS = {
+    "scientific_name": 3.0,
+    "common_name": 2.0,
+    "local_names": 2.0
+}
+
+# Keys are stored as fixed-width UTF-8 bytes; prefixes are compared on this many bytes
+MAX_KEY_BYTES = 32
+
+def suggest_key(text: str) -> str:
+    """Fold a name or typed prefix the way search does, words joined by single spaces"""
+    return " ".join(TOKEN_PATTERN.findall(normalize_text(text)))
+
+def _encode(key: str) -> bytes:
+    return key.encode("utf-8")[:MAX_KEY_BYTES]
+
+class SuggestIndex:
+    """Sorted-array prefix index over species names for autocomplete
+    
+    Every scientific, common and local name is indexed from each of its word
+    starts, so "sep" completes "Kembang Sepatu" as well as names starting with
+    it. Keys live in one sorted fixed-width bytes array with parallel arrays of
+    species, name and static rank, and a prefix is the contiguous range between
+    two binary searches. Changes are batched: added names wait in a pending list
+    and removed species in a set until the next lookup merges them in O(n), which
+    suits a catalogue edited far less often than it is typed into.
+    """
+    
+    def __init__(self, field_weights: Dict[str, float] = SUGGEST_WEIGHTS):
+        self.field_weights = field_weights
+        
+        self._doc_ids: Dict[str, int] = {}
+        self._species_ids: List[Optional[str]] = []
+        # doc -> names in field order, referenced by entries through their position
+        self._doc_names: Dict[int, Tuple[str, ...]] = {}
+        self._keys = np.empty(0, dtype=f"S{MAX_KEY_BYTES}")
+        self._docs = np.empty(0, dtype=np.int32)
+        self._names = np.empty(0, dtype=np.int16)
+        self._ranks = np.empty(0, dtype=np.float32)
+        self._pending: List[Tuple[bytes, int, int, float]] = []
+        self._removed: Set[int] = set()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+    
+    # Store listener interface
+    
+    def _names_of(self, species: Dict[str, Any]) -> List[Tuple[str, float]]:
+        names = []
+        for field, weight in self.field_weights.items():
+            value = species.get(field)
+            values = value if isinstance(value, (list, tuple)) else [value]
+            names.extend((str(name), weight) for name in values if name)
+        return names
+    
+    def add(self, species: Dict[str, Any]):
+        names = self._names_of(species)
+        entries = []
+        for position, (name, weight) in enumerate(names):
+            key = suggest_key(name)
+            for match in TOKEN_PATTERN.finditer(key):
+                # Whole-name completions first, then higher-weighted fields, then shorter names
+                rank = weight + (1.0 if match.start() == 0 else 0.0) - min(len(key), 100) / 1000
+                entries.append((_encode(key[match.start():]), position, rank))
+        
+        with self._lock:
+            doc = len(self._species_ids)
+            self._species_ids.append(species["species_id"])
+            self._doc_ids[species["species_id"]] = doc
+            self._doc_names[doc] = tuple(name for name, _ in names)
+            self._pending.extend((key, doc, position, rank) for key, position, rank in entries)
+    
+    def remove(self, species: Dict[str, Any]):
+        with self._lock:
+            doc = self._doc_ids.pop(species["species_id"], None)
+            if doc is None:
+                return
+            self._species_ids[doc] = None
+            del self._doc_names[doc]
+            self._removed.add(doc)
+    
+    def update(self, old: Dict[str, Any], new: Dict[str, Any]):
+        if self._names_of(old) == self._names_of(new):
+            return
+        self.remove(old)
+        self.add(new)
+    
+    # Lookups
+    
+    def _merge(self):
+        """Fold pending names and removals into the sorted arrays"""
+        with self._lock:
+            keys, docs, names, ranks = self._keys, self._docs, self._names, self._ranks
+            # Removals apply to merged and still pending names alike, e.g. a species
+            # updated before the first lookup has both its old and new names pending
+            pending = [entry for entry in self._pending if entry[1] not in self._removed]
+            if self._removed:
+                keep = ~np.isin(docs, np.fromiter(self._removed, dtype=np.int32, count=len(self._removed)))
+                keys, docs, names, ranks = keys[keep], docs[keep], names[keep], ranks[keep]
+                self._removed = set()
+            self._pending = []
+            if pending:
+                pending.sort()
+                new_keys = np.array([entry[0] for entry in pending], dtype=keys.dtype)
+                positions = np.searchsorted(keys, new_keys, side="right")
+                keys = np.insert(keys, positions, new_keys)
+                docs = np.insert(docs, positions, np.array([entry[1] for entry in pending], dtype=np.int32))
+                names = np.insert(names, positions, np.array([entry[2] for entry in pending], dtype=np.int16))
+                ranks = np.insert(ranks, positions, np.array([entry[3] for entry in pending], dtype=np.float32))
+            self._keys, self._docs, self._names, self._ranks = keys, docs, names, ranks
+    
+    def suggest(self, prefix: str, limit: int = 8) -> List[Tuple[str, str]]:
+        """Best (species id, name) completions of prefix, one per species"""
+        key = _encode(suggest_key(prefix))
+        if not key:
+            return []
+        if self._pending or self._removed:
+            self._merge()
+        
+        keys, docs, names, ranks = self._keys, self._docs, self._names, self._ranks
+        low = int(np.searchsorted(keys, key, side="left"))
+        high = int(np.searchsorted(keys, key + b"\xff", side="left"))
+        if low == high:
+            return []
+        docs, names, ranks = docs[low:high], names[low:high], ranks[low:high]
+        
+        # A species can match through several names; widen the candidate set until
+        # limit distinct species survive or the whole range has been ranked
+        wanted = limit * 4
+        while True:
+            if wanted < len(ranks):
+                top = np.argpartition(-ranks, wanted - 1)[:wanted]
+            else:
+                top = np.arange(len(ranks))
+            # Highest rank first, earlier catalogue entries breaking ties
+            top = top[np.lexsort((docs[top], -ranks[top]))]
+            _, first = np.unique(docs[top], return_index=True)
+            best = top[np.sort(first)]
+            # Skip species removed since the last merge so they do not take up slots
+            alive = np.fromiter((self._species_ids[doc] is not None for doc in docs[best]), dtype=bool, count=len(best))
+            best = best[alive]
+            if len(best) >= limit or len(top) == len(ranks):
+                break
+            wanted *= 4
+        
+        suggestions = []
+        for doc, position in zip(docs[best[:limit]], names[best[:limit]]):
+            species_id = self._species_ids[doc]
+            doc_names = self._doc_names.get(int(doc))
+            if species_id is not None and doc_names is not None:
+                suggestions.append((species_id, doc_names[position]))
+        return suggestions
\ No newline at end of file
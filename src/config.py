@@ -37,10 +37,87 @@ class Settings(BaseSettings):
     # File Upload
     MAX_FILE_SIZE: int = Field(default=10485760)  # 10MB
     ALLOWED_IMAGE_TYPES: str = Field(default="image/jpeg,image/png,image/webp")
+    MAX_IMAGE_PIXELS: int = Field(default=50000000)  # rejected from the header, before decoding
     
     # ML Model Configuration
     MODEL_PATH: str = Field(default="models/")
     CONFIDENCE_THRESHOLD: float = Field(default=0.7)
+    MODEL_INPUT_SIZE: int = Field(default=224)  # square input resolution in pixels
+    MODEL_BACKEND: str = Field(default="mock")  # mock, cpu, embedding
+    MODEL_TOP_K: int = Field(default=3)
+    MODEL_LAZY_LOAD: bool = Field(default=False)  # load on first identification instead of at startup
+    MODEL_WARMUP_ITERATIONS: int = Field(default=2)
+    MODEL_REGISTRY_PATH: Optional[str] = Field(default=None)  # versioned model registry, overrides MODEL_PATH
+    MODEL_REGISTRY_POLL_SECONDS: float = Field(default=5.0)
+    SIMILAR_OBSERVATIONS_K: int = Field(default=5)  # past identifications returned by embedding models, 0 disables
+    TTA_VIEWS: int = Field(default=6)  # center, its flip and four corner crops; at most 10
+    TTA_TIERS: str = Field(default="professional,enterprise,partner")  # tiers allowed to request ?tta=true
+    ROI_ENABLED: bool = Field(default=False)  # crop to the salient region before classification
+    ROI_DRAFT_SIZE: int = Field(default=256)  # shorter side of the draft the region is chosen on
+    ROI_MARGIN: float = Field(default=0.1)  # padding around the region, as a fraction of its size
+    ROI_MIN_FRACTION: float = Field(default=0.3)  # smallest crop side, as a fraction of the shorter image side
+    
+    # Inference Executor
+    INFERENCE_EXECUTOR: str = Field(default="thread")  # thread, process
+    INFERENCE_WORKERS: int = Field(default=4)
+    INFERENCE_QUEUE_SIZE: int = Field(default=32)  # jobs allowed to wait for a free worker
+    
+    # Micro-batching
+    BATCH_MAX_SIZE: int = Field(default=8)
+    BATCH_MAX_WAIT_MS: float = Field(default=10.0)
+    
+    # Batch Identification
+    BATCH_MAX_IMAGES: int = Field(default=500)  # images accepted per /identify/batch request
+    BATCH_REQUEST_CONCURRENCY: int = Field(default=8)  # images in flight per /identify/batch request
+    
+    # Identification Result Cache
+    RESULT_CACHE_ENABLED: bool = Field(default=True)
+    RESULT_CACHE_MAX_ENTRIES: int = Field(default=2048)
+    RESULT_CACHE_MAX_BYTES: int = Field(default=67108864)  # 64MB
+    RESULT_CACHE_TTL_SECONDS: float = Field(default=3600)
+    RESULT_CACHE_DISK_PATH: Optional[str] = Field(default=None)  # enables the on-disk tier
+    RESULT_CACHE_DISK_MAX_ENTRIES: int = Field(default=100000)
+    RESULT_CACHE_DISK_MAX_BYTES: int = Field(default=1073741824)  # 1GB
+    RESULT_CACHE_DISK_SWEEP_SECONDS: float = Field(default=600)  # delete expired files this often
+    
+    # Near-duplicate Lookup (perceptual hash)
+    PHASH_ENABLED: bool = Field(default=True)
+    PHASH_MIN_SIMILARITY: float = Field(default=0.9)  # fraction of matching dHash bits
+    PHASH_INDEX_MAX_ENTRIES: int = Field(default=100000)
+    
+    # Coalesce concurrent identical uploads into one identification
+    SINGLE_FLIGHT_ENABLED: bool = Field(default=True)
+    
+    # Tier-aware Inference Scheduling
+    TIER_MAX_CONCURRENCY: int = Field(default=16)
+    TIER_CONCURRENCY_FREE: int = Field(default=4)
+    TIER_CONCURRENCY_PROFESSIONAL: int = Field(default=8)
+    TIER_CONCURRENCY_ENTERPRISE: int = Field(default=12)
+    TIER_CONCURRENCY_PARTNER: int = Field(default=16)
+    TIER_QUEUE_FREE: int = Field(default=16)  # free-tier arrivals beyond this are shed
+    TIER_QUEUE_PROFESSIONAL: int = Field(default=64)
+    TIER_QUEUE_ENTERPRISE: int = Field(default=64)
+    TIER_QUEUE_PARTNER: int = Field(default=128)
+    
+    # Admission Control
+    ADMISSION_DEFAULT_DEADLINE_SECONDS: float = Field(default=10.0)
+    ADMISSION_MAX_DEADLINE_SECONDS: float = Field(default=60.0)  # cap for the X-Request-Timeout header
+    
+    # Asynchronous Identification Jobs
+    JOB_WORKERS: int = Field(default=4)
+    JOB_POLL_SECONDS: float = Field(default=1.0)
+    JOB_STALE_SECONDS: float = Field(default=300.0)  # requeue jobs stuck in processing this long
+    JOB_MAX_ATTEMPTS: int = Field(default=3)
+    JOB_MAX_WAIT_SECONDS: float = Field(default=30.0)  # longest allowed long-poll
+    
+    # Identification History
+    HISTORY_ENABLED: bool = Field(default=True)
+    HISTORY_BATCH_SIZE: int = Field(default=500)  # rows per bulk insert; a full batch flushes early
+    HISTORY_FLUSH_SECONDS: float = Field(default=1.0)
+    HISTORY_MAX_BUFFER: int = Field(default=10000)  # records beyond this are dropped, not blocked on
+    
+    # Species Catalogue
+    SPECIES_CATALOG_PATH: Optional[str] = Field(default=None)  # JSON list of species; the built-in sample when unset
     
     # External APIs
     TANAM_RAWAT_API_URL: str = Field(default="http://localhost:3000/api")
@@ -60,6 +137,11 @@ class Settings(BaseSettings):
         """Convert comma-separated string to list"""
         return [t.strip() for t in self.ALLOWED_IMAGE_TYPES.split(",")]
     
+    @property
+    def tta_tiers_list(self) -> List[str]:
+        """Convert comma-separated string to list"""
+        return [t.strip() for t in self.TTA_TIERS.split(",") if t.strip()]
+    
     @property
     def postgres_database_url(self) -> str:
         """Generate PostgreSQL database URL"""
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from datetime import datetime
@@ -59,19 +59,48 @@ class Identification(Base):
     __tablename__ = "identifications"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     species_id = Column(Integer, ForeignKey("species.id"), nullable=True)
-    image_path = Column(String(500), nullable=False)
+    image_path = Column(String(500), nullable=False)  # "sha256:<digest>" for uploads that are not stored
     confidence_score = Column(Float, nullable=False)
-    prediction_data = Column(Text)  # JSON string with full prediction results
+    prediction_data = Column(LargeBinary)  # packed (species code index, float16 confidence) pairs, see ml/predictions.py
     processing_time = Column(Float)  # Time taken for identification in seconds
     status = Column(String(20), default="completed")  # pending, processing, completed, failed
-    created_at = Column(DateTime, default=datetime.utcnow)
+    request_id = Column(String(36), index=True)
+    api_user_id = Column(String(100), index=True)  # user id from API key or JWT authentication
+    tier = Column(String(20))
+    species_code = Column(String(100), index=True)  # species_id of the top prediction
+    model_version = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     user = relationship("User", back_populates="identifications")
     species = relationship("Species", back_populates="identifications")
 
+class SpeciesCode(Base):
+    __tablename__ = "species_codes"
+    
+    # Small integer ids for species codes, referenced from packed prediction_data
+    id = Column(Integer, primary_key=True)
+    code = Column(String(100), unique=True, index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IdentificationJob(Base):
+    __tablename__ = "identification_jobs"
+    
+    id = Column(String(36), primary_key=True, index=True)
+    user_id = Column(String(100), index=True)  # API key / JWT subject of the submitter
+    tier = Column(String(20), default="free")
+    status = Column(String(20), default="pending", index=True)  # pending, processing, completed, failed
+    filename = Column(String(255))
+    image_data = Column(LargeBinary)  # Uploaded image, cleared once the job finishes
+    result = Column(Text)  # JSON identification response
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
 class APIUsage(Base):
     __tablename__ = "api_usage"
     
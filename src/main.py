@@ -2,13 +2,20 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import time
 import logging
 from config import settings
 from api.v1.router import api_router
 from middleware.rate_limiter import RateLimitMiddleware
 from middleware.auth import AuthMiddleware
+from middleware.upload_limit import UploadLimitMiddleware
+from middleware.admission import AdmissionMiddleware
 from database import init_db
+from ml.executor import inference_executor
+from ml.models import ModelNotAvailable
+from api.v1.endpoints import identify
+from api.v1.endpoints.identify import model_manager, job_queue, history_writer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,9 +44,15 @@ app.add_middleware(
 )
 
 # Add custom middleware
+# Shed identifications the queue cannot serve in time before their body is read; inside
+# auth and rate limiting so the caller's tier is known and rate-limited requests are not counted
+app.add_middleware(AdmissionMiddleware, get_scheduler=lambda: identify.tier_scheduler, paths=[f"{settings.API_V1_STR}/identify/"])
 app.add_middleware(RateLimitMiddleware)
 app.add_middleware(AuthMiddleware)
 
+# Reject oversized identification uploads before they are parsed (added last so it runs first)
+app.add_middleware(UploadLimitMiddleware, paths=[f"{settings.API_V1_STR}/identify/"])
+
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -68,7 +81,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
                 "message": exc.detail,
                 "timestamp": time.time()
             }
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -88,7 +102,7 @@ async def general_exception_handler(request: Request, exc: Exception):
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Initialize database and identification model on startup"""
     try:
         logger.info("Initializing database...")
         init_db()
@@ -96,6 +110,33 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
+    
+    # Load and warm up the model now so the first identification is not slow.
+    # Process-pool workers still load their own copy on first use.
+    if not settings.MODEL_LAZY_LOAD:
+        try:
+            await asyncio.to_thread(model_manager.load)
+        except ModelNotAvailable as e:
+            logger.error(f"Identification model unavailable, /identify will answer 503: {e}")
+    
+    # Pick up new active versions from the model registry
+    model_manager.start()
+    
+    # Drain queued ?async=true identifications, including jobs left from a previous run
+    await job_queue.start()
+    
+    # Periodically bulk-insert buffered identification history
+    await history_writer.start()
+
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and release inference workers on shutdown"""
+    await job_queue.stop()
+    # Write out buffered identification history before the process exits
+    await history_writer.stop()
+    await model_manager.stop()
+    inference_executor.shutdown(wait=True)
 
 # Health check endpoint
 @app.get("/health")
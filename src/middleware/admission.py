@@ -0,0 +1,77 @@
+import json
+import time
+from typing import Callable, Iterable, Optional
+from urllib.parse import parse_qs
+from config import settings
+from ml.priority import AdmissionRejected, TierScheduler
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AdmissionMiddleware:
+    """Sheds synchronous identifications before their body is received
+    
+    By the time an endpoint runs, the multipart upload has already been read
+    and spooled, so rejecting there saves no ingress. This layer asks the tier
+    scheduler for admission as soon as the headers are in and answers 503 with
+    Retry-After without ever calling receive. It must run inside the auth
+    middleware, which puts the caller's tier in the request state. Asynchronous
+    (?async=true) requests are queued as jobs and are not checked here.
+    """
+    
+    def __init__(self, app, get_scheduler: Callable[[], TierScheduler], paths: Iterable[str] = ()):
+        self.app = app
+        self.get_scheduler = get_scheduler
+        self.paths = set(paths)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths or self.is_async(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        user_info = scope.get("state", {}).get("user") or {}
+        try:
+            self.get_scheduler().check_admission(user_info.get("tier"), self.deadline(scope))
+        except AdmissionRejected as e:
+            logger.warning(f"Shed identification request to {scope['path']} before reading it: {str(e)}")
+            await self.send_busy(send, e.retry_after)
+            return
+        await self.app(scope, receive, send)
+    
+    @staticmethod
+    def is_async(scope) -> bool:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("async", [])
+        return any(value.lower() in ("1", "true", "yes", "on") for value in values)
+    
+    @staticmethod
+    def deadline(scope) -> Optional[float]:
+        """Same deadline as the endpoint computes; an invalid header is left for it to reject"""
+        timeout = settings.ADMISSION_DEFAULT_DEADLINE_SECONDS
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    timeout = min(float(value), settings.ADMISSION_MAX_DEADLINE_SECONDS)
+                except ValueError:
+                    return None
+                if timeout <= 0:
+                    return None
+        return time.monotonic() + timeout
+    
+    async def send_busy(self, send, retry_after: int):
+        body = json.dumps({
+            "error": {
+                "code": 503,
+                "message": "Identification service is busy, please retry shortly",
+                "timestamp": time.time()
+            }
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
\ No newline at end of file
@@ -0,0 +1,91 @@
+import json
+import time
+from typing import Iterable
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Room for multipart boundaries and part headers around the image itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadLimitMiddleware:
+    """Rejects oversized identification uploads before their body is parsed
+    
+    Requests that declare a Content-Length over the limit are answered with 413
+    without reading the body. Chunked requests are counted as they stream in and
+    cut off as soon as they pass the limit, so the multipart parser never spools
+    an oversized upload to disk.
+    """
+    
+    def __init__(self, app, paths: Iterable[str] = (), max_body_size: int = None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_size = max_body_size or settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > self.max_body_size:
+                    logger.warning(f"Rejected {declared} byte upload to {scope['path']} before reading it")
+                    await self.send_too_large(send)
+                    return
+        
+        received = 0
+        response_started = False
+        rejected = False
+        
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size and not response_started:
+                    # Answer now and make the app see a disconnected client
+                    logger.warning(f"Cut off streamed upload to {scope['path']} after {received} bytes")
+                    rejected = True
+                    await self.send_too_large(send)
+                    return {"type": "http.disconnect"}
+            return message
+        
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not rejected:
+                raise
+    
+    async def send_too_large(self, send):
+        body = json.dumps({
+            "error": {
+                "code": 413,
+                "message": f"Request body exceeds the maximum upload size of {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB",
+                "timestamp": time.time()
+            }
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
\ No newline at end of file
@@ -0,0 +1 @@
+# ML package
\ No newline at end of file
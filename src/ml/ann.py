@@ -0,0 +1,334 @@
+"""
+Approximate nearest-neighbour search over large embedding sets.
+
+IVFPQIndex partitions L2-normalized vectors into nlist inverted lists around
+k-means centroids and stores each vector as m one-byte product-quantization
+codes of its residual, so 1M 64-dimensional vectors take about 16 MB of codes
+instead of 256 MB of float32. Queries scan only the nprobe closest lists and
+score candidates with per-list lookup tables (asymmetric distance computation).
+Optionally the normalized vectors are also kept as float16, and the best
+rerank * k candidates are re-scored exactly from them, which recovers most of
+the recall lost to quantization while touching only a few pages of the file.
+
+Indexes are built offline and memory-mapped when loaded:
+
+    python -m ml.ann build --vectors obs.npy --ids obs_ids.npy --out models/observations
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANN_MANIFEST_FILE = "ann.json"
+CENTROIDS_FILE = "centroids.npy"
+CODEBOOKS_FILE = "codebooks.npy"
+CODES_FILE = "codes.npy"
+IDS_FILE = "ids.npy"
+OFFSETS_FILE = "offsets.npy"
+VECTORS_FILE = "vectors.npy"
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """Index of the nearest centroid for every row, computed in blocks"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], block_rows):
+        block = vectors[start:start + block_rows]
+        # ||x - c||^2 without the ||x||^2 term, which does not change the argmin
+        distances = centroid_norms - 2 * block @ centroids.T
+        labels[start:start + block_rows] = distances.argmin(axis=1)
+    return labels
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[0] < k:
+        raise ValueError(f"Need at least {k} training vectors, got {vectors.shape[0]}")
+    centroids = vectors[rng.choice(vectors.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()), replace=False)]
+    return centroids
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantized residuals
+    
+    Vectors are normalized on the way in, so the L2 ranking used internally is
+    the cosine ranking; search reports cosine similarities estimated from the
+    quantized distances. Codes are stored grouped by inverted list, with
+    offsets[i]:offsets[i + 1] holding list i.
+    """
+    
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        ids: np.ndarray,
+        offsets: np.ndarray,
+        vectors: Optional[np.ndarray] = None,
+        nprobe: int = 16,
+        rerank: int = 4
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks  # (m, 256, dim / m)
+        self.codes = codes  # (N, m) uint8
+        self.ids = ids
+        self.offsets = offsets
+        self.vectors = vectors  # (N, dim) float16 in code order, or None
+        self.nprobe = nprobe
+        self.rerank = rerank
+        # Pieces of the lookup-table computation that do not depend on the query
+        self._codebooks_t = np.ascontiguousarray(codebooks.transpose(0, 2, 1))  # (m, dim / m, 256)
+        self._codebook_norms = (codebooks ** 2).sum(axis=2)  # (m, 256)
+        self._centroid_norms = (centroids ** 2).sum(axis=1)
+    
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+    
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+    
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+    
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+    
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        nlist: int = 1024,
+        m: int = 16,
+        iterations: int = 20,
+        max_training_vectors: int = 65536,
+        store_vectors: bool = True,
+        seed: int = 0
+    ) -> "IVFPQIndex":
+        """Learn coarse centroids and residual codebooks; returns an empty index"""
+        vectors = np.asarray(vectors)
+        dim = vectors.shape[1]
+        if dim % m:
+            raise ValueError(f"Dimension {dim} is not divisible by m={m}")
+        
+        rng = np.random.default_rng(seed)
+        if vectors.shape[0] > max_training_vectors:
+            sample = np.sort(rng.choice(vectors.shape[0], max_training_vectors, replace=False))
+            vectors = vectors[sample]
+        vectors = _normalize(vectors)
+        
+        centroids = kmeans(vectors, nlist, iterations=iterations, seed=seed)
+        residuals = vectors - centroids[_assign(vectors, centroids)]
+        sub_dim = dim // m
+        codebooks = np.stack([
+            kmeans(residuals[:, j * sub_dim:(j + 1) * sub_dim], 256, iterations=iterations, seed=seed + j + 1)
+            for j in range(m)
+        ])
+        return cls(
+            centroids,
+            codebooks,
+            np.empty((0, m), dtype=np.uint8),
+            np.empty(0, dtype=np.int64),
+            np.zeros(nlist + 1, dtype=np.int64),
+            vectors=np.empty((0, dim), dtype=np.float16) if store_vectors else None
+        )
+    
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (inverted list, PQ codes) for each vector"""
+        vectors = _normalize(vectors)
+        lists = _assign(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+        sub_dim = self.dim // self.m
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _assign(residuals[:, j * sub_dim:(j + 1) * sub_dim], self.codebooks[j])
+        return lists, codes
+    
+    def add(self, vectors: np.ndarray, ids: np.ndarray, block_rows: int = 65536):
+        """Encode vectors and merge them into the inverted lists"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(vectors):
+            raise ValueError("Need one id per vector")
+        
+        lists, codes, raw = [], [], []
+        for start in range(0, len(vectors), block_rows):
+            block = vectors[start:start + block_rows]
+            block_lists, block_codes = self.encode(block)
+            lists.append(block_lists)
+            codes.append(block_codes)
+            if self.vectors is not None:
+                raw.append(_normalize(block).astype(np.float16))
+        
+        existing_lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        all_lists = np.concatenate([existing_lists] + lists)
+        order = np.argsort(all_lists, kind="stable")
+        self.codes = np.concatenate([np.asarray(self.codes)] + codes)[order]
+        self.ids = np.concatenate([np.asarray(self.ids), ids])[order]
+        if self.vectors is not None:
+            self.vectors = np.concatenate([np.asarray(self.vectors)] + raw)[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(all_lists, minlength=self.nlist))]).astype(np.int64)
+    
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, cosine similarities) of the approximate k nearest vectors per query
+        
+        Rows with fewer than k candidates in the probed lists are padded with id -1.
+        """
+        queries = _normalize(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        sub_dim = self.dim // self.m
+        
+        coarse = self._centroid_norms - 2 * queries @ self.centroids.T
+        subspace_offsets = np.arange(self.m) * 256
+        probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+        
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            starts, stops = self.offsets[lists], self.offsets[lists + 1]
+            sizes = stops - starts
+            if not sizes.sum():
+                continue
+            candidates = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+            probe_of = np.repeat(np.arange(nprobe), sizes)
+            
+            # Lookup tables: ||r - c||^2 = ||r||^2 - 2 r.c + ||c||^2 for each probed residual slice
+            residuals = (query[None, :] - self.centroids[lists]).reshape(nprobe, self.m, sub_dim).transpose(1, 0, 2)
+            tables = (
+                (residuals ** 2).sum(axis=2)[:, :, None]
+                - 2 * residuals @ self._codebooks_t
+                + self._codebook_norms[:, None, :]
+            ).transpose(1, 0, 2).reshape(nprobe, -1)  # (nprobe, m * 256)
+            table_rows = (probe_of * (self.m * 256))[:, None] + subspace_offsets
+            distances = tables.ravel()[np.asarray(self.codes[candidates], dtype=np.intp) + table_rows].sum(axis=1)
+            
+            shortlist = min(k * self.rerank if self.vectors is not None else k, len(candidates))
+            top = np.argpartition(distances, shortlist - 1)[:shortlist] if shortlist < len(candidates) else np.arange(shortlist)
+            if self.vectors is not None:
+                # Exact cosine on the shortlist; sorted positions keep memory-mapped reads local
+                top = np.sort(top)
+                scores = np.asarray(self.vectors[candidates[top]], dtype=np.float32) @ query
+            else:
+                # For unit vectors ||a - b||^2 = 2 - 2 cos(a, b)
+                scores = 1.0 - distances[top] / 2.0
+            
+            count = min(k, shortlist)
+            best = np.argsort(-scores)[:count]
+            result_ids[row, :count] = self.ids[candidates[top[best]]]
+            result_scores[row, :count] = scores[best]
+        return result_ids, result_scores
+    
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for filename, array in (
+            (CENTROIDS_FILE, self.centroids),
+            (CODEBOOKS_FILE, self.codebooks),
+            (CODES_FILE, self.codes),
+            (IDS_FILE, self.ids),
+            (OFFSETS_FILE, self.offsets),
+            (VECTORS_FILE, self.vectors)
+        ):
+            if array is not None:
+                np.save(os.path.join(path, filename), np.ascontiguousarray(array))
+        with open(os.path.join(path, ANN_MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "type": "ivfpq",
+                "nlist": self.nlist,
+                "m": self.m,
+                "dim": self.dim,
+                "count": len(self),
+                "nprobe": self.nprobe,
+                "rerank": self.rerank,
+                "vectors": self.vectors is not None
+            }, f)
+    
+    @classmethod
+    def load(cls, path: str, nprobe: Optional[int] = None) -> "IVFPQIndex":
+        """Open a saved index; codes, ids and vectors stay memory-mapped"""
+        with open(os.path.join(path, ANN_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls(
+            np.load(os.path.join(path, CENTROIDS_FILE)),
+            np.load(os.path.join(path, CODEBOOKS_FILE)),
+            np.load(os.path.join(path, CODES_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, IDS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, OFFSETS_FILE)),
+            vectors=np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r") if manifest.get("vectors") else None,
+            nprobe=nprobe or manifest.get("nprobe", 16),
+            rerank=manifest.get("rerank", 4)
+        )
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "type": "ivfpq",
+            "vectors": len(self),
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "m": self.m,
+            "nprobe": self.nprobe,
+            "rerank": self.rerank if self.vectors is not None else None,
+            "code_bytes": int(self.codes.nbytes)
+        }
+
+def build_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    nlist: int = 1024,
+    m: int = 16,
+    nprobe: int = 16,
+    store_vectors: bool = True
+) -> IVFPQIndex:
+    """Train an index on a sample of vectors, then add all of them"""
+    start_time = time.perf_counter()
+    index = IVFPQIndex.train(vectors, nlist=nlist, m=m, store_vectors=store_vectors)
+    index.nprobe = nprobe
+    logger.info(f"Trained IVF-PQ index ({nlist} lists, m={m}) in {time.perf_counter() - start_time:.1f}s")
+    index.add(vectors, ids)
+    logger.info(f"Indexed {len(index)} vectors in {time.perf_counter() - start_time:.1f}s")
+    return index
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build approximate nearest-neighbour indexes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    build = commands.add_parser("build", help="Build an IVF-PQ index from a .npy matrix")
+    build.add_argument("--vectors", required=True, help=".npy file with one embedding per row")
+    build.add_argument("--ids", help=".npy file with one int64 id per row (defaults to row numbers)")
+    build.add_argument("--out", required=True, help="Output directory")
+    build.add_argument("--nlist", type=int, default=1024)
+    build.add_argument("--m", type=int, default=16)
+    build.add_argument("--nprobe", type=int, default=16)
+    build.add_argument("--no-vectors", action="store_true", help="Keep only PQ codes (smaller, no exact re-ranking)")
+    
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    
+    vectors = np.load(args.vectors, mmap_mode="r")
+    ids = np.load(args.ids) if args.ids else np.arange(vectors.shape[0])
+    index = build_index(vectors, ids, nlist=args.nlist, m=args.m, nprobe=args.nprobe, store_vectors=not args.no_vectors)
+    index.save(args.out)
+    print(json.dumps(index.get_status()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from config import settings
+from ml.executor import InferenceExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class BatchScheduler:
+    """Groups concurrent predict calls into batched model invocations
+    
+    A batch is dispatched as soon as max_batch_size items are waiting or the
+    oldest waiting item has been queued for max_wait_ms, whichever comes first.
+    """
+    
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[Any]],
+        executor: InferenceExecutor,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        stats_window: int = 1000
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        
+        self._waiting: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        
+        self._batch_sizes: Dict[int, int] = {}
+        self._total_batches = 0
+        self._total_items = 0
+        self._failed_batches = 0
+        self._queue_waits: Deque[float] = deque(maxlen=stats_window)
+        self._latencies: Deque[float] = deque(maxlen=stats_window)
+        self._batch_run_times: Deque[float] = deque(maxlen=stats_window)
+    
+    @classmethod
+    def from_settings(cls, predict_batch: Callable[[List[Any]], List[Any]], executor: InferenceExecutor) -> "BatchScheduler":
+        return cls(
+            predict_batch,
+            executor,
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            max_wait_ms=settings.BATCH_MAX_WAIT_MS
+        )
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+    
+    async def submit(self, item: Any) -> Any:
+        """Queue a single item and wait for its share of the batched result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((item, future, time.perf_counter()))
+        
+        if len(self._waiting) >= self.max_batch_size or self.max_wait_ms == 0:
+            self._dispatch(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._dispatch, loop)
+        
+        return await future
+    
+    def _dispatch(self, loop: asyncio.AbstractEventLoop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        while self._waiting:
+            batch = self._waiting[:self.max_batch_size]
+            del self._waiting[:self.max_batch_size]
+            loop.create_task(self._run_batch(batch))
+            # A partial tail keeps waiting for more items until its own deadline
+            if self._waiting and len(self._waiting) < self.max_batch_size:
+                self._timer = loop.call_later(self.max_wait_ms / 1000, self._dispatch, loop)
+                break
+    
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        items = [item for item, _, _ in batch]
+        batch_start = time.perf_counter()
+        for _, _, queued_at in batch:
+            self._queue_waits.append(batch_start - queued_at)
+        
+        try:
+            results = await self.executor.run(self.predict_batch, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Model returned {len(results)} results for a batch of {len(items)}")
+        except Exception as e:
+            self._failed_batches += 1
+            logger.error(f"Batched prediction of {len(items)} items failed: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        finished_at = time.perf_counter()
+        self._total_batches += 1
+        self._total_items += len(items)
+        self._batch_sizes[len(items)] = self._batch_sizes.get(len(items), 0) + 1
+        self._batch_run_times.append(finished_at - batch_start)
+        
+        for (_, future, queued_at), result in zip(batch, results):
+            self._latencies.append(finished_at - queued_at)
+            if not future.done():
+                future.set_result(result)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        queue_waits = sorted(self._queue_waits)
+        latencies = sorted(self._latencies)
+        run_times = sorted(self._batch_run_times)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "waiting": len(self._waiting),
+            "total_batches": self._total_batches,
+            "total_items": self._total_items,
+            "failed_batches": self._failed_batches,
+            "avg_batch_size": round(self._total_items / self._total_batches, 2) if self._total_batches else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "queue_wait_ms": {
+                "p50": round(_percentile(queue_waits, 50) * 1000, 2),
+                "p95": round(_percentile(queue_waits, 95) * 1000, 2)
+            },
+            "latency_ms": {
+                "p50": round(_percentile(latencies, 50) * 1000, 2),
+                "p95": round(_percentile(latencies, 95) * 1000, 2),
+                "p99": round(_percentile(latencies, 99) * 1000, 2)
+            },
+            "batch_run_time_ms": {
+                "p50": round(_percentile(run_times, 50) * 1000, 2),
+                "p95": round(_percentile(run_times, 95) * 1000, 2)
+            }
+        }
\ No newline at end of file
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw upload bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """Identification result cache keyed by upload content hash and model version
+    
+    The memory tier is a bounded LRU with a per-entry TTL. When disk_path is set,
+    entries are also written there as JSON files so they survive restarts and
+    memory evictions; disk hits are promoted back into memory. The disk tier is
+    bounded too: an in-memory index of the files, rebuilt from the directory on
+    start, evicts the least recently used ones past disk_max_entries or
+    disk_max_bytes, and expired files are swept every disk_sweep_seconds rather
+    than only when their key is read again. Processes sharing a directory each
+    enforce the caps on the files they know of.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100000,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        disk_sweep_seconds: float = 600
+    ):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = max(1, disk_max_entries)
+        self.disk_max_bytes = max(1, disk_max_bytes)
+        self.disk_sweep_seconds = disk_sweep_seconds
+        
+        # key -> (expires_at, size_bytes, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "disk_evictions": 0
+        }
+        
+        # Disk tier index: file path -> (expires_at, size_bytes), least recently used first
+        self._disk_files: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._next_sweep = 0.0
+        
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+            self._scan_disk()
+    
+    @classmethod
+    def from_settings(cls) -> "ResultCache":
+        return cls(
+            max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+            disk_path=settings.RESULT_CACHE_DISK_PATH,
+            disk_max_entries=settings.RESULT_CACHE_DISK_MAX_ENTRIES,
+            disk_max_bytes=settings.RESULT_CACHE_DISK_MAX_BYTES,
+            disk_sweep_seconds=settings.RESULT_CACHE_DISK_SWEEP_SECONDS
+        )
+    
+    @staticmethod
+    def make_key(digest: str, model_version: str) -> str:
+        return f"{model_version}:{digest}"
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, checking memory first and then disk"""
+        value = self._get_memory(key)
+        if value is not None:
+            self._count("hits", "memory_hits")
+            return value
+        
+        if self.disk_path:
+            value = await asyncio.to_thread(self._get_disk, key)
+            if value is not None:
+                self._set_memory(key, value)
+                self._count("hits", "disk_hits")
+                return value
+        
+        self._count("misses")
+        return None
+    
+    async def set(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable value under key"""
+        self._set_memory(key, value)
+        if self.disk_path:
+            await asyncio.to_thread(self._set_disk, key, value)
+    
+    def _count(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._stats[name] += 1
+    
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._bytes -= size
+                self._stats["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def _set_memory(self, key: str, value: Dict[str, Any]):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (time.time() + self.ttl_seconds, size, value)
+            self._bytes += size
+            
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+    
+    def _disk_file(self, key: str) -> str:
+        # Model versions may contain characters that are awkward in file names
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.disk_path, name[:2], f"{name}.json")
+    
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._disk_file(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable result cache file {path}: {e}")
+            return None
+        
+        if entry.get("key") != key or entry.get("expires_at", 0) < time.time():
+            self._remove_disk_file(path)
+            self._count("expirations")
+            return None
+        with self._disk_lock:
+            if path in self._disk_files:
+                self._disk_files.move_to_end(path)
+        return entry["value"]
+    
+    def _set_disk(self, key: str, value: Dict[str, Any]):
+        path = self._disk_file(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        expires_at = time.time() + self.ttl_seconds
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires_at": expires_at, "value": value}, f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write result cache file {path}: {e}")
+            return
+        
+        with self._disk_lock:
+            previous = self._disk_files.pop(path, None)
+            if previous is not None:
+                self._disk_bytes -= previous[1]
+            self._disk_files[path] = (expires_at, size)
+            self._disk_bytes += size
+            evicted = []
+            while len(self._disk_files) > self.disk_max_entries or self._disk_bytes > self.disk_max_bytes:
+                evicted_path, (_, evicted_size) = self._disk_files.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                evicted.append(evicted_path)
+            sweep = time.monotonic() >= self._next_sweep
+        if evicted:
+            with self._lock:
+                self._stats["disk_evictions"] += len(evicted)
+        for evicted_path in evicted:
+            self._unlink(evicted_path)
+        if sweep:
+            self.sweep_disk()
+    
+    # Disk tier bookkeeping
+    
+    def _scan_disk(self):
+        """Index files left by earlier runs, oldest first; their expiry is taken from mtime"""
+        files = []
+        for root, _, names in os.walk(self.disk_path):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    # Left by a write interrupted before its rename
+                    self._unlink(path)
+                elif name.endswith(".json"):
+                    files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        for mtime, path, size in files:
+            self._disk_files[path] = (mtime + self.ttl_seconds, size)
+            self._disk_bytes += size
+        if files:
+            logger.info(f"Indexed {len(files)} result cache files ({self._disk_bytes} bytes) in {self.disk_path}")
+    
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def _remove_disk_file(self, path: str):
+        with self._disk_lock:
+            entry = self._disk_files.pop(path, None)
+            if entry is not None:
+                self._disk_bytes -= entry[1]
+        self._unlink(path)
+    
+    def sweep_disk(self) -> int:
+        """Delete expired disk entries, returning how many were removed"""
+        now = time.time()
+        with self._disk_lock:
+            self._next_sweep = time.monotonic() + self.disk_sweep_seconds
+            expired = [path for path, (expires_at, _) in self._disk_files.items() if expires_at < now]
+            for path in expired:
+                self._disk_bytes -= self._disk_files.pop(path)[1]
+        for path in expired:
+            self._unlink(path)
+        if expired:
+            with self._lock:
+                self._stats["expirations"] += len(expired)
+            logger.info(f"Swept {len(expired)} expired result cache files")
+        return len(expired)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_tier": bool(self.disk_path),
+                "disk_entries": len(self._disk_files),
+                "disk_bytes": self._disk_bytes,
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+            }
\ No newline at end of file
@@ -0,0 +1,90 @@
+import io
+from typing import Any, Dict, Tuple
+from PIL import Image
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+class ImageDecodeError(ValueError):
+    """Raised when an upload is not a decodable image we accept"""
+
+def sniff_format(head: bytes):
+    """Identify a supported image format from the first bytes of an upload, or None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+def open_image(image_data: bytes) -> Image.Image:
+    """Open an image lazily; PIL only parses the header until pixels are requested"""
+    try:
+        return Image.open(io.BytesIO(image_data))
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+
+def read_image_info(image_data: bytes) -> Dict[str, Any]:
+    """Validate an upload and report its metadata from the header alone"""
+    image = open_image(image_data)
+    
+    if image.format not in SUPPORTED_FORMATS:
+        raise ImageDecodeError(f"Unsupported image format {image.format}")
+    if image.width < 1 or image.height < 1:
+        raise ImageDecodeError("Image has no pixels")
+    if image.width * image.height > settings.MAX_IMAGE_PIXELS:
+        raise ImageDecodeError(
+            f"Image is {image.width}x{image.height}, larger than the {settings.MAX_IMAGE_PIXELS} pixel limit"
+        )
+    
+    return {
+        "width": image.width,
+        "height": image.height,
+        "format": image.format,
+        "mode": image.mode,
+        "size_bytes": len(image_data)
+    }
+
+def scaled_size(width: int, height: int, target: int) -> Tuple[int, int]:
+    """Size with the shorter side equal to target, keeping the aspect ratio"""
+    scale = target / min(width, height)
+    return max(target, round(width * scale)), max(target, round(height * scale))
+
+def decode_reduced(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Decode an opened image to RGB, letting the JPEG decoder reduce it towards size
+    
+    The result is at least size on both sides for JPEGs (draft picks the smallest
+    DCT scale that covers it) and full resolution for other formats.
+    """
+    try:
+        if image.format == "JPEG":
+            image.draft("RGB", size)
+        return image.convert("RGB")
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+
+def decode_model_input(image_data: bytes, target: int = None) -> Tuple[Image.Image, int]:
+    """Decode an upload for the model, also returning how many pixels were decoded"""
+    target = target or settings.MODEL_INPUT_SIZE
+    image = open_image(image_data)
+    size = scaled_size(image.width, image.height, target)
+    
+    image = decode_reduced(image, size)
+    decoded_pixels = image.width * image.height
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return image, decoded_pixels
+
+def decode_for_model(image_data: bytes, target: int = None) -> Image.Image:
+    """Decode an upload to RGB with its shorter side scaled to the model input size
+    
+    JPEGs are reduced by the decoder itself (DCT scaling via draft mode), so a
+    4000x3000 photo is never materialized at full resolution. Other formats are
+    decoded fully and downscaled with reducing_gap, which does a cheap integer
+    reduce before the final resample.
+    """
+    return decode_model_input(image_data, target)[0]
\ No newline at end of file
@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_MANIFEST_FILE = "index.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+INDEX_LABELS_FILE = "labels.json"
+
+SUPPORTED_DTYPES = ("float16", "int8")
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so a dot product is a cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode normalized rows as float16, or as int8 with one float32 scale per row"""
+    vectors = normalize_rows(vectors)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+def top_k_indices(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted top-k columns of an (M, N) score matrix using argpartition"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+class SpeciesEmbeddingIndex:
+    """Per-species prototype embeddings searched by cosine similarity
+    
+    The index directory holds index.json, labels.json with one species dict per
+    row and embeddings.npy: L2-normalized prototypes stored as float16, or as int8
+    codes with a per-row scale in scales.npy. The matrix is memory-mapped, so
+    worker processes share it through the page cache, and search scans it in
+    blocks to bound the float32 working set.
+    """
+    
+    def __init__(self, path: str, block_rows: int = 65536):
+        self.path = path
+        self.block_rows = block_rows
+        with open(os.path.join(path, INDEX_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.dtype = self.manifest.get("dtype", "float16")
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {self.dtype}")
+        
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, SCALES_FILE)) if self.dtype == "int8" else None
+        with open(os.path.join(path, INDEX_LABELS_FILE), "r", encoding="utf-8") as f:
+            self.labels: List[Dict[str, Any]] = json.load(f)
+        
+        if self.embeddings.ndim != 2 or len(self.labels) != self.embeddings.shape[0]:
+            raise ValueError("embeddings must be a 2-D matrix with one label per row")
+        if self.scales is not None and self.scales.shape != (self.embeddings.shape[0],):
+            raise ValueError("int8 embeddings need one scale per row")
+    
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+    
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+    
+    def similarities(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each query to every prototype, shape (M, N)"""
+        queries = normalize_rows(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Queries have dimension {queries.shape[1]}, index has {self.dim}")
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            stop = min(start + self.block_rows, len(self))
+            block = self.embeddings[start:stop].astype(np.float32)
+            np.matmul(queries, block.T, out=scores[:, start:stop])
+            if self.scales is not None:
+                scores[:, start:stop] *= self.scales[start:stop]
+        return scores
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (indices, similarities) of the k nearest prototypes per query, best first"""
+        return top_k_indices(self.similarities(queries), k)
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "species": len(self),
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "size_bytes": int(self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+        }
+
+def save_species_index(path: str, embeddings: np.ndarray, labels: List[Dict[str, Any]], dtype: str = "float16"):
+    """Write a species index directory, replacing any existing one atomically per file"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(labels):
+        raise ValueError("embeddings must be a 2-D matrix with one label per row")
+    codes, scales = quantize(embeddings, dtype)
+    
+    os.makedirs(path, exist_ok=True)
+    _atomic_save(path, EMBEDDINGS_FILE, codes)
+    if scales is not None:
+        _atomic_save(path, SCALES_FILE, scales)
+    _atomic_write_json(path, INDEX_LABELS_FILE, labels)
+    _atomic_write_json(path, INDEX_MANIFEST_FILE, {"dtype": dtype, "dim": int(embeddings.shape[1])})
+
+def append_species(path: str, embeddings: np.ndarray, labels: List[Dict[str, Any]]):
+    """Add species prototypes to an existing index without touching the model"""
+    index = SpeciesEmbeddingIndex(path)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or embeddings.shape[1] != index.dim or embeddings.shape[0] != len(labels):
+        raise ValueError(f"Expected {len(labels)} rows of dimension {index.dim}")
+    
+    existing_ids = {label.get("species_id") for label in index.labels}
+    duplicates = [label["species_id"] for label in labels if label.get("species_id") in existing_ids]
+    if duplicates:
+        raise ValueError(f"Species already indexed: {', '.join(duplicates)}")
+    
+    codes, scales = quantize(embeddings, index.dtype)
+    total = len(index) + codes.shape[0]
+    # Write the grown matrix through a memmap so only the new rows pass through memory twice
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".npy")
+    os.close(fd)
+    grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=codes.dtype, shape=(total, index.dim))
+    for start in range(0, len(index), index.block_rows):
+        stop = min(start + index.block_rows, len(index))
+        grown[start:stop] = index.embeddings[start:stop]
+    grown[len(index):] = codes
+    grown.flush()
+    del grown
+    
+    if scales is not None:
+        _atomic_save(path, SCALES_FILE, np.concatenate([index.scales, scales]))
+    os.replace(tmp_path, os.path.join(path, EMBEDDINGS_FILE))
+    _atomic_write_json(path, INDEX_LABELS_FILE, index.labels + list(labels))
+    logger.info(f"Appended {len(labels)} species to {path} ({total} total)")
+
+def _atomic_save(path: str, filename: str, array: np.ndarray):
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, os.path.join(path, filename))
+
+def _atomic_write_json(path: str, filename: str, data: Any):
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, os.path.join(path, filename))
\ No newline at end of file
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class InferenceQueueFull(Exception):
+    """Raised when the executor already holds as many jobs as it is allowed to queue"""
+
+class InferenceExecutor:
+    """Runs blocking decode/inference work off the event loop on a worker pool"""
+    
+    SUPPORTED_KINDS = ("thread", "process")
+    
+    def __init__(self, kind: str = "thread", max_workers: int = 4, queue_size: int = 32):
+        if kind not in self.SUPPORTED_KINDS:
+            raise ValueError(f"Unsupported executor kind: {kind}")
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        
+        self.kind = kind
+        self.max_workers = max_workers
+        self.queue_size = max(0, queue_size)
+        
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "total_run_time": 0.0
+        }
+    
+    @classmethod
+    def from_settings(cls) -> "InferenceExecutor":
+        return cls(
+            kind=settings.INFERENCE_EXECUTOR,
+            max_workers=settings.INFERENCE_WORKERS,
+            queue_size=settings.INFERENCE_QUEUE_SIZE
+        )
+    
+    @property
+    def capacity(self) -> int:
+        """Maximum number of jobs running or waiting at the same time"""
+        return self.max_workers + self.queue_size
+    
+    @property
+    def pending(self) -> int:
+        return self._pending
+    
+    def _get_pool(self) -> Executor:
+        # Pools are created on first use so importing the module stays cheap
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="inference"
+                    )
+                logger.info(f"Started {self.kind} inference pool with {self.max_workers} workers")
+            return self._pool
+    
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._stats["rejected"] += 1
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self._pending}/{self.capacity} jobs)"
+                )
+            self._pending += 1
+            self._stats["submitted"] += 1
+        
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats["total_run_time"] += time.perf_counter() - start_time
+        
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._stats["completed"] + self._stats["failed"]
+            avg_run_time = self._stats["total_run_time"] / finished if finished else 0.0
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "rejected": self._stats["rejected"],
+                "avg_run_time": round(avg_run_time, 4)
+            }
+    
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+            logger.info(f"Stopped {self.kind} inference pool")
+
+# Shared executor used by the identification endpoints
+inference_executor = InferenceExecutor.from_settings()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+from database import Identification, SessionLocal
+from ml.batching import _percentile
+from ml.predictions import SpeciesCodebook
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IdentificationWriter:
+    """Write-behind buffer for rows of the identifications table
+    
+    record() only appends to an in-memory buffer, so the request path never
+    waits on the database. The buffer is written with one bulk INSERT per flush,
+    either when max_batch records are waiting or every flush_interval seconds,
+    and stop() flushes whatever is left so a graceful shutdown loses nothing.
+    When the database falls behind, the buffer is capped at max_buffer and
+    further records are dropped and counted rather than applying backpressure.
+    Ranked (species code, confidence) pairs passed as "predictions" are packed
+    into the binary prediction_data column at flush time.
+    """
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000,
+        enabled: bool = True,
+        codebook: Optional[SpeciesCodebook] = None,
+        stats_window: int = 256
+    ):
+        self.session_factory = session_factory
+        self.codebook = codebook or SpeciesCodebook(session_factory)
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(self.max_batch, max_buffer)
+        self.enabled = enabled
+        
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._pending_flushes = set()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        self._latencies: Deque[float] = deque(maxlen=stats_window)
+        self._last_flush_at: Optional[datetime] = None
+        self._stats = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "failed_flushes": 0}
+    
+    @classmethod
+    def from_settings(cls) -> "IdentificationWriter":
+        return cls(
+            max_batch=settings.HISTORY_BATCH_SIZE,
+            flush_interval=settings.HISTORY_FLUSH_SECONDS,
+            max_buffer=settings.HISTORY_MAX_BUFFER,
+            enabled=settings.HISTORY_ENABLED
+        )
+    
+    def record(self, row: Dict[str, Any]):
+        """Queue one Identification row; a full batch schedules an early flush"""
+        if not self.enabled:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self._stats["dropped"] += 1
+            return
+        
+        self._buffer.append(row)
+        self._stats["recorded"] += 1
+        
+        if len(self._buffer) >= self.max_batch:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            task = loop.create_task(self.flush())
+            self._pending_flushes.add(task)
+            task.add_done_callback(self._pending_flushes.discard)
+    
+    # Database operations, run in threads
+    
+    def _insert(self, rows: List[Dict[str, Any]]):
+        db = self.session_factory()
+        try:
+            rows = [self._pack(row, db) for row in rows]
+            db.bulk_insert_mappings(Identification, rows)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _pack(self, row: Dict[str, Any], db) -> Dict[str, Any]:
+        if "predictions" not in row:
+            return row
+        row = dict(row)
+        row["prediction_data"] = self.codebook.encode(row.pop("predictions"), db)
+        return row
+    
+    def _lock(self) -> asyncio.Lock:
+        # Locks are bound to the loop that first uses them
+        loop = asyncio.get_running_loop()
+        if self._flush_lock is None or self._lock_loop is not loop:
+            self._flush_lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._flush_lock
+    
+    async def flush(self) -> int:
+        """Write every buffered record, returning how many rows were inserted"""
+        written = 0
+        async with self._lock():
+            while self._buffer:
+                rows = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                start = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self._insert, rows)
+                except Exception as e:
+                    self._stats["failed_flushes"] += 1
+                    # Put the rows back for the next flush, keeping the buffer bounded
+                    room = self.max_buffer - len(self._buffer)
+                    requeued = rows[:max(0, room)]
+                    self._buffer.extendleft(reversed(requeued))
+                    self._stats["dropped"] += len(rows) - len(requeued)
+                    logger.error(f"Failed to write {len(rows)} identification records: {e}")
+                    break
+                
+                self._latencies.append(time.perf_counter() - start)
+                self._last_flush_at = datetime.utcnow()
+                self._stats["flushes"] += 1
+                self._stats["written"] += len(rows)
+                written += len(rows)
+        return written
+    
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def start(self):
+        """Start the periodic flusher"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._flusher())
+    
+    async def stop(self):
+        """Stop the periodic flusher and write out the remaining records"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending_flushes:
+            await asyncio.gather(*self._pending_flushes, return_exceptions=True)
+        written = await self.flush()
+        if written:
+            logger.info(f"Flushed {written} identification records on shutdown")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "batch_size": self.max_batch,
+            **self._stats,
+            "flush_latency_ms": {
+                "p50": round(_percentile(latencies, 50) * 1000, 2),
+                "p95": round(_percentile(latencies, 95) * 1000, 2)
+            },
+            "last_flush_at": self._last_flush_at.isoformat() if self._last_flush_at else None
+        }
\ No newline at end of file
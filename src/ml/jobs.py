@@ -0,0 +1,309 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+from database import IdentificationJob, SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+class JobQueue:
+    """Persistent identification job queue backed by the identification_jobs table
+    
+    Jobs are claimed with a conditional UPDATE, so several worker processes can
+    share one database. A bounded pool of asyncio workers processes claimed jobs,
+    which keeps throughput governed by the pool and the inference executor rather
+    than by open HTTP connections. Jobs left in "processing" by a crashed worker
+    are requeued once they are older than stale_seconds, checked on start and
+    then every stale_seconds / 4 while the workers run. A job that has already
+    been claimed max_attempts times is marked failed instead, so a job that
+    keeps killing its worker is not retried forever.
+    """
+    
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        session_factory=SessionLocal,
+        workers: int = 4,
+        poll_seconds: float = 1.0,
+        stale_seconds: float = 300.0,
+        max_attempts: int = 3,
+        retry_exceptions: Tuple[Type[BaseException], ...] = ()
+    ):
+        self.process = process
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_exceptions = retry_exceptions
+        
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._stats = {"enqueued": 0, "completed": 0, "failed": 0, "retried": 0, "recovered": 0}
+        self._busy = 0
+        self._next_recovery = 0.0
+    
+    # Database operations, run in threads
+    
+    def _insert(self, job: IdentificationJob):
+        db = self.session_factory()
+        try:
+            db.add(job)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            while True:
+                candidate = (
+                    db.query(IdentificationJob.id)
+                    .filter(IdentificationJob.status == "pending", IdentificationJob.attempts < self.max_attempts)
+                    .order_by(IdentificationJob.created_at)
+                    .first()
+                )
+                if candidate is None:
+                    return None
+                
+                claimed = (
+                    db.query(IdentificationJob)
+                    .filter(IdentificationJob.id == candidate.id, IdentificationJob.status == "pending")
+                    .update({
+                        IdentificationJob.status: "processing",
+                        IdentificationJob.started_at: datetime.utcnow(),
+                        IdentificationJob.attempts: IdentificationJob.attempts + 1
+                    }, synchronize_session=False)
+                )
+                db.commit()
+                if claimed:
+                    job = db.get(IdentificationJob, candidate.id)
+                    return {
+                        "id": job.id,
+                        "user_id": job.user_id,
+                        "tier": job.tier,
+                        "filename": job.filename,
+                        "image_data": job.image_data,
+                        "attempts": job.attempts
+                    }
+                # Another worker won the race for this job, try the next one
+        finally:
+            db.close()
+    
+    def _update(self, job_id: str, values: Dict[str, Any]):
+        db = self.session_factory()
+        try:
+            db.query(IdentificationJob).filter(IdentificationJob.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _recover_stale(self) -> Tuple[int, int]:
+        """Requeue stale processing jobs with attempts left and fail the rest; returns (requeued, failed)"""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.stale_seconds)
+        db = self.session_factory()
+        try:
+            stale = (IdentificationJob.status == "processing", IdentificationJob.started_at < cutoff)
+            exhausted = IdentificationJob.attempts >= self.max_attempts
+            failed = (
+                db.query(IdentificationJob)
+                .filter(*stale, exhausted)
+                .update({
+                    IdentificationJob.status: "failed",
+                    IdentificationJob.error: f"Worker stopped during attempt {self.max_attempts} of {self.max_attempts}",
+                    IdentificationJob.image_data: None,
+                    IdentificationJob.completed_at: now
+                }, synchronize_session=False)
+            )
+            # Pending jobs that can no longer be claimed, e.g. after max_attempts was lowered
+            failed += (
+                db.query(IdentificationJob)
+                .filter(IdentificationJob.status == "pending", exhausted)
+                .update({
+                    IdentificationJob.status: "failed",
+                    IdentificationJob.error: f"Gave up after {self.max_attempts} attempts",
+                    IdentificationJob.image_data: None,
+                    IdentificationJob.completed_at: now
+                }, synchronize_session=False)
+            )
+            recovered = (
+                db.query(IdentificationJob)
+                .filter(*stale, ~exhausted)
+                .update({IdentificationJob.status: "pending"}, synchronize_session=False)
+            )
+            db.commit()
+            return recovered, failed
+        finally:
+            db.close()
+    
+    def _fetch(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            job = db.get(IdentificationJob, job_id)
+            if job is None:
+                return None
+            return {
+                "job_id": job.id,
+                "user_id": job.user_id,
+                "status": job.status,
+                "filename": job.filename,
+                "attempts": job.attempts,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "completed_at": job.completed_at,
+                "result": json.loads(job.result) if job.result else None,
+                "error": job.error
+            }
+        finally:
+            db.close()
+    
+    # Public API
+    
+    async def enqueue(self, image_data: bytes, filename: Optional[str], user_id: Optional[str], tier: Optional[str]) -> str:
+        """Persist a new job and wake a worker; returns the job id"""
+        job_id = str(uuid.uuid4())
+        await asyncio.to_thread(self._insert, IdentificationJob(
+            id=job_id,
+            user_id=user_id,
+            tier=tier or "free",
+            status="pending",
+            filename=filename,
+            image_data=image_data,
+            attempts=0,
+            created_at=datetime.utcnow()
+        ))
+        self._stats["enqueued"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._fetch, job_id)
+    
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll a job until it finishes or timeout seconds pass"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                self._finished.pop(job_id, None)
+                return job
+            
+            # Local workers signal completion; jobs run by other processes are polled
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, self.poll_seconds))
+            except asyncio.TimeoutError:
+                pass
+    
+    async def run_job(self, job: Dict[str, Any]):
+        """Process one claimed job and record its outcome"""
+        self._busy += 1
+        try:
+            result = await self.process(job)
+        except self.retry_exceptions as e:
+            if job["attempts"] < self.max_attempts:
+                logger.info(f"Requeueing job {job['id']} after attempt {job['attempts']}: {e}")
+                await asyncio.to_thread(self._update, job["id"], {IdentificationJob.status: "pending"})
+                self._stats["retried"] += 1
+                # Back off so a saturated executor is not hammered with the same job
+                await asyncio.sleep(self.poll_seconds)
+                return
+            await self._fail(job["id"], str(e))
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            await self._fail(job["id"], str(e))
+        else:
+            await asyncio.to_thread(self._update, job["id"], {
+                IdentificationJob.status: "completed",
+                IdentificationJob.result: json.dumps(result),
+                IdentificationJob.image_data: None,
+                IdentificationJob.completed_at: datetime.utcnow()
+            })
+            self._stats["completed"] += 1
+        finally:
+            self._busy -= 1
+        self._notify(job["id"])
+    
+    async def _fail(self, job_id: str, error: str):
+        await asyncio.to_thread(self._update, job_id, {
+            IdentificationJob.status: "failed",
+            IdentificationJob.error: error,
+            IdentificationJob.image_data: None,
+            IdentificationJob.completed_at: datetime.utcnow()
+        })
+        self._stats["failed"] += 1
+    
+    def _notify(self, job_id: str):
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+    
+    async def _recover(self):
+        """Requeue or fail stale jobs; run on start and periodically by whichever worker is due"""
+        self._next_recovery = time.monotonic() + max(self.poll_seconds, self.stale_seconds / 4)
+        try:
+            recovered, failed = await asyncio.to_thread(self._recover_stale)
+        except Exception as e:
+            logger.error(f"Could not recover stale identification jobs: {e}")
+            return
+        if recovered:
+            self._stats["recovered"] += recovered
+            logger.info(f"Requeued {recovered} stale identification jobs")
+            if self._wakeup is not None:
+                self._wakeup.set()
+        if failed:
+            self._stats["failed"] += failed
+            logger.warning(f"Failed {failed} identification jobs that ran out of attempts")
+    
+    async def _worker(self):
+        while True:
+            if time.monotonic() >= self._next_recovery:
+                await self._recover()
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                logger.error(f"Could not claim identification job: {e}")
+                job = None
+            
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            await self.run_job(job)
+    
+    async def start(self):
+        """Requeue stale jobs and start the worker pool"""
+        if self._tasks:
+            return
+        await self._recover()
+        
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} identification job workers")
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "busy": self._busy,
+            **self._stats
+        }
\ No newline at end of file
@@ -0,0 +1,490 @@
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image
+from config import settings
+from ml.preprocessing import Preprocessor
+from ml.embeddings import SpeciesEmbeddingIndex, normalize_rows, save_species_index, top_k_indices
+from ml.ann import IVFPQIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Species the mock backend picks from
+MOCK_SPECIES = [
+    {
+        "species_id": "dendrobium_nobile",
+        "scientific_name": "Dendrobium nobile",
+        "common_name": "Noble Dendrobium",
+        "family": "Orchidaceae",
+        "genus": "Dendrobium"
+    },
+    {
+        "species_id": "ficus_benjamina",
+        "scientific_name": "Ficus benjamina",
+        "common_name": "Weeping Fig",
+        "family": "Moraceae",
+        "genus": "Ficus"
+    },
+    {
+        "species_id": "hibiscus_rosa_sinensis",
+        "scientific_name": "Hibiscus rosa-sinensis",
+        "common_name": "Chinese Hibiscus",
+        "family": "Malvaceae",
+        "genus": "Hibiscus"
+    },
+    {
+        "species_id": "plumeria_rubra",
+        "scientific_name": "Plumeria rubra",
+        "common_name": "Frangipani",
+        "family": "Apocynaceae",
+        "genus": "Plumeria"
+    },
+    {
+        "species_id": "bougainvillea_spectabilis",
+        "scientific_name": "Bougainvillea spectabilis",
+        "common_name": "Great Bougainvillea",
+        "family": "Nyctaginaceae",
+        "genus": "Bougainvillea"
+    }
+]
+
+MANIFEST_FILE = "model.json"
+WEIGHTS_FILE = "weights.npy"
+BIAS_FILE = "bias.npy"
+LABELS_FILE = "labels.json"
+PROJECTION_FILE = "projection.npy"
+SPECIES_INDEX_DIR = "species_index"
+OBSERVATIONS_DIR = "observations"
+
+class ModelNotAvailable(Exception):
+    """Raised when a model backend could not be loaded"""
+
+# Backends rebuilt inside worker processes, one per (class, constructor arguments)
+_process_backends: Dict[Tuple, "ModelBackend"] = {}
+_process_backends_lock = threading.Lock()
+
+def _restore_backend(cls, kwargs: Dict[str, Any]) -> "ModelBackend":
+    key = (cls, tuple(sorted(kwargs.items())))
+    with _process_backends_lock:
+        backend = _process_backends.get(key)
+        if backend is None:
+            backend = _process_backends[key] = cls(**kwargs)
+    return backend
+
+class ModelBackend(ABC):
+    """Interface for identification models
+    
+    Backends predict on preprocessed (N, 3, H, W) float32 batches and return, per
+    image, the top species as dicts with species fields and a confidence.
+    Loading is idempotent and thread-safe; unless load() is called up front the
+    model is loaded and warmed up by the first prediction.
+    """
+    
+    name = "base"
+    
+    def __init__(self, version: str, top_k: int = 3, warmup_iterations: int = 2, input_size: int = 224):
+        self.version = version
+        self.top_k = top_k
+        self.warmup_iterations = warmup_iterations
+        self.input_size = input_size
+        self.preprocessor = Preprocessor(size=input_size)
+        
+        self.state = "unloaded"  # unloaded, loading, ready, failed
+        self.load_time: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._load_lock = threading.Lock()
+    
+    def _init_kwargs(self) -> Dict[str, Any]:
+        """Constructor arguments used to rebuild this backend in another process"""
+        return {
+            "top_k": self.top_k,
+            "warmup_iterations": self.warmup_iterations,
+            "input_size": self.input_size
+        }
+    
+    def __reduce__(self):
+        # Process pools pickle the bound predict method; ship the recipe, not the weights
+        return _restore_backend, (self.__class__, self._init_kwargs())
+    
+    @abstractmethod
+    def _load(self):
+        """Load weights into memory"""
+    
+    @abstractmethod
+    def _forward(self, batch: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """Predict top species for a preprocessed batch"""
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+    
+    def load(self):
+        """Load and warm up the model if that has not happened yet"""
+        if self.state == "ready":
+            return
+        with self._load_lock:
+            if self.state == "ready":
+                return
+            self.state = "loading"
+            start_time = time.perf_counter()
+            try:
+                self._load()
+                self.load_time = time.perf_counter() - start_time
+                self.warm_up()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logger.error(f"Failed to load {self.name} model {self.version}: {e}")
+                raise ModelNotAvailable(f"Model {self.version} is not available: {e}") from e
+            self.state = "ready"
+            self.error = None
+            self.loaded_at = time.time()
+            logger.info(
+                f"Loaded {self.name} model {self.version} in {self.load_time:.3f}s "
+                f"(warm-up {self.warmup_time:.3f}s)"
+            )
+    
+    def warm_up(self):
+        """Run throwaway inferences so lazy allocations and page faults happen now"""
+        start_time = time.perf_counter()
+        dummy = np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32)
+        for _ in range(self.warmup_iterations):
+            self._forward(dummy)
+        self.warmup_time = time.perf_counter() - start_time
+    
+    def predict_batch(self, batch: Union[np.ndarray, List[Image.Image]]) -> List[List[Dict[str, Any]]]:
+        """Predict a preprocessed (N, 3, H, W) float32 tensor or a list of decoded images"""
+        self.load()
+        if not isinstance(batch, np.ndarray):
+            batch = self.preprocessor(batch)
+        return self._forward(batch)
+    
+    def predict(self, image: Image.Image) -> List[Dict[str, Any]]:
+        return self.predict_batch([image])[0]
+    
+    def predict_augmented(self, images: List[Image.Image], views: int) -> List[List[Dict[str, Any]]]:
+        """Predict each image from views test-time augmented views run as one batch"""
+        self.load()
+        return self._forward_views(self.preprocessor.augment(images, views), views)
+    
+    def _forward_views(self, batch: np.ndarray, views: int) -> List[List[Dict[str, Any]]]:
+        """Predict groups of views consecutive rows that show the same image
+        
+        Backends with logits average them per group; this fallback predicts the
+        un-augmented first view only.
+        """
+        return self._forward(batch[::views])
+    
+    @property
+    def has_observations(self) -> bool:
+        """Whether this model can look up similar past observations"""
+        return False
+    
+    def similar_observations(self, batch: Union[np.ndarray, List[Image.Image]], k: int) -> List[List[Dict[str, Any]]]:
+        """Past identifications whose images are closest to each input"""
+        raise NotImplementedError(f"{self.name} models do not index observations")
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "version": self.version,
+            "state": self.state,
+            "load_time": round(self.load_time, 4) if self.load_time is not None else None,
+            "warmup_time": round(self.warmup_time, 4) if self.warmup_time is not None else None,
+            "loaded_at": self.loaded_at,
+            "error": self.error
+        }
+
+class MockModelBackend(ModelBackend):
+    """Returns random species with plausible confidence scores"""
+    
+    name = "mock"
+    
+    def __init__(self, version: str = "mock-v1.0", top_k: int = 3, warmup_iterations: int = 0, input_size: int = 224):
+        super().__init__(version, top_k=top_k, warmup_iterations=warmup_iterations, input_size=input_size)
+        self.species = MOCK_SPECIES
+    
+    def _init_kwargs(self) -> Dict[str, Any]:
+        return {"version": self.version, **super()._init_kwargs()}
+    
+    def _load(self):
+        pass
+    
+    def _forward(self, batch: np.ndarray) -> List[List[Dict[str, Any]]]:
+        # Simulate processing time, paid once per batch like a real batched forward pass
+        time.sleep(0.1)
+        return [self._mock_results() for _ in range(batch.shape[0])]
+    
+    def _mock_results(self) -> List[Dict[str, Any]]:
+        results = []
+        selected_species = random.sample(self.species, min(self.top_k, len(self.species)))
+        
+        for i, species in enumerate(selected_species):
+            confidence = random.uniform(0.6, 0.95) if i == 0 else random.uniform(0.3, 0.7)
+            results.append({**species, "confidence": round(confidence, 3)})
+        
+        # Sort by confidence
+        results.sort(key=lambda x: x["confidence"], reverse=True)
+        return results
+
+class CPUModelBackend(ModelBackend):
+    """Linear classifier over block-pooled pixels, loaded from a model directory
+    
+    The directory holds model.json ({"version": ..., "grid": G}), weights.npy with
+    shape (3 * G * G, num_species), an optional bias.npy and labels.json with one
+    species dict per column. Weights are memory-mapped, so workers share the page
+    cache instead of each holding a private copy.
+    """
+    
+    name = "cpu"
+    
+    def __init__(self, model_path: str, top_k: int = 3, warmup_iterations: int = 2, input_size: int = 224):
+        self.model_path = model_path
+        self.manifest = read_manifest(model_path)
+        super().__init__(
+            self.manifest.get("version", "unversioned"),
+            top_k=top_k,
+            warmup_iterations=warmup_iterations,
+            input_size=input_size
+        )
+        self.grid = int(self.manifest.get("grid", 8))
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+        self.labels: List[Dict[str, Any]] = []
+    
+    def _init_kwargs(self) -> Dict[str, Any]:
+        return {"model_path": self.model_path, **super()._init_kwargs()}
+    
+    def _load(self):
+        weights = np.load(os.path.join(self.model_path, WEIGHTS_FILE), mmap_mode="r")
+        bias_path = os.path.join(self.model_path, BIAS_FILE)
+        bias = np.load(bias_path) if os.path.exists(bias_path) else np.zeros(weights.shape[1], dtype=np.float32)
+        with open(os.path.join(self.model_path, LABELS_FILE), "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        
+        expected_features = 3 * self.grid * self.grid
+        if weights.ndim != 2 or weights.shape[0] != expected_features:
+            raise ValueError(f"weights must have shape ({expected_features}, num_species), got {weights.shape}")
+        if len(labels) != weights.shape[1] or bias.shape != (weights.shape[1],):
+            raise ValueError("labels and bias must have one entry per weight column")
+        if self.input_size % self.grid:
+            raise ValueError(f"input size {self.input_size} is not divisible by grid {self.grid}")
+        
+        self.weights, self.bias, self.labels = weights, bias.astype(np.float32), labels
+    
+    def features(self, batch: np.ndarray) -> np.ndarray:
+        return block_pool(batch, self.grid)
+    
+    def _logits(self, batch: np.ndarray) -> np.ndarray:
+        return self.features(batch) @ self.weights + self.bias
+    
+    def _forward(self, batch: np.ndarray) -> List[List[Dict[str, Any]]]:
+        return top_k_results(softmax(self._logits(batch)), self.labels, self.top_k)
+    
+    def _forward_views(self, batch: np.ndarray, views: int) -> List[List[Dict[str, Any]]]:
+        logits = self._logits(batch)
+        logits = logits.reshape(-1, views, logits.shape[1]).mean(axis=1)
+        return top_k_results(softmax(logits), self.labels, self.top_k)
+
+class EmbeddingModelBackend(ModelBackend):
+    """Nearest-prototype identification over a species embedding index
+    
+    The model directory holds model.json ({"version": ..., "grid": G}),
+    projection.npy with shape (3 * G * G, D) mapping block-pooled pixels to a
+    D-dimensional image embedding, and a species_index/ directory (see
+    SpeciesEmbeddingIndex). Confidence is the cosine similarity to the species
+    prototype, so new species are added by appending index rows, not retraining.
+    An optional observations/ directory holds an IVF-PQ index (see ml.ann) of
+    past identification embeddings, keyed by identification id.
+    """
+    
+    name = "embedding"
+    
+    def __init__(self, model_path: str, top_k: int = 3, warmup_iterations: int = 2, input_size: int = 224):
+        self.model_path = model_path
+        self.manifest = read_manifest(model_path)
+        super().__init__(
+            self.manifest.get("version", "unversioned"),
+            top_k=top_k,
+            warmup_iterations=warmup_iterations,
+            input_size=input_size
+        )
+        self.grid = int(self.manifest.get("grid", 8))
+        self.projection: Optional[np.ndarray] = None
+        self.index: Optional[SpeciesEmbeddingIndex] = None
+        self.observations: Optional[IVFPQIndex] = None
+    
+    def _init_kwargs(self) -> Dict[str, Any]:
+        return {"model_path": self.model_path, **super()._init_kwargs()}
+    
+    def _load(self):
+        projection = np.load(os.path.join(self.model_path, PROJECTION_FILE), mmap_mode="r")
+        index = SpeciesEmbeddingIndex(os.path.join(self.model_path, SPECIES_INDEX_DIR))
+        
+        expected_features = 3 * self.grid * self.grid
+        if projection.ndim != 2 or projection.shape[0] != expected_features:
+            raise ValueError(f"projection must have shape ({expected_features}, dim), got {projection.shape}")
+        if projection.shape[1] != index.dim:
+            raise ValueError(f"projection outputs {projection.shape[1]} dimensions, species index has {index.dim}")
+        if self.input_size % self.grid:
+            raise ValueError(f"input size {self.input_size} is not divisible by grid {self.grid}")
+        
+        observations_path = os.path.join(self.model_path, OBSERVATIONS_DIR)
+        observations = IVFPQIndex.load(observations_path) if os.path.isdir(observations_path) else None
+        if observations is not None and observations.dim != index.dim:
+            raise ValueError(f"observation index has {observations.dim} dimensions, species index has {index.dim}")
+        
+        self.projection, self.index, self.observations = projection, index, observations
+    
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """L2-normalized image embeddings for a preprocessed batch"""
+        self.load()
+        return self._embed(batch)
+    
+    def _embed(self, batch: np.ndarray) -> np.ndarray:
+        return normalize_rows(block_pool(batch, self.grid) @ self.projection)
+    
+    def _forward(self, batch: np.ndarray) -> List[List[Dict[str, Any]]]:
+        return self._results(*self.index.search(self._embed(batch), self.top_k))
+    
+    def _forward_views(self, batch: np.ndarray, views: int) -> List[List[Dict[str, Any]]]:
+        # Cosine similarities play the role of logits and are averaged across views
+        similarities = self.index.similarities(self._embed(batch))
+        similarities = similarities.reshape(-1, views, similarities.shape[1]).mean(axis=1)
+        return self._results(*top_k_indices(similarities, self.top_k))
+    
+    def _results(self, indices: np.ndarray, similarities: np.ndarray) -> List[List[Dict[str, Any]]]:
+        return [
+            [
+                {**self.index.labels[i], "confidence": round(max(0.0, float(similarity)), 3)}
+                for i, similarity in zip(row_indices, row_similarities)
+            ]
+            for row_indices, row_similarities in zip(indices, similarities)
+        ]
+    
+    @property
+    def has_observations(self) -> bool:
+        # Checked on disk so unloaded managers (e.g. with a process pool) know too
+        return os.path.isdir(os.path.join(self.model_path, OBSERVATIONS_DIR))
+    
+    def similar_observations(self, batch: Union[np.ndarray, List[Image.Image]], k: int) -> List[List[Dict[str, Any]]]:
+        self.load()
+        if self.observations is None:
+            return super().similar_observations(batch, k)
+        if not isinstance(batch, np.ndarray):
+            batch = self.preprocessor(batch)
+        ids, similarities = self.observations.search(self._embed(batch), k)
+        return [
+            [
+                {"identification_id": int(i), "similarity": round(float(similarity), 3)}
+                for i, similarity in zip(row_ids, row_similarities)
+                if i >= 0
+            ]
+            for row_ids, row_similarities in zip(ids, similarities)
+        ]
+    
+    def get_status(self) -> Dict[str, Any]:
+        status = super().get_status()
+        if self.index is not None:
+            status["species_index"] = self.index.get_status()
+        if self.observations is not None:
+            status["observations"] = self.observations.get_status()
+        return status
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities
+
+def block_pool(batch: np.ndarray, grid: int) -> np.ndarray:
+    """Mean-pool each channel over a grid x grid layout of blocks"""
+    n, c, h, w = batch.shape
+    block_h, block_w = h // grid, w // grid
+    pooled = batch.reshape(n, c, grid, block_h, grid, block_w).mean(axis=(3, 5))
+    return pooled.reshape(n, -1)
+
+def top_k_results(scores: np.ndarray, labels: Sequence[Dict[str, Any]], k: int) -> List[List[Dict[str, Any]]]:
+    """Turn an (N, num_species) score matrix into sorted top-k species dicts per row"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    results = []
+    for row, indices in zip(scores, top):
+        indices = indices[np.argsort(-row[indices])]
+        results.append([
+            {**labels[i], "confidence": round(float(row[i]), 3)}
+            for i in indices
+        ])
+    return results
+
+def read_manifest(model_path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(model_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_linear_model(
+    model_path: str,
+    weights: np.ndarray,
+    labels: List[Dict[str, Any]],
+    version: str,
+    grid: int = 8,
+    bias: Optional[np.ndarray] = None
+):
+    """Write a model directory that CPUModelBackend can load"""
+    os.makedirs(model_path, exist_ok=True)
+    np.save(os.path.join(model_path, WEIGHTS_FILE), np.ascontiguousarray(weights, dtype=np.float32))
+    if bias is not None:
+        np.save(os.path.join(model_path, BIAS_FILE), np.asarray(bias, dtype=np.float32))
+    with open(os.path.join(model_path, LABELS_FILE), "w", encoding="utf-8") as f:
+        json.dump(labels, f)
+    with open(os.path.join(model_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "grid": grid}, f)
+
+def save_embedding_model(
+    model_path: str,
+    projection: np.ndarray,
+    prototypes: np.ndarray,
+    labels: List[Dict[str, Any]],
+    version: str,
+    grid: int = 8,
+    dtype: str = "float16"
+):
+    """Write a model directory that EmbeddingModelBackend can load"""
+    os.makedirs(model_path, exist_ok=True)
+    np.save(os.path.join(model_path, PROJECTION_FILE), np.ascontiguousarray(projection, dtype=np.float32))
+    save_species_index(os.path.join(model_path, SPECIES_INDEX_DIR), prototypes, labels, dtype=dtype)
+    with open(os.path.join(model_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "grid": grid}, f)
+
+def create_model_backend(backend: str = None, model_path: str = None) -> ModelBackend:
+    """Build the configured model backend without loading it"""
+    backend = backend or settings.MODEL_BACKEND
+    options = {
+        "top_k": settings.MODEL_TOP_K,
+        "input_size": settings.MODEL_INPUT_SIZE
+    }
+    if backend == "mock":
+        return MockModelBackend(**options)
+    if backend == "cpu":
+        return CPUModelBackend(
+            model_path or settings.MODEL_PATH,
+            warmup_iterations=settings.MODEL_WARMUP_ITERATIONS,
+            **options
+        )
+    if backend == "embedding":
+        return EmbeddingModelBackend(
+            model_path or settings.MODEL_PATH,
+            warmup_iterations=settings.MODEL_WARMUP_ITERATIONS,
+            **options
+        )
+    raise ValueError(f"Unsupported model backend: {backend}")
\ No newline at end of file
@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance as the metric"""
+    
+    def __init__(self):
+        # node = [hash, value, {distance: child node}]
+        self._root: Optional[list] = None
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def add(self, hash_value: int, value: Any):
+        if self._root is None:
+            self._root = [hash_value, value, {}]
+            self._size = 1
+            return
+        
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, value, {}]
+                self._size += 1
+                return
+            node = child
+    
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, int, Any]]:
+        """Return (distance, hash, value) for every entry within max_distance, closest first"""
+        if self._root is None:
+            return []
+        
+        matches = []
+        candidates = [self._root]
+        while candidates:
+            node = candidates.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[0], node[1]))
+            # Triangle inequality: only children in [d - max, d + max] can hold matches
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+        
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+class NearDuplicateIndex:
+    """Bounded perceptual-hash index mapping image fingerprints to result cache digests
+    
+    BK-trees do not support removal, so once max_entries is exceeded the tree is
+    rebuilt from the most recently added half of the entries.
+    """
+    
+    def __init__(self, max_distance: int = 6, max_entries: int = 100000):
+        self.max_distance = max(0, min(HASH_BITS, max_distance))
+        self.max_entries = max(1, max_entries)
+        
+        self._tree = BKTree()
+        self._entries: "OrderedDict[int, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "rebuilds": 0}
+    
+    @classmethod
+    def from_settings(cls) -> "NearDuplicateIndex":
+        max_distance = int((1 - settings.PHASH_MIN_SIMILARITY) * HASH_BITS)
+        return cls(max_distance=max_distance, max_entries=settings.PHASH_INDEX_MAX_ENTRIES)
+    
+    def add(self, hash_value: int, digest: str):
+        with self._lock:
+            self._entries[hash_value] = digest
+            self._entries.move_to_end(hash_value)
+            self._tree.add(hash_value, digest)
+            
+            if len(self._entries) > self.max_entries:
+                keep = list(self._entries.items())[-(self.max_entries // 2 or 1):]
+                self._entries = OrderedDict(keep)
+                self._tree = BKTree()
+                for kept_hash, kept_digest in keep:
+                    self._tree.add(kept_hash, kept_digest)
+                self._stats["rebuilds"] += 1
+    
+    def lookup(self, hash_value: int) -> Optional[Tuple[str, float]]:
+        """Return (digest, similarity) of the closest indexed image within max_distance"""
+        with self._lock:
+            self._stats["lookups"] += 1
+            matches = self._tree.search(hash_value, self.max_distance)
+            if not matches:
+                return None
+            self._stats["hits"] += 1
+            distance, _, digest = matches[0]
+            return digest, 1 - distance / HASH_BITS
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "min_similarity": round(1 - self.max_distance / HASH_BITS, 4),
+                **self._stats
+            }
\ No newline at end of file
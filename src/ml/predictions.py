@@ -0,0 +1,207 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from database import Identification, SessionLocal, SpeciesCode
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One ranked candidate: a species_codes id and its confidence, 4 bytes little-endian
+PREDICTION_DTYPE = np.dtype([("species", "<u2"), ("confidence", "<f2")])
+MAX_SPECIES_CODES = np.iinfo(np.uint16).max
+
+def encode_predictions(indices: Sequence[int], confidences: Sequence[float]) -> bytes:
+    """Pack ranked predictions into the prediction_data BLOB format
+    
+    A row is its candidates in rank order, each a uint16 species_codes id followed
+    by a float16 confidence, so rows concatenate into one fixed-width array.
+    """
+    if len(indices) != len(confidences):
+        raise ValueError("indices and confidences must have the same length")
+    indices = np.asarray(indices, dtype=np.int64)
+    # uint16 would silently wrap larger ids onto other species
+    if len(indices) and (indices.min() < 0 or indices.max() > MAX_SPECIES_CODES):
+        raise ValueError(f"species_codes ids must be between 0 and {MAX_SPECIES_CODES}")
+    records = np.empty(len(indices), dtype=PREDICTION_DTYPE)
+    records["species"] = indices
+    records["confidence"] = confidences
+    return records.tobytes()
+
+def decode_predictions(blob: Optional[bytes]) -> np.ndarray:
+    """Unpack one prediction_data BLOB into a structured array of (species, confidence)"""
+    if not blob:
+        return np.empty(0, dtype=PREDICTION_DTYPE)
+    if len(blob) % PREDICTION_DTYPE.itemsize:
+        raise ValueError(f"prediction_data length {len(blob)} is not a multiple of {PREDICTION_DTYPE.itemsize}")
+    return np.frombuffer(blob, dtype=PREDICTION_DTYPE)
+
+def decode_many(blobs: Iterable[Optional[bytes]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Unpack many BLOBs at once into their candidates and the rank of each candidate
+    
+    The rows are joined and viewed as one array instead of being decoded one by one.
+    """
+    blobs = [blob for blob in blobs if blob]
+    if not blobs:
+        return np.empty(0, dtype=PREDICTION_DTYPE), np.empty(0, dtype=np.int64)
+    records = decode_predictions(b"".join(blobs))
+    lengths = np.fromiter((len(blob) // PREDICTION_DTYPE.itemsize for blob in blobs), dtype=np.int64, count=len(blobs))
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return records, np.arange(len(records)) - starts
+
+class SpeciesCodebook:
+    """Two-way mapping between species codes and their small species_codes ids
+    
+    Ids are assigned on first use and never change, so packed rows stay readable
+    across model versions. The mapping is cached in memory; new codes are committed
+    on their own before the rows that reference them.
+    """
+    
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._ids: Dict[str, int] = {}
+        self._codes: Dict[int, str] = {}
+        self._lock = threading.Lock()
+    
+    def _load(self, db):
+        for row in db.query(SpeciesCode.id, SpeciesCode.code):
+            self._ids[row.code] = row.id
+            self._codes[row.id] = row.code
+    
+    def ids(self, codes: Iterable[str], db=None) -> List[int]:
+        """Ids for the given codes, registering the ones seen for the first time"""
+        codes = list(codes)
+        with self._lock:
+            missing = {code for code in codes if code not in self._ids}
+            if missing:
+                self._register(missing, db)
+            return [self._ids[code] for code in codes]
+    
+    def _register(self, codes: set, db=None):
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            for attempt in range(3):
+                self._load(db)
+                new = sorted(codes - self._ids.keys())
+                if not new:
+                    break
+                if len(self._ids) + len(new) > MAX_SPECIES_CODES:
+                    raise ValueError(f"species_codes is limited to {MAX_SPECIES_CODES} codes")
+                try:
+                    db.add_all([SpeciesCode(code=code) for code in new])
+                    db.commit()
+                except IntegrityError:
+                    # Another process registered some of them first; reload and retry the rest
+                    db.rollback()
+                    if attempt == 2:
+                        raise
+            self._load(db)
+            # Ids come from the database sequence, which can skip values, so check them and not just the count
+            too_large = sorted(code for code in codes if self._ids.get(code, 0) > MAX_SPECIES_CODES)
+            if too_large:
+                raise ValueError(f"species_codes ids above {MAX_SPECIES_CODES} cannot be packed: {', '.join(too_large)}")
+        finally:
+            if own_session:
+                db.close()
+    
+    def codes(self, ids: Iterable[int], db=None) -> List[Optional[str]]:
+        """Codes for the given ids, or None for ids that were never assigned"""
+        ids = [int(i) for i in ids]
+        with self._lock:
+            if any(i not in self._codes for i in ids):
+                own_session = db is None
+                session = db or self.session_factory()
+                try:
+                    self._load(session)
+                finally:
+                    if own_session:
+                        session.close()
+            return [self._codes.get(i) for i in ids]
+    
+    def encode(self, predictions: Sequence[Tuple[str, float]], db=None) -> bytes:
+        """Pack ranked (species code, confidence) pairs"""
+        return encode_predictions(
+            self.ids((code for code, _ in predictions), db),
+            [confidence for _, confidence in predictions]
+        )
+    
+    def decode(self, blob: Optional[bytes], db=None) -> List[Dict[str, Any]]:
+        """Unpack a BLOB into ranked {"species_id", "confidence"} dicts"""
+        records = decode_predictions(blob)
+        codes = self.codes(records["species"], db)
+        return [
+            {"species_id": code, "confidence": round(float(confidence), 3)}
+            for code, confidence in zip(codes, records["confidence"])
+        ]
+
+def _since(query, since: Optional[datetime]):
+    return query.filter(Identification.created_at >= since) if since is not None else query
+
+def top_species_counts(db, since: Optional[datetime] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most identified species by top prediction, aggregated in SQL over the indexed columns"""
+    count = func.count(Identification.id)
+    rows = (
+        _since(db.query(Identification.species_code, count, func.avg(Identification.confidence_score)), since)
+        .filter(Identification.species_code.isnot(None))
+        .group_by(Identification.species_code)
+        .order_by(count.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"species_id": code, "identifications": total, "mean_confidence": round(float(mean), 3)}
+        for code, total, mean in rows
+    ]
+
+def candidate_statistics(
+    db,
+    codebook: SpeciesCodebook,
+    since: Optional[datetime] = None,
+    limit: int = 20,
+    chunk_rows: int = 10000
+) -> List[Dict[str, Any]]:
+    """How often each species appears among the ranked candidates, with its mean confidence
+    
+    BLOBs are read in chunks and decoded a chunk at a time, with counts and
+    confidence sums accumulated by species id, so memory stays bounded by chunk_rows.
+    """
+    counts = np.zeros(0, dtype=np.int64)
+    top1 = np.zeros(0, dtype=np.int64)
+    sums = np.zeros(0, dtype=np.float64)
+    
+    def accumulate(blobs: List[bytes]):
+        nonlocal counts, top1, sums
+        records, ranks = decode_many(blobs)
+        if not len(records):
+            return
+        species = records["species"]
+        size = max(len(counts), int(species.max()) + 1)
+        counts = np.pad(counts, (0, size - len(counts))) + np.bincount(species, minlength=size)
+        top1 = np.pad(top1, (0, size - len(top1))) + np.bincount(species[ranks == 0], minlength=size)
+        sums = np.pad(sums, (0, size - len(sums))) + np.bincount(
+            species, weights=records["confidence"].astype(np.float64), minlength=size
+        )
+    
+    query = _since(db.query(Identification.prediction_data), since).filter(Identification.prediction_data.isnot(None))
+    chunk = []
+    for (blob,) in query.yield_per(chunk_rows):
+        chunk.append(blob)
+        if len(chunk) >= chunk_rows:
+            accumulate(chunk)
+            chunk = []
+    accumulate(chunk)
+    
+    order = [i for i in np.argsort(-counts, kind="stable")[:limit] if counts[i]]
+    codes = codebook.codes(order, db)
+    return [
+        {
+            "species_id": code,
+            "candidate_count": int(counts[i]),
+            "top1_count": int(top1[i]),
+            "mean_confidence": round(float(sums[i] / counts[i]), 3)
+        }
+        for code, i in zip(codes, order)
+    ]
\ No newline at end of file
@@ -0,0 +1,124 @@
+import threading
+from typing import List, Sequence
+import numpy as np
+from PIL import Image
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ImageNet channel statistics, the usual normalization for CNN backbones
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Test-time augmentation views as (crop position, horizontal flip), in the order
+# they are used; asking for n views takes the first n
+TTA_VIEWS = (
+    ("center", False),
+    ("center", True),
+    ("top_left", False),
+    ("top_right", False),
+    ("bottom_left", False),
+    ("bottom_right", False),
+    ("top_left", True),
+    ("top_right", True),
+    ("bottom_left", True),
+    ("bottom_right", True)
+)
+
+# Augmented crops cover this fraction of the image side, as in the usual 224-of-256 crop
+TTA_CROP_FRACTION = 0.875
+
+class Preprocessor:
+    """Turns decoded RGB images into a contiguous float32 NCHW batch tensor
+    
+    Resize and center-crop run in PIL's C code; normalization and the HWC to
+    CHW reorder are fused into two NumPy ufunc passes that write straight into
+    a preallocated batch buffer. Buffers are per thread, so the returned tensor
+    is only valid until the same thread preprocesses the next batch.
+    """
+    
+    def __init__(
+        self,
+        size: int = 224,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD
+    ):
+        self.size = size
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        # (x / 255 - mean) / std == x * scale - offset
+        self._scale = (1.0 / (255.0 * std)).reshape(3, 1, 1)
+        self._offset = (mean / std).reshape(3, 1, 1)
+        self._local = threading.local()
+    
+    @classmethod
+    def from_settings(cls) -> "Preprocessor":
+        return cls(size=settings.MODEL_INPUT_SIZE)
+    
+    def _buffer(self, batch_size: int) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.empty((batch_size, 3, self.size, self.size), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+    
+    def resize_and_crop(self, image: Image.Image, size: int = None) -> Image.Image:
+        """Scale the shorter side to size and cut the centered size x size square"""
+        size = size or self.size
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        
+        width, height = image.size
+        if min(width, height) != size:
+            scale = size / min(width, height)
+            width, height = max(size, round(width * scale)), max(size, round(height * scale))
+            image = image.resize((width, height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        
+        left = (width - size) // 2
+        top = (height - size) // 2
+        if (width, height) != (size, size):
+            image = image.crop((left, top, left + size, top + size))
+        return image
+    
+    def __call__(self, images: List[Image.Image]) -> np.ndarray:
+        """Preprocess images into a (N, 3, size, size) float32 batch"""
+        batch = self._buffer(len(images))
+        for i, image in enumerate(images):
+            pixels = np.asarray(self.resize_and_crop(image))  # HWC uint8
+            out = batch[i]
+            np.multiply(pixels.transpose(2, 0, 1), self._scale, out=out)
+            np.subtract(out, self._offset, out=out)
+        return batch
+    
+    def augment(self, images: List[Image.Image], views: int) -> np.ndarray:
+        """Preprocess each image into views consecutive TTA views, a (N * views, 3, size, size) batch
+        
+        Each image is resized and normalized once at the larger TTA size; the
+        crops and flips are then strided slices of that array, copied straight
+        into the batch buffer.
+        """
+        if not 1 <= views <= len(TTA_VIEWS):
+            raise ValueError(f"views must be between 1 and {len(TTA_VIEWS)}")
+        
+        full_size = max(self.size, round(self.size / TTA_CROP_FRACTION))
+        margin = full_size - self.size
+        offsets = {
+            "center": (margin // 2, margin // 2),
+            "top_left": (0, 0),
+            "top_right": (0, margin),
+            "bottom_left": (margin, 0),
+            "bottom_right": (margin, margin)
+        }
+        
+        batch = self._buffer(len(images) * views)
+        normalized = np.empty((3, full_size, full_size), dtype=np.float32)
+        for i, image in enumerate(images):
+            pixels = np.asarray(self.resize_and_crop(image, full_size))
+            np.multiply(pixels.transpose(2, 0, 1), self._scale, out=normalized)
+            np.subtract(normalized, self._offset, out=normalized)
+            for v, (position, flip) in enumerate(TTA_VIEWS[:views]):
+                top, left = offsets[position]
+                crop = normalized[:, top:top + self.size, left:left + self.size]
+                batch[i * views + v] = crop[:, :, ::-1] if flip else crop
+        return batch
\ No newline at end of file
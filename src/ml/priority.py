@@ -0,0 +1,244 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from config import settings
+from ml.batching import _percentile
+from ml.executor import InferenceQueueFull
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first
+TIER_PRIORITY = ("partner", "enterprise", "professional", "free")
+
+SHED_REASONS = ("queue_full", "deadline", "expired")
+
+class AdmissionRejected(InferenceQueueFull):
+    """Raised when a request is shed instead of queued for an inference slot"""
+    
+    def __init__(self, message: str, reason: str, retry_after: int = 1):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TierScheduler:
+    """Strict-priority admission to inference, keyed on the caller's tier
+    
+    At most max_concurrency identifications run at once. When a slot frees up it
+    goes to the oldest waiter of the highest-priority tier that is still under its
+    own concurrency cap, so a free-tier burst can never hold the slots paid tiers
+    need. Each tier also has a bounded wait queue; arrivals beyond it are shed
+    with AdmissionRejected instead of piling up in memory.
+    
+    Callers may pass a deadline (a time.monotonic() value). Requests whose
+    estimated queue wait already exceeds it are rejected up front, and requests
+    still queued when it passes are dropped from the queue.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        tier_limits: Optional[Dict[str, int]] = None,
+        queue_limits: Optional[Dict[str, int]] = None,
+        stats_window: int = 1000,
+        service_time_alpha: float = 0.2
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        
+        self.max_concurrency = max_concurrency
+        tier_limits = tier_limits or {}
+        queue_limits = queue_limits or {}
+        self.tier_limits = {tier: max(1, min(tier_limits.get(tier, max_concurrency), max_concurrency)) for tier in TIER_PRIORITY}
+        self.queue_limits = {tier: max(0, queue_limits.get(tier, max_concurrency)) for tier in TIER_PRIORITY}
+        
+        self._active_total = 0
+        self._active = {tier: 0 for tier in TIER_PRIORITY}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {tier: deque() for tier in TIER_PRIORITY}
+        self._stats = {tier: {"admitted": 0, "queued": 0} for tier in TIER_PRIORITY}
+        self._shed = {tier: {reason: 0 for reason in SHED_REASONS} for tier in TIER_PRIORITY}
+        # Exponentially weighted average of how long a slot is held
+        self.service_time_alpha = service_time_alpha
+        self._service_time: Optional[float] = None
+        self._granted_at: Dict[str, Deque[float]] = {tier: deque() for tier in TIER_PRIORITY}
+        self._queue_waits: Dict[str, Deque[float]] = {tier: deque(maxlen=stats_window) for tier in TIER_PRIORITY}
+    
+    @classmethod
+    def from_settings(cls) -> "TierScheduler":
+        return cls(
+            max_concurrency=settings.TIER_MAX_CONCURRENCY,
+            tier_limits={
+                "free": settings.TIER_CONCURRENCY_FREE,
+                "professional": settings.TIER_CONCURRENCY_PROFESSIONAL,
+                "enterprise": settings.TIER_CONCURRENCY_ENTERPRISE,
+                "partner": settings.TIER_CONCURRENCY_PARTNER
+            },
+            queue_limits={
+                "free": settings.TIER_QUEUE_FREE,
+                "professional": settings.TIER_QUEUE_PROFESSIONAL,
+                "enterprise": settings.TIER_QUEUE_ENTERPRISE,
+                "partner": settings.TIER_QUEUE_PARTNER
+            }
+        )
+    
+    @staticmethod
+    def normalize_tier(tier: Optional[str]) -> str:
+        # Unknown or anonymous callers get the lowest priority
+        return tier if tier in TIER_PRIORITY else "free"
+    
+    def _has_capacity(self, tier: str) -> bool:
+        return self._active_total < self.max_concurrency and self._active[tier] < self.tier_limits[tier]
+    
+    def _higher_or_equal_waiting(self, tier: str) -> bool:
+        return self._waiting_ahead(tier) > 0
+    
+    def _waiting_ahead(self, tier: str) -> int:
+        # Higher tiers at their own cap cannot take a free slot, so they do not hold this one back
+        ahead = 0
+        for candidate in TIER_PRIORITY:
+            if candidate == tier:
+                return ahead + len(self._waiters[candidate])
+            if self._active[candidate] < self.tier_limits[candidate]:
+                ahead += len(self._waiters[candidate])
+        return ahead
+    
+    def _grant(self, tier: str):
+        self._active_total += 1
+        self._active[tier] += 1
+        self._stats[tier]["admitted"] += 1
+        self._granted_at[tier].append(time.perf_counter())
+    
+    def _reject(self, tier: str, reason: str, message: str, retry_after: float) -> AdmissionRejected:
+        self._shed[tier][reason] += 1
+        return AdmissionRejected(message, reason, retry_after=max(1, math.ceil(retry_after)))
+    
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+    
+    def estimated_wait(self, tier: Optional[str]) -> float:
+        """Estimate in seconds how long a new request of this tier would queue"""
+        tier = self.normalize_tier(tier)
+        if self._has_capacity(tier) and not self._higher_or_equal_waiting(tier):
+            return 0.0
+        if self._service_time is None:
+            return 0.0
+        # Everyone ahead, plus this request, drains through the slots this tier may use
+        slots = min(self.max_concurrency, self.tier_limits[tier])
+        return math.ceil((self._waiting_ahead(tier) + 1) / slots) * self._service_time
+    
+    def check_admission(self, tier: Optional[str], deadline: Optional[float] = None):
+        """Reject up front if the request cannot be served in time; AdmissionMiddleware calls this before the body is read"""
+        tier = self.normalize_tier(tier)
+        if self._has_capacity(tier) and not self._higher_or_equal_waiting(tier):
+            return
+        estimated_wait = self.estimated_wait(tier)
+        waiters = self._waiters[tier]
+        if len(waiters) >= self.queue_limits[tier]:
+            raise self._reject(tier, "queue_full", f"Too many queued {tier}-tier identifications ({len(waiters)} waiting)", estimated_wait)
+        if deadline is not None and estimated_wait > deadline - time.monotonic():
+            raise self._reject(tier, "deadline", f"Estimated queue wait of {estimated_wait:.2f}s exceeds the request deadline", estimated_wait)
+    
+    def _wake(self):
+        for tier in TIER_PRIORITY:
+            waiters = self._waiters[tier]
+            while waiters and self._has_capacity(tier):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._grant(tier)
+                future.set_result(None)
+            if self._active_total >= self.max_concurrency:
+                return
+    
+    async def acquire(self, tier: Optional[str], deadline: Optional[float] = None) -> str:
+        """Wait for an inference slot; returns the tier the slot was charged to"""
+        tier = self.normalize_tier(tier)
+        if self._has_capacity(tier) and not self._higher_or_equal_waiting(tier):
+            self._grant(tier)
+            self._queue_waits[tier].append(0.0)
+            return tier
+        
+        self.check_admission(tier, deadline)
+        
+        waiters = self._waiters[tier]
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        self._stats[tier]["queued"] += 1
+        queued_at = time.perf_counter()
+        # A slot may be free that no higher-tier waiter can use
+        self._wake()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the future, so _wake will not grant it
+            try:
+                waiters.remove(future)
+            except ValueError:
+                pass
+            raise self._reject(tier, "expired", f"Request deadline passed while queued for a {tier}-tier slot", self.estimated_wait(tier))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the caller gave up; hand the slot on
+                self.release(tier)
+            else:
+                try:
+                    waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+        self._queue_waits[tier].append(time.perf_counter() - queued_at)
+        return tier
+    
+    def release(self, tier: str):
+        granted_at = self._granted_at[tier]
+        if granted_at:
+            # Slots are interchangeable, so the oldest grant is as good a sample as any
+            held = time.perf_counter() - granted_at.popleft()
+            if self._service_time is None:
+                self._service_time = held
+            else:
+                self._service_time += self.service_time_alpha * (held - self._service_time)
+        self._active_total -= 1
+        self._active[tier] -= 1
+        self._wake()
+    
+    @asynccontextmanager
+    async def slot(self, tier: Optional[str], deadline: Optional[float] = None) -> AsyncIterator[None]:
+        tier = await self.acquire(tier, deadline)
+        try:
+            yield
+        finally:
+            self.release(tier)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        tiers = {}
+        for tier in TIER_PRIORITY:
+            queue_waits = sorted(self._queue_waits[tier])
+            tiers[tier] = {
+                "concurrency_limit": self.tier_limits[tier],
+                "queue_limit": self.queue_limits[tier],
+                "active": self._active[tier],
+                "waiting": len(self._waiters[tier]),
+                **self._stats[tier],
+                "shed": sum(self._shed[tier].values()),
+                "shed_by_reason": dict(self._shed[tier]),
+                "estimated_wait_seconds": round(self.estimated_wait(tier), 3),
+                "queue_wait_ms": {
+                    "p50": round(_percentile(queue_waits, 50) * 1000, 2),
+                    "p95": round(_percentile(queue_waits, 95) * 1000, 2)
+                }
+            }
+        return {
+            "policy": "strict_priority",
+            "max_concurrency": self.max_concurrency,
+            "active": self._active_total,
+            "waiting": self.waiting,
+            "shed": sum(sum(shed.values()) for shed in self._shed.values()),
+            "avg_service_time_ms": round((self._service_time or 0.0) * 1000, 2),
+            "tiers": tiers
+        }
\ No newline at end of file
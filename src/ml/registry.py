@@ -0,0 +1,369 @@
+"""
+Local model registry and hot-swapping model manager.
+
+Registry layout:
+    <root>/manifest.json       {"active": "v2", "previous": "v1", "versions": {...}}
+    <root>/<version>/          model artifacts (see ml.models.CPUModelBackend)
+
+Command line (from src/):
+    python -m ml.registry --root models/registry list
+    python -m ml.registry --root models/registry register v2 path/to/model_dir [--activate]
+    python -m ml.registry --root models/registry activate v2
+    python -m ml.registry --root models/registry rollback
+    python -m ml.registry --root models/registry add-species v3 --base v2 --embeddings new.npy --labels new.json [--activate]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+from PIL import Image
+from config import settings
+from ml.models import MANIFEST_FILE as MODEL_MANIFEST_FILE, SPECIES_INDEX_DIR
+from ml.models import CPUModelBackend, EmbeddingModelBackend, MockModelBackend, ModelBackend, ModelNotAvailable, create_model_backend
+from ml.embeddings import append_species
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+class RegistryError(Exception):
+    """Raised for invalid registry operations"""
+
+class ModelRegistry:
+    """Versioned model artifacts plus a manifest naming the active version
+    
+    Every manifest update is written to a temporary file and renamed into place,
+    so readers always see either the old or the new manifest.
+    """
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILE)
+    
+    def read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"active": None, "previous": None, "versions": {}}
+    
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def list_versions(self) -> List[Dict[str, Any]]:
+        manifest = self.read_manifest()
+        return [
+            {"version": version, **entry, "active": version == manifest.get("active")}
+            for version, entry in manifest.get("versions", {}).items()
+        ]
+    
+    def active_version(self) -> Optional[str]:
+        return self.read_manifest().get("active")
+    
+    def version_path(self, version: str) -> str:
+        entry = self.read_manifest().get("versions", {}).get(version)
+        if entry is None:
+            raise RegistryError(f"Unknown model version: {version}")
+        return os.path.join(self.root, entry["path"])
+    
+    def register(self, version: str, source_dir: str, backend: str = "cpu", activate: bool = False):
+        """Copy a model directory into the registry under version"""
+        manifest = self.read_manifest()
+        if version in manifest["versions"]:
+            raise RegistryError(f"Model version {version} is already registered")
+        
+        target = os.path.join(self.root, version)
+        shutil.copytree(source_dir, target)
+        manifest["versions"][version] = {
+            "path": version,
+            "backend": backend,
+            "registered_at": time.time()
+        }
+        self._write_manifest(manifest)
+        logger.info(f"Registered model {version} ({backend})")
+        if activate:
+            self.activate(version)
+    
+    def add_species(
+        self,
+        version: str,
+        base_version: str,
+        embeddings: np.ndarray,
+        labels: List[Dict[str, Any]],
+        activate: bool = False
+    ):
+        """Register version as a copy of an embedding model with species prototypes appended
+        
+        The new species need no retraining, only their prototype rows in the species
+        index. The base version is left untouched, so services keep serving it until
+        version is activated and hot-swapped in, and it stays available for rollback.
+        """
+        manifest = self.read_manifest()
+        if version in manifest["versions"]:
+            raise RegistryError(f"Model version {version} is already registered")
+        base = manifest["versions"].get(base_version)
+        if base is None:
+            raise RegistryError(f"Unknown model version: {base_version}")
+        if base.get("backend") != "embedding":
+            raise RegistryError(f"Model version {base_version} has no species embedding index")
+        
+        target = os.path.join(self.root, version)
+        shutil.copytree(os.path.join(self.root, base["path"]), target)
+        try:
+            append_species(os.path.join(target, SPECIES_INDEX_DIR), embeddings, labels)
+            # Predictions are tagged and cached by the model's own version, which must change with its species
+            model_manifest_path = os.path.join(target, MODEL_MANIFEST_FILE)
+            with open(model_manifest_path, "r", encoding="utf-8") as f:
+                model_manifest = json.load(f)
+            with open(model_manifest_path, "w", encoding="utf-8") as f:
+                json.dump({**model_manifest, "version": version}, f)
+        except (OSError, ValueError) as e:
+            shutil.rmtree(target, ignore_errors=True)
+            raise RegistryError(f"Could not add species to {base_version}: {e}")
+        
+        manifest["versions"][version] = {
+            "path": version,
+            "backend": "embedding",
+            "base_version": base_version,
+            "registered_at": time.time()
+        }
+        self._write_manifest(manifest)
+        logger.info(f"Registered model {version} with {len(labels)} species added to {base_version}")
+        if activate:
+            self.activate(version)
+    
+    def activate(self, version: str):
+        """Make version the active model; running services pick it up on their next poll"""
+        manifest = self.read_manifest()
+        if version not in manifest["versions"]:
+            raise RegistryError(f"Unknown model version: {version}")
+        if manifest.get("active") == version:
+            return
+        manifest["previous"] = manifest.get("active")
+        manifest["active"] = version
+        manifest["activated_at"] = time.time()
+        self._write_manifest(manifest)
+        logger.info(f"Activated model {version}")
+    
+    def rollback(self) -> str:
+        """Swap the active and previous versions back"""
+        previous = self.read_manifest().get("previous")
+        if not previous:
+            raise RegistryError("No previous model version to roll back to")
+        self.activate(previous)
+        return previous
+    
+    def create_backend(self, version: str) -> ModelBackend:
+        entry = self.read_manifest().get("versions", {}).get(version)
+        if entry is None:
+            raise RegistryError(f"Unknown model version: {version}")
+        
+        options = {
+            "top_k": settings.MODEL_TOP_K,
+            "input_size": settings.MODEL_INPUT_SIZE
+        }
+        backend = entry.get("backend", "cpu")
+        if backend == "cpu":
+            return CPUModelBackend(
+                os.path.join(self.root, entry["path"]),
+                warmup_iterations=settings.MODEL_WARMUP_ITERATIONS,
+                **options
+            )
+        if backend == "embedding":
+            return EmbeddingModelBackend(
+                os.path.join(self.root, entry["path"]),
+                warmup_iterations=settings.MODEL_WARMUP_ITERATIONS,
+                **options
+            )
+        if backend == "mock":
+            return MockModelBackend(version=version, **options)
+        raise RegistryError(f"Unsupported model backend: {backend}")
+
+class ModelManager:
+    """Serves predictions from the active model and hot-swaps it from a registry
+    
+    A new version is loaded and warmed up in the background while the current
+    one keeps serving; the swap itself is a single reference assignment. Each
+    prediction is tagged with the version that produced it.
+    """
+    
+    def __init__(self, backend: ModelBackend, registry: Optional[ModelRegistry] = None, poll_seconds: float = 5.0):
+        self._backend = backend
+        self.registry = registry
+        self.poll_seconds = poll_seconds
+        
+        self._watcher: Optional[asyncio.Task] = None
+        self._swap_lock: Optional[asyncio.Lock] = None
+        self._failed_version: Optional[str] = None
+        self.swaps = 0
+        self.last_swap_at: Optional[float] = None
+        self.loading_version: Optional[str] = None
+    
+    @classmethod
+    def from_settings(cls) -> "ModelManager":
+        if not settings.MODEL_REGISTRY_PATH:
+            return cls(create_model_backend())
+        
+        registry = ModelRegistry(settings.MODEL_REGISTRY_PATH)
+        active = registry.active_version()
+        backend = registry.create_backend(active) if active else create_model_backend()
+        return cls(backend, registry, poll_seconds=settings.MODEL_REGISTRY_POLL_SECONDS)
+    
+    def __reduce__(self):
+        # Worker processes get a fixed manager around the model that is active right now
+        return ModelManager, (self._backend,)
+    
+    @property
+    def current(self) -> ModelBackend:
+        return self._backend
+    
+    @property
+    def version(self) -> str:
+        return self._backend.version
+    
+    @property
+    def state(self) -> str:
+        return self._backend.state
+    
+    def load(self):
+        self._backend.load()
+    
+    def predict_batch(self, batch: Union[np.ndarray, List[Image.Image]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Predict with the active model; returns (model version, predictions) per image"""
+        backend = self._backend
+        return [(backend.version, predictions) for predictions in backend.predict_batch(batch)]
+    
+    def predict_augmented(self, images: List[Image.Image], views: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Test-time augmented prediction with the active model; returns (model version, predictions) per image"""
+        backend = self._backend
+        return [(backend.version, predictions) for predictions in backend.predict_augmented(images, views)]
+    
+    def similar_observations(self, batch: Union[np.ndarray, List[Image.Image]], k: int) -> Tuple[str, List[List[Dict[str, Any]]]]:
+        """Similar past identifications from the active model; returns (model version, matches per image)"""
+        backend = self._backend
+        return backend.version, backend.similar_observations(batch, k)
+    
+    async def check_for_update(self) -> bool:
+        """Swap to the registry's active version if it changed; returns whether a swap happened"""
+        if self.registry is None:
+            return False
+        if self._swap_lock is None:
+            self._swap_lock = asyncio.Lock()
+        
+        async with self._swap_lock:
+            active = await asyncio.to_thread(self.registry.active_version)
+            if not active or active == self.version or active == self._failed_version:
+                return False
+            
+            self.loading_version = active
+            try:
+                backend = self.registry.create_backend(active)
+                # Warm up off the event loop while the current model keeps serving
+                await asyncio.to_thread(backend.load)
+            except (RegistryError, ModelNotAvailable) as e:
+                self._failed_version = active
+                logger.error(f"Keeping model {self.version}, could not load {active}: {e}")
+                return False
+            finally:
+                self.loading_version = None
+            
+            previous, self._backend = self._backend, backend
+            self._failed_version = None
+            self.swaps += 1
+            self.last_swap_at = time.time()
+            logger.info(f"Swapped model {previous.version} -> {backend.version}")
+            return True
+    
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.check_for_update()
+            except Exception as e:
+                logger.error(f"Model registry check failed: {e}")
+    
+    def start(self):
+        """Start polling the registry for a new active version"""
+        if self.registry is not None and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+    
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+    
+    def get_status(self) -> Dict[str, Any]:
+        status = self._backend.get_status()
+        if self.registry is not None:
+            status["registry"] = {
+                "path": self.registry.root,
+                "active": self.registry.active_version(),
+                "loading_version": self.loading_version,
+                "failed_version": self._failed_version,
+                "swaps": self.swaps,
+                "last_swap_at": self.last_swap_at
+            }
+        return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local model registry")
+    parser.add_argument("--root", default=settings.MODEL_REGISTRY_PATH, help="Registry directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List registered versions")
+    register = commands.add_parser("register", help="Register a model directory")
+    register.add_argument("version")
+    register.add_argument("source_dir")
+    register.add_argument("--backend", default="cpu")
+    register.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate", help="Activate a registered version")
+    activate.add_argument("version")
+    commands.add_parser("rollback", help="Re-activate the previous version")
+    add_species = commands.add_parser("add-species", help="Register a copy of an embedding model with new species appended")
+    add_species.add_argument("version")
+    add_species.add_argument("--base", required=True, help="Embedding model version to copy")
+    add_species.add_argument("--embeddings", required=True, help=".npy file of prototype rows, one per species")
+    add_species.add_argument("--labels", required=True, help="JSON list of species labels, in the same order")
+    add_species.add_argument("--activate", action="store_true")
+    args = parser.parse_args()
+    
+    if not args.root:
+        parser.error("--root is required when MODEL_REGISTRY_PATH is not set")
+    registry = ModelRegistry(args.root)
+    
+    try:
+        if args.command == "list":
+            for entry in registry.list_versions():
+                marker = "*" if entry["active"] else " "
+                print(f"{marker} {entry['version']} ({entry['backend']})")
+        elif args.command == "register":
+            registry.register(args.version, args.source_dir, backend=args.backend, activate=args.activate)
+        elif args.command == "activate":
+            registry.activate(args.version)
+        elif args.command == "rollback":
+            print(f"Active model is now {registry.rollback()}")
+        elif args.command == "add-species":
+            with open(args.labels, "r", encoding="utf-8") as f:
+                labels = json.load(f)
+            registry.add_species(args.version, args.base, np.load(args.embeddings), labels, activate=args.activate)
+    except RegistryError as e:
+        parser.exit(1, f"error: {e}\n")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import math
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+from config import settings
+from ml.decode import decode_reduced, open_image, scaled_size
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A region covering this much of the frame is not worth a second decode
+MAX_ROI_AREA = 0.8
+
+def saliency_map(pixels: np.ndarray) -> np.ndarray:
+    """Cheap saliency for an RGB array: edge strength plus chroma, above the frame's median
+    
+    Plants stand out from sky, soil and blurred backgrounds by texture and colour,
+    so each cue is normalized by its mean and the typical (median) level of the
+    frame is subtracted, leaving only what is busier or more colourful than it.
+    The excess is squared so a few strong responses outweigh diffuse background
+    texture.
+    """
+    rgb = pixels.astype(np.float32)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    edges = np.zeros_like(gray)
+    edges[:, 1:] += np.abs(np.diff(gray, axis=1))
+    edges[1:, :] += np.abs(np.diff(gray, axis=0))
+    chroma = rgb.max(axis=2) - rgb.min(axis=2)
+    
+    saliency = edges / (edges.mean() + 1e-6) + chroma / (chroma.mean() + 1e-6)
+    return np.square(np.maximum(saliency - np.median(saliency), 0))
+
+def find_roi(
+    draft: Image.Image,
+    energy: float = 0.9,
+    margin: float = 0.1,
+    min_fraction: float = 0.3
+) -> Optional[Tuple[float, float, float, float]]:
+    """Pick the salient region of a draft as (left, top, right, bottom) fractions of the frame
+    
+    The region spans the central energy share of the saliency mass along each axis,
+    padded by margin and grown towards a square of at least min_fraction of the
+    shorter side, since the model center-crops its input to a square. Returns None
+    when the region would cover most of the frame anyway.
+    """
+    saliency = saliency_map(np.asarray(draft.convert("RGB")))
+    total = saliency.sum()
+    if total <= 0:
+        return None
+    
+    height, width = saliency.shape
+    tail = (1 - energy) / 2
+    cols = np.cumsum(saliency.sum(axis=0)) / total
+    rows = np.cumsum(saliency.sum(axis=1)) / total
+    left, right = np.searchsorted(cols, [tail, 1 - tail])
+    top, bottom = np.searchsorted(rows, [tail, 1 - tail])
+    
+    side = max(right - left + 1, bottom - top + 1) * (1 + 2 * margin)
+    side = max(side, min_fraction * min(width, height))
+    crop_width, crop_height = min(side, width), min(side, height)
+    if crop_width * crop_height >= MAX_ROI_AREA * width * height:
+        return None
+    
+    # Center the square on the region, then shift it back inside the frame
+    x = min(max((left + right + 1) / 2 - crop_width / 2, 0), width - crop_width)
+    y = min(max((top + bottom + 1) / 2 - crop_height / 2, 0), height - crop_height)
+    return x / width, y / height, (x + crop_width) / width, (y + crop_height) / height
+
+def decode_roi_for_model(image_data: bytes, target: int = None) -> Tuple[Image.Image, int, Optional[Tuple[int, int, int, int]]]:
+    """Decode the salient region of an upload at model resolution
+    
+    A low-res draft (DCT-reduced for JPEGs) is decoded first to choose the region.
+    The JPEG is then decoded again at the smallest DCT scale that still gives the
+    region's shorter side target pixels, and only the region is resampled, so a
+    plant filling a corner of a 4000px photo reaches the model with far more detail
+    than a downscaled full frame. Other formats are decoded once at full size.
+    Returns the model input, the number of pixels decoded and the region in
+    original pixel coordinates, or None when the full frame was used.
+    """
+    target = target or settings.MODEL_INPUT_SIZE
+    image = open_image(image_data)
+    width, height = image.size
+    draft_size = scaled_size(width, height, settings.ROI_DRAFT_SIZE)
+    
+    full = None
+    if image.format == "JPEG":
+        source = decode_reduced(image, draft_size)
+    else:
+        source = full = decode_reduced(image, (width, height))
+    decoded_pixels = source.width * source.height
+    
+    draft = source
+    if min(source.size) > settings.ROI_DRAFT_SIZE:
+        draft = source.resize(draft_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    box = find_roi(draft, margin=settings.ROI_MARGIN, min_fraction=settings.ROI_MIN_FRACTION)
+    
+    if box is None:
+        region = (0, 0, width, height)
+    else:
+        region = (
+            round(box[0] * width), round(box[1] * height),
+            round(box[2] * width), round(box[3] * height)
+        )
+    region_width, region_height = region[2] - region[0], region[3] - region[1]
+    
+    # Decode again only if the draft is too coarse for the region at model resolution
+    scale = target / min(region_width, region_height)
+    needed = (math.ceil(width * scale), math.ceil(height * scale))
+    if full is None and source.width < needed[0]:
+        source = decode_reduced(open_image(image_data), needed)
+        decoded_pixels += source.width * source.height
+    
+    ratio = source.width / width
+    crop = source.crop(tuple(round(v * ratio) for v in region)) if box is not None else source
+    size = scaled_size(region_width, region_height, target)
+    if crop.size != size:
+        crop = crop.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return crop, decoded_pixels, region if box is not None else None
\ No newline at end of file
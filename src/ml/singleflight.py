@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key onto one in-flight computation
+    
+    The first caller for a key starts the work as its own task; every caller that
+    arrives while it is running awaits the same task instead of repeating it.
+    The task is shielded, so a disconnecting caller does not cancel the work for
+    the others.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+    
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run func() once per key at a time; returns (result, whether it was shared)"""
+        loop = asyncio.get_running_loop()
+        task = self._in_flight.get(key)
+        if task is not None and task.get_loop() is loop:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(task), True
+        
+        task = loop.create_task(func())
+        self._in_flight[key] = task
+        self._stats["leaders"] += 1
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), False
+    
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            **self._stats
+        }
\ No newline at end of file
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Optional, Tuple
+from fastapi import UploadFile
+from config import settings
+from ml.decode import ImageDecodeError, sniff_format
+import logging
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class UploadTooLarge(ValueError):
+    """Raised as soon as an upload is known to exceed the size limit"""
+
+async def read_upload(file: UploadFile, max_size: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[bytes, str]:
+    """Read an upload in chunks, returning its bytes and SHA-256 hex digest
+    
+    The digest is computed as chunks arrive, so it never needs a second pass
+    over the data. Reading stops at the first chunk that pushes the upload over
+    max_size, and after the first chunk if it does not start with the signature
+    of a supported image format.
+    """
+    max_size = settings.MAX_FILE_SIZE if max_size is None else max_size
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLarge(f"Upload is {file.size} bytes, larger than the {max_size} byte limit")
+    
+    hasher = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        if not chunks and sniff_format(chunk) is None:
+            raise ImageDecodeError("Upload is not a JPEG, PNG or WebP image")
+        total += len(chunk)
+        if total > max_size:
+            raise UploadTooLarge(f"Upload exceeds the {max_size} byte limit")
+        hasher.update(chunk)
+        chunks.append(chunk)
+    
+    if not chunks:
+        raise ImageDecodeError("Upload is empty")
+    # A single chunk is handed on as-is; otherwise join once into the buffer the decoder reads from
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return data, hasher.hexdigest()
\ No newline at end of file
@@ -6,6 +6,7 @@ import io
 from PIL import Image
 import json
 import time
+from datetime import datetime
 
 # Import the main app
 import sys
@@ -14,6 +15,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
 from config import settings
+from catalog.store import SpeciesStore
+from catalog.search import SearchIndex, tokenize
+from catalog.fuzzy import TrigramIndex, bounded_distance
+from catalog.suggest import SuggestIndex
 
 # Test client
 client = TestClient(app)
@@ -125,6 +130,54 @@ class TestSpeciesAPI:
         assert data["query"] == "ficus"
         assert "search_time" in data
     
+    def test_search_local_names_ranked(self):
+        """Test that multi-word local names match and total_results counts every match"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/species/search/?q=Kembang%20Sepatu", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["species_id"] for r in data["results"]] == ["hibiscus_rosa_sinensis"]
+        
+        response = client.get("/api/v1/species/search/?q=bunga&limit=1", headers=headers)
+        data = response.json()
+        assert len(data["results"]) == 1
+        assert data["total_results"] == 3
+    
+    def test_search_filters_and_facets(self):
+        """Test search filtered by island with facet counts over the matches"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/species/search/?q=bunga&island=bali&facets=true", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["species_id"] for r in data["results"]] == ["plumeria_rubra"]
+        assert data["total_results"] == 1
+        assert data["facets"]["island"]["Bali"] == 1
+        assert data["facets"]["family"] == {"Apocynaceae": 1}
+        
+        response = client.get("/api/v1/species/?island=Java&facets=true", headers=headers)
+        data = response.json()
+        assert data["total"] == data["facets"]["island"]["Java"]
+        assert client.get("/api/v1/species/", headers=headers).json()["facets"] is None
+    
+    def test_search_with_typo(self):
+        """Test that a misspelled name still finds the species"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/species/search/?q=plumera", headers=headers)
+        assert response.status_code == 200
+        assert [r["species_id"] for r in response.json()["results"]] == ["plumeria_rubra"]
+    
+    def test_suggest_species(self):
+        """Test prefix autocomplete returning ids and matched names"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/species/suggest?prefix=Kembang%20Se", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["prefix"] == "Kembang Se"
+        assert data["suggestions"] == [{"species_id": "hibiscus_rosa_sinensis", "name": "Kembang Sepatu"}]
+        
+        response = client.get("/api/v1/species/suggest?prefix=", headers=headers)
+        assert response.status_code == 422
+    
     def test_get_families(self):
         """Test getting plant families list"""
         headers = {"X-API-Key": "free_demo_key_123"}
@@ -145,6 +198,222 @@ class TestSpeciesAPI:
         assert "total_families" in data
         assert "total_genera" in data
         assert "database_version" in data
+    
+    def test_list_species_by_family(self):
+        """Test that the family filter is served from the index, case-insensitively"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/species/?family=moraceae", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        assert data["species"][0]["species_id"] == "ficus_benjamina"
+
+class TestSpeciesStore:
+    """Test the indexed in-memory species store"""
+    
+    def make_species(self, species_id, family, genus=None, **fields):
+        return {
+            "species_id": species_id,
+            "scientific_name": species_id.replace("_", " ").capitalize(),
+            "family": family,
+            "genus": genus or species_id.split("_")[0].capitalize(),
+            "conservation_status": "Least Concern",
+            **fields
+        }
+    
+    def test_lookups_and_filtered_pages(self):
+        """Test hash lookups and pages in catalogue order from the secondary indexes"""
+        store = SpeciesStore([
+            self.make_species("ficus_benjamina", "Moraceae"),
+            self.make_species("dendrobium_nobile", "Orchidaceae"),
+            self.make_species("ficus_elastica", "Moraceae"),
+            self.make_species("artocarpus_altilis", "Moraceae")
+        ])
+        assert store.get("ficus_elastica")["family"] == "Moraceae"
+        assert store.get_by_scientific_name("FICUS  elastica")["species_id"] == "ficus_elastica"
+        assert store.get("missing") is None
+        
+        page, total = store.page(1, 2, family="moraceae")
+        assert total == 3
+        assert [s["species_id"] for s in page] == ["ficus_elastica", "artocarpus_altilis"]
+        page, total = store.page(0, 10, family="Moraceae", genus="Ficus")
+        assert [s["species_id"] for s in page] == ["ficus_benjamina", "ficus_elastica"]
+        assert store.counts("family") == {"Moraceae": 3, "Orchidaceae": 1}
+    
+    def test_updates_keep_indexes_consistent(self):
+        """Test that updates re-file changed values in catalogue order and removals drop empty keys"""
+        store = SpeciesStore([
+            self.make_species("ficus_benjamina", "Moraceae"),
+            self.make_species("dendrobium_nobile", "Orchidaceae"),
+            self.make_species("ficus_elastica", "Moraceae")
+        ])
+        store.update("ficus_elastica", {"family": "Orchidaceae", "scientific_name": "Ficus robusta"})
+        assert store.ids_by("family", "Moraceae") == ["ficus_benjamina"]
+        assert store.ids_by("family", "Orchidaceae") == ["dendrobium_nobile", "ficus_elastica"]
+        assert store.get_by_scientific_name("Ficus elastica") is None
+        assert store.get_by_scientific_name("Ficus robusta")["species_id"] == "ficus_elastica"
+        
+        store.update("ficus_benjamina", {"family": "Orchidaceae"})
+        assert store.ids_by("family", "Orchidaceae") == ["ficus_benjamina", "dendrobium_nobile", "ficus_elastica"]
+        assert "Moraceae" not in store.counts("family")
+        
+        with pytest.raises(ValueError):
+            store.update("dendrobium_nobile", {"scientific_name": "Ficus robusta"})
+        with pytest.raises(ValueError):
+            store.add(self.make_species("ficus_benjamina", "Moraceae"))
+        
+        store.remove("dendrobium_nobile")
+        assert len(store) == 2
+        assert store.counts("genus") == {"Ficus": 2}
+        assert store.page(0, 10, family="Orchidaceae")[1] == 2
+    
+    def test_multi_valued_facets(self):
+        """Test that list fields are filed under each value and facets count any subset"""
+        store = SpeciesStore([
+            self.make_species("ficus_benjamina", "Moraceae", distribution=["Java", "Bali"]),
+            self.make_species("dendrobium_nobile", "Orchidaceae", distribution=["Java", "Sulawesi"]),
+            self.make_species("ficus_elastica", "Moraceae", distribution=["Sumatra"])
+        ])
+        assert store.ids_by("distribution", "java") == ["ficus_benjamina", "dendrobium_nobile"]
+        assert store.filter_ids(family="Moraceae", distribution="Java") == ["ficus_benjamina"]
+        assert store.facets(fields=["distribution"]) == {"distribution": {"Java": 2, "Bali": 1, "Sulawesi": 1, "Sumatra": 1}}
+        assert store.facets(["ficus_benjamina", "ficus_elastica"], ["family", "distribution"]) == {
+            "family": {"Moraceae": 2},
+            "distribution": {"Bali": 1, "Java": 1, "Sumatra": 1}
+        }
+        
+        store.update("ficus_elastica", {"distribution": ["Sumatra", "Java"]})
+        assert store.counts("distribution")["Java"] == 3
+        store.remove("dendrobium_nobile")
+        assert store.facets(fields=["distribution", "family"]) == {
+            "distribution": {"Java": 2, "Bali": 1, "Sumatra": 1},
+            "family": {"Moraceae": 2}
+        }
+
+class TestSearchIndex:
+    """Test the inverted species search index"""
+    
+    def make_store(self):
+        store = SpeciesStore([
+            {"species_id": "hibiscus_rosa_sinensis", "scientific_name": "Hibiscus rosa-sinensis", "common_name": "Chinese Hibiscus",
+             "local_names": ["Kembang Sepatu", "Bunga Raya"], "family": "Malvaceae", "genus": "Hibiscus"},
+            {"species_id": "michelia_champaca", "scientific_name": "Magnolia champaca", "common_name": "Champak",
+             "local_names": ["Bunga Cempaka", "Cempaka Kuning"], "family": "Magnoliaceae", "genus": "Magnolia"},
+            {"species_id": "hibiscus_tiliaceus", "scientific_name": "Hibiscus tiliaceus", "common_name": "Sea Hibiscus",
+             "local_names": ["Waru"], "family": "Malvaceae", "genus": "Hibiscus"}
+        ])
+        index = SearchIndex()
+        store.subscribe(index)
+        return store, index
+    
+    def test_normalization(self):
+        """Test folding of case, diacritics, hyphenated names and old Indonesian spelling"""
+        assert tokenize("Boenga Tjempaka") == ["bunga", "cempaka"]
+        assert tokenize("Kembang Sépatu") == ["kembang", "sepatu"]
+        assert tokenize("rosa-sinensis") == ["rosa", "sinensis", "rosasinensis"]
+    
+    def test_ranked_intersection(self):
+        """Test AND semantics across terms, field-weighted ranking and prefix matching of the last word"""
+        store, index = self.make_store()
+        assert index.search("boenga tjempaka") == (["michelia_champaca"], 1)
+        assert index.search("hibiscus waru") == (["hibiscus_tiliaceus"], 1)
+        assert index.search("hibiscus cempaka") == ([], 0)
+        assert index.search("magno")[0] == ["michelia_champaca"]
+        
+        # "Sea" only in the common name scores below "Sea" in the scientific name
+        store.add({"species_id": "scaevola_taccada", "scientific_name": "Scaevola sea", "common_name": "Beach Cabbage",
+                   "local_names": ["Bakung Laut"], "family": "Goodeniaceae", "genus": "Scaevola"})
+        assert index.search("sea") == (["scaevola_taccada", "hibiscus_tiliaceus"], 2)
+        assert index.search("sea", limit=1, offset=1) == (["hibiscus_tiliaceus"], 2)
+        ids, total, matched = index.search_with_matches("sea", limit=1)
+        assert (ids, total) == (["scaevola_taccada"], 2)
+        assert sorted(matched) == ["hibiscus_tiliaceus", "scaevola_taccada"]
+    
+    def test_store_changes_update_index(self):
+        """Test that store updates and removals are reflected in search results"""
+        store, index = self.make_store()
+        store.update("hibiscus_tiliaceus", {"local_names": ["Waru Laut"]})
+        assert index.search("waru laut") == (["hibiscus_tiliaceus"], 1)
+        
+        store.remove("hibiscus_rosa_sinensis")
+        assert index.search("kembang sepatu") == ([], 0)
+        assert index.search("hibiscus")[1] == 1
+        
+        store.add({"species_id": "hibiscus_sabdariffa", "scientific_name": "Hibiscus sabdariffa", "common_name": "Roselle",
+                   "local_names": ["Rosela"], "family": "Malvaceae", "genus": "Hibiscus"})
+        assert index.search("rosel")[0] == ["hibiscus_sabdariffa"]
+    
+    def test_typo_tolerance(self):
+        """Test bounded edit distance, trigram candidates and fuzzy fallback in search"""
+        assert bounded_distance("hibsicus", "hibiscus", 2) == 1
+        assert bounded_distance("kembang", "kambing", 1) is None
+        
+        fuzzy = TrigramIndex()
+        for term in ("dendrobium", "dendrophthoe", "hibiscus", "ficus", "rubra"):
+            fuzzy.add_term(term)
+        assert fuzzy.correct("dendrobim") == [("dendrobium", 1)]
+        # Transpositions, including at the ends, where they break four trigrams
+        assert fuzzy.correct("fcius") == [("ficus", 1)]
+        assert fuzzy.correct("ficsu") == [("ficus", 1)]
+        assert fuzzy.correct("rbura") == [("rubra", 1)]
+        assert fuzzy.correct("hibsicus") == [("hibiscus", 1)]
+        assert fuzzy.correct("waru") == []
+        
+        store, index = self.make_store()
+        index = SearchIndex(fuzzy=TrigramIndex())
+        store.subscribe(index)
+        assert index.search("hibsicus tiliaceus") == (["hibiscus_tiliaceus"], 1)
+        assert index.search("cempka kuning") == (["michelia_champaca"], 1)
+        store.remove("michelia_champaca")
+        assert index.search("cempka") == ([], 0)
+
+class TestSuggestIndex:
+    """Test the autocomplete prefix index"""
+    
+    def test_ranking_and_changes(self):
+        """Test word-start matching, one suggestion per species and store updates"""
+        store = SpeciesStore([
+            {"species_id": "hibiscus_tiliaceus", "scientific_name": "Hibiscus tiliaceus", "common_name": "Sea Hibiscus",
+             "local_names": ["Waru"], "family": "Malvaceae", "genus": "Hibiscus"},
+            {"species_id": "hibiscus_rosa_sinensis", "scientific_name": "Hibiscus rosa-sinensis", "common_name": "Chinese Hibiscus",
+             "local_names": ["Kembang Sepatu"], "family": "Malvaceae", "genus": "Hibiscus"}
+        ])
+        index = SuggestIndex()
+        store.subscribe(index)
+        
+        # Scientific names rank first; "Sea Hibiscus" is not suggested twice for the same species
+        assert index.suggest("hibi") == [("hibiscus_tiliaceus", "Hibiscus tiliaceus"), ("hibiscus_rosa_sinensis", "Hibiscus rosa-sinensis")]
+        assert index.suggest("sep") == [("hibiscus_rosa_sinensis", "Kembang Sepatu")]
+        assert index.suggest("rosa sin", limit=1) == [("hibiscus_rosa_sinensis", "Hibiscus rosa-sinensis")]
+        assert index.suggest("Sepatoe") == [("hibiscus_rosa_sinensis", "Kembang Sepatu")]
+        
+        store.update("hibiscus_tiliaceus", {"local_names": ["Waru Laut"]})
+        assert index.suggest("waru l") == [("hibiscus_tiliaceus", "Waru Laut")]
+        store.remove("hibiscus_rosa_sinensis")
+        assert index.suggest("hibi") == [("hibiscus_tiliaceus", "Hibiscus tiliaceus")]
+        assert index.suggest("zz") == []
+    
+    def test_changes_before_first_lookup(self):
+        """Test that updates and removals before the first merge leave no stale or missing names"""
+        store = SpeciesStore([
+            {"species_id": f"alpha_{i}", "scientific_name": f"Alpha species{i}", "common_name": f"Alpha {i}",
+             "local_names": [], "family": "Testaceae", "genus": "Alpha"}
+            for i in range(4)
+        ])
+        index = SuggestIndex()
+        store.subscribe(index)
+        for i in range(3):
+            store.update(f"alpha_{i}", {"common_name": f"Alpha renamed {i}"})
+        store.remove("alpha_3")
+        
+        assert [species_id for species_id, _ in index.suggest("alpha", 3)] == ["alpha_0", "alpha_1", "alpha_2"]
+        assert index.suggest("alpha 3") == []
+        assert index.suggest("alpha renamed 1") == [("alpha_1", "Alpha renamed 1")]
+        
+        # A removal after the first merge is dropped without shortening the results
+        index.suggest("alpha")
+        store.remove("alpha_0")
+        assert [species_id for species_id, _ in index.suggest("alpha", 2)] == ["alpha_1", "alpha_2"]
 
 class TestIdentificationAPI:
     """Test plant identification endpoints"""
@@ -184,6 +453,225 @@ class TestIdentificationAPI:
             assert "confidence" in result
             assert "family" in result
     
+    def test_identify_repeat_upload_is_cached(self):
+        """Test that re-uploading the same image is served from the result cache"""
+        headers = {"X-API-Key": "partner_key_abc"}
+        image_bytes = self.create_test_image().getvalue()
+        
+        first = client.post("/api/v1/identify/", headers=headers, files={"file": ("a.jpg", image_bytes, "image/jpeg")})
+        second = client.post("/api/v1/identify/", headers=headers, files={"file": ("b.jpg", image_bytes, "image/jpeg")})
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json()["metadata"]["cache_hit"] is True
+        assert second.json()["image_info"] == first.json()["image_info"]
+        assert second.json()["metadata"]["decoded_pixels"] == 0
+    
+    def test_identify_with_tta(self):
+        """Test test-time augmentation on a paid tier and its tier restriction"""
+        image_bytes = self.create_test_image().getvalue()
+        
+        response = client.post(
+            "/api/v1/identify/?tta=true",
+            headers={"X-API-Key": "partner_key_abc"},
+            files={"file": ("tta.jpg", image_bytes, "image/jpeg")}
+        )
+        assert response.status_code == 200
+        assert response.json()["metadata"]["tta_views"] == settings.TTA_VIEWS
+        
+        response = client.post(
+            "/api/v1/identify/?tta=true",
+            headers={"X-API-Key": "free_demo_key_123"},
+            files={"file": ("tta.jpg", image_bytes, "image/jpeg")}
+        )
+        assert response.status_code == 403
+        
+        status = client.get("/api/v1/identify/status", headers={"X-API-Key": "partner_key_abc"}).json()
+        assert status["tta"]["total_items"] >= 1
+    
+    def test_identify_near_duplicate_is_cached(self):
+        """Test that a resized re-upload is matched by perceptual hash"""
+        headers = {"X-API-Key": "partner_key_abc"}
+        img = Image.new('RGB', (200, 200))
+        img.putdata([(x, y, (x + y) % 256) if (x // 25 + y // 25) % 2 else (0, 120, 0) for y in range(200) for x in range(200)])
+        original = io.BytesIO()
+        img.save(original, format='JPEG')
+        resized = io.BytesIO()
+        img.resize((120, 120)).save(resized, format='PNG')
+        
+        first = client.post("/api/v1/identify/", headers=headers, files={"file": ("a.jpg", original.getvalue(), "image/jpeg")})
+        second = client.post("/api/v1/identify/", headers=headers, files={"file": ("b.png", resized.getvalue(), "image/png")})
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json()["metadata"]["cache_match"] == "near_duplicate"
+        assert second.json()["image_info"]["width"] == 120
+    
+    def test_identify_batch(self):
+        """Test batch identification streams one result per image"""
+        headers = {"X-API-Key": "professional_key_456"}
+        files = [
+            ("files", (f"plant_{i}.jpg", self.create_test_image(), "image/jpeg"))
+            for i in range(3)
+        ]
+        files.append(("files", ("notes.txt", io.BytesIO(b"not an image"), "text/plain")))
+        
+        response = client.post("/api/v1/identify/batch", headers=headers, files=files)
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+        items, summary = lines[:-1], lines[-1]
+        
+        assert len(items) == 4
+        assert sorted(item["index"] for item in items) == [0, 1, 2, 3]
+        assert summary["done"] is True
+        assert summary["succeeded"] == 3
+        assert summary["failed"] == 1
+    
+    def test_identify_batch_archive(self):
+        """Test batch identification from a zip archive of images"""
+        import zipfile
+        headers = {"X-API-Key": "professional_key_456"}
+        
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i in range(2):
+                zf.writestr(f"survey/plant_{i}.jpg", self.create_test_image().getvalue())
+            zf.writestr("survey/readme.md", "ignored")
+        archive.seek(0)
+        
+        files = {"files": ("survey.zip", archive, "application/zip")}
+        response = client.post("/api/v1/identify/batch", headers=headers, files=files)
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+        assert lines[-1]["succeeded"] == 2
+        assert {item["filename"] for item in lines[:-1]} == {"survey/plant_0.jpg", "survey/plant_1.jpg"}
+    
+    def test_identify_batch_archive_with_bad_members(self):
+        """Test that corrupt and bad-CRC zip members fail on their own without ending the stream"""
+        import struct
+        import zipfile
+        headers = {"X-API-Key": "professional_key_456"}
+        
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("survey/corrupt.jpg", self.create_test_image().getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr("survey/bad_crc.jpg", self.create_test_image().getvalue(), compress_type=zipfile.ZIP_STORED)
+            zf.writestr("survey/good.jpg", self.create_test_image().getvalue())
+            members = {info.filename: info for info in zf.infolist()}
+        data = bytearray(archive.getvalue())
+        
+        def data_offset(info):
+            # Member data follows the 30-byte local header, its file name and extra field
+            name_length, extra_length = struct.unpack("<HH", data[info.header_offset + 26:info.header_offset + 30])
+            return info.header_offset + 30 + name_length + extra_length
+        
+        # Garbage in the deflate stream (zlib.error) and one flipped byte of stored data (bad CRC)
+        corrupt = data_offset(members["survey/corrupt.jpg"])
+        data[corrupt:corrupt + 16] = b"\xff" * 16
+        data[data_offset(members["survey/bad_crc.jpg"]) + 100] ^= 0xFF
+        
+        files = {"files": ("survey.zip", io.BytesIO(bytes(data)), "application/zip")}
+        response = client.post("/api/v1/identify/batch", headers=headers, files=files)
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+        items = {item["filename"]: item for item in lines[:-1]}
+        assert items["survey/corrupt.jpg"]["status"] == "failed"
+        assert "Unreadable archive member" in items["survey/corrupt.jpg"]["error"]
+        assert "CRC" in items["survey/bad_crc.jpg"]["error"]
+        assert items["survey/good.jpg"]["status"] == "completed"
+        assert lines[-1]["done"] is True
+        assert lines[-1]["succeeded"] == 1
+        assert lines[-1]["failed"] == 2
+    
+    def test_identify_batch_requires_paid_tier(self):
+        """Test batch identification is not available on the free tier"""
+        headers = {"X-API-Key": "free_demo_key_123"}
+        files = {"files": ("test_plant.jpg", self.create_test_image(), "image/jpeg")}
+        response = client.post("/api/v1/identify/batch", headers=headers, files=files)
+        assert response.status_code == 403
+    
+    def test_identify_sheds_when_queue_wait_exceeds_deadline(self, monkeypatch):
+        """Test that a saturated queue answers 503 with Retry-After instead of queueing"""
+        from api.v1.endpoints import identify
+        from ml.priority import TierScheduler
+        
+        scheduler = TierScheduler(max_concurrency=1)
+        scheduler._service_time = 5.0
+        scheduler._active_total = 1
+        scheduler._active["enterprise"] = 1
+        monkeypatch.setattr(identify, "tier_scheduler", scheduler)
+        
+        headers = {"X-API-Key": "professional_key_456", "X-Request-Timeout": "1"}
+        files = {"file": ("test_plant.jpg", self.create_test_image(), "image/jpeg")}
+        response = client.post("/api/v1/identify/", headers=headers, files=files)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert scheduler.get_stats()["tiers"]["professional"]["shed_by_reason"]["deadline"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_coalesced_request_retries_when_leader_is_shed(self, monkeypatch):
+        """Test that a request coalesced onto a shed free-tier leader is retried under its own tier"""
+        from api.v1.endpoints import identify
+        from ml.priority import AdmissionRejected
+        from ml.singleflight import SingleFlight
+        
+        calls = []
+        
+        async def identify_prioritized(image_data, digest, tier, deadline=None, tta=False):
+            calls.append((tier, tta))
+            await asyncio.sleep(0.05)
+            if tier == "free":
+                raise AdmissionRejected("Free tier is saturated", "deadline")
+            return identify.IdentificationOutcome(image_info={}, results=[], model_version="v1")
+        
+        monkeypatch.setattr(identify, "identify_prioritized", identify_prioritized)
+        monkeypatch.setattr(identify, "single_flight", SingleFlight())
+        monkeypatch.setattr(identify, "result_cache", None)
+        
+        free = asyncio.ensure_future(identify.run_identification(b"same image", tier="free"))
+        await asyncio.sleep(0)
+        partner = asyncio.ensure_future(identify.run_identification(b"same image", tier="partner"))
+        tta = asyncio.ensure_future(identify.run_identification(b"same image", tier="partner", tta=True))
+        
+        with pytest.raises(AdmissionRejected):
+            await free
+        assert (await partner).cache_match is None
+        await tta
+        # The TTA request ran its own flight from the start, the partner one after the free leader was shed
+        assert sorted(calls) == [("free", False), ("partner", False), ("partner", True)]
+    
+    def test_identification_statistics(self, monkeypatch, tmp_path):
+        """Test that history statistics aggregate top species and packed candidates"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base
+        from ml.history import IdentificationWriter
+        from api.v1.endpoints import identify
+        
+        engine = create_engine(f"sqlite:///{tmp_path}/history.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        writer = IdentificationWriter(session_factory=sessionmaker(bind=engine), flush_interval=60)
+        for i, predictions in enumerate([
+            [("ficus_benjamina", 0.8), ("plumeria_rubra", 0.1)],
+            [("ficus_benjamina", 0.6), ("plumeria_rubra", 0.3)]
+        ]):
+            writer.record({
+                "image_path": f"sha256:{i}",
+                "species_code": predictions[0][0],
+                "confidence_score": predictions[0][1],
+                "predictions": predictions,
+                "created_at": datetime.utcnow()
+            })
+        asyncio.run(writer.flush())
+        monkeypatch.setattr(identify, "history_writer", writer)
+        
+        headers = {"X-API-Key": "free_demo_key_123"}
+        response = client.get("/api/v1/identify/stats?days=1", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["top_species"] == [{"species_id": "ficus_benjamina", "identifications": 2, "mean_confidence": 0.7}]
+        candidates = {row["species_id"]: row for row in data["candidates"]}
+        assert candidates["plumeria_rubra"]["candidate_count"] == 2
+        assert candidates["plumeria_rubra"]["top1_count"] == 0
+    
     def test_identify_status(self):
         """Test identification service status"""
         headers = {"X-API-Key": "free_demo_key_123"}
@@ -257,6 +745,24 @@ class TestErrorHandling:
         response = client.post("/api/v1/identify/", headers=headers, files=files)
         assert response.status_code == 400
 
+    def test_oversized_upload_is_rejected_before_parsing(self):
+        """Test that an upload declaring more than the size limit gets 413"""
+        headers = {"X-API-Key": "partner_key_abc"}
+        oversized = b"\xff\xd8\xff" + b"\0" * (settings.MAX_FILE_SIZE + 100 * 1024)
+        files = {"file": ("huge.jpg", oversized, "image/jpeg")}
+        
+        response = client.post("/api/v1/identify/", headers=headers, files=files)
+        assert response.status_code == 413
+        assert response.json()["error"]["code"] == 413
+    
+    def test_disguised_upload_is_rejected(self):
+        """Test that non-image bytes sent with an image content type are rejected"""
+        headers = {"X-API-Key": "partner_key_abc"}
+        files = {"file": ("fake.jpg", io.BytesIO(b"<?php echo 'hi'; ?>"), "image/jpeg")}
+        
+        response = client.post("/api/v1/identify/", headers=headers, files=files)
+        assert response.status_code == 400
+
 class TestIntegration:
     """Test integration functionality"""
     
@@ -0,0 +1,1178 @@
+import pytest
+import asyncio
+import time
+import io
+import random
+from datetime import datetime
+from PIL import Image
+
+# Import the ML package
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.executor import InferenceExecutor, InferenceQueueFull
+from ml.batching import BatchScheduler
+from ml.cache import ResultCache, content_hash
+from ml.phash import BKTree, NearDuplicateIndex, dhash, hamming_distance
+from ml.singleflight import SingleFlight
+from ml.decode import ImageDecodeError, decode_for_model, decode_model_input, read_image_info
+from ml.roi import decode_roi_for_model, find_roi
+from ml.preprocessing import Preprocessor, IMAGENET_MEAN, IMAGENET_STD
+from ml.models import CPUModelBackend, EmbeddingModelBackend, MockModelBackend, ModelNotAvailable, save_embedding_model, save_linear_model
+from ml.embeddings import SpeciesEmbeddingIndex, append_species, save_species_index
+from ml.ann import IVFPQIndex, build_index
+import pickle
+from ml.registry import ModelManager, ModelRegistry, RegistryError
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, Identification, IdentificationJob, SpeciesCode
+from ml.jobs import JobQueue
+from ml.history import IdentificationWriter
+from ml.predictions import PREDICTION_DTYPE, SpeciesCodebook, candidate_statistics, decode_many, decode_predictions, encode_predictions, top_species_counts
+from ml.priority import AdmissionRejected, TierScheduler
+from ml.upload import UploadTooLarge, read_upload
+from middleware.upload_limit import UploadLimitMiddleware
+from middleware.admission import AdmissionMiddleware
+from fastapi import UploadFile
+import hashlib
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Session factory over a fresh SQLite database with all tables created"""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class TestInferenceExecutor:
+    """Test the inference executor"""
+    
+    @pytest.mark.asyncio
+    async def test_run_returns_result(self):
+        """Test that work submitted to the pool returns its result"""
+        executor = InferenceExecutor(kind="thread", max_workers=2, queue_size=2)
+        try:
+            result = await executor.run(sum, [1, 2, 3])
+            assert result == 6
+            stats = executor.get_stats()
+            assert stats["completed"] == 1
+            assert stats["pending"] == 0
+        finally:
+            executor.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_blocking_work_does_not_block_loop(self):
+        """Test that concurrent blocking jobs overlap instead of running serially"""
+        executor = InferenceExecutor(kind="thread", max_workers=4, queue_size=0)
+        try:
+            start_time = time.perf_counter()
+            await asyncio.gather(*[executor.run(time.sleep, 0.1) for _ in range(4)])
+            assert time.perf_counter() - start_time < 0.3
+        finally:
+            executor.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_queue_full_rejects(self):
+        """Test that jobs beyond workers + queue size are rejected"""
+        executor = InferenceExecutor(kind="thread", max_workers=1, queue_size=1)
+        try:
+            jobs = [asyncio.ensure_future(executor.run(time.sleep, 0.1)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(InferenceQueueFull):
+                await executor.run(time.sleep, 0.1)
+            await asyncio.gather(*jobs)
+            assert executor.get_stats()["rejected"] == 1
+        finally:
+            executor.shutdown()
+    
+    def test_invalid_kind(self):
+        """Test that unknown executor kinds are refused"""
+        with pytest.raises(ValueError):
+            InferenceExecutor(kind="gpu")
+
+class TestBatchScheduler:
+    """Test the micro-batching scheduler"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_items_share_a_batch(self):
+        """Test that concurrent submissions are predicted in one batch"""
+        calls = []
+        
+        def predict_batch(items):
+            calls.append(list(items))
+            return [item * 2 for item in items]
+        
+        executor = InferenceExecutor(kind="thread", max_workers=1, queue_size=4)
+        scheduler = BatchScheduler(predict_batch, executor, max_batch_size=4, max_wait_ms=50)
+        try:
+            results = await asyncio.gather(*[scheduler.submit(i) for i in range(4)])
+            assert results == [0, 2, 4, 6]
+            assert calls == [[0, 1, 2, 3]]
+            stats = scheduler.get_stats()
+            assert stats["total_batches"] == 1
+            assert stats["batch_size_histogram"] == {4: 1}
+        finally:
+            executor.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_partial_batch_flushes_after_wait(self):
+        """Test that a lone item is dispatched once max_wait_ms elapses"""
+        executor = InferenceExecutor(kind="thread", max_workers=1, queue_size=4)
+        scheduler = BatchScheduler(lambda items: [item + 1 for item in items], executor, max_batch_size=8, max_wait_ms=5)
+        try:
+            assert await asyncio.wait_for(scheduler.submit(41), timeout=1) == 42
+            assert scheduler.get_stats()["avg_batch_size"] == 1.0
+        finally:
+            executor.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_batch_failure_reaches_every_caller(self):
+        """Test that a failing batch raises in each waiting caller"""
+        def predict_batch(items):
+            raise RuntimeError("model crashed")
+        
+        executor = InferenceExecutor(kind="thread", max_workers=1, queue_size=4)
+        scheduler = BatchScheduler(predict_batch, executor, max_batch_size=2, max_wait_ms=50)
+        try:
+            results = await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+            assert all(isinstance(result, RuntimeError) for result in results)
+            assert scheduler.get_stats()["failed_batches"] == 1
+        finally:
+            executor.shutdown()
+
+class TestResultCache:
+    """Test the identification result cache"""
+    
+    @pytest.mark.asyncio
+    async def test_hit_and_miss_counters(self):
+        """Test that lookups are counted as hits or misses"""
+        cache = ResultCache(max_entries=4)
+        key = ResultCache.make_key(content_hash(b"image"), "v1")
+        
+        assert await cache.get(key) is None
+        await cache.set(key, {"results": [1, 2]})
+        assert await cache.get(key) == {"results": [1, 2]}
+        assert await cache.get(ResultCache.make_key(content_hash(b"image"), "v2")) is None
+        
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = ResultCache(max_entries=2)
+        await cache.set("a", {"v": 1})
+        await cache.set("b", {"v": 2})
+        await cache.get("a")
+        await cache.set("c", {"v": 3})
+        
+        assert await cache.get("b") is None
+        assert await cache.get("a") == {"v": 1}
+        assert cache.get_stats()["evictions"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_ttl_expiry(self):
+        """Test that expired entries are not returned"""
+        cache = ResultCache(ttl_seconds=-1)
+        await cache.set("a", {"v": 1})
+        assert await cache.get("a") is None
+        assert cache.get_stats()["expirations"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_memory_eviction(self, tmp_path):
+        """Test that entries evicted from memory are served from disk"""
+        cache = ResultCache(max_entries=1, disk_path=str(tmp_path))
+        await cache.set("a", {"v": 1})
+        await cache.set("b", {"v": 2})
+        
+        assert await cache.get("a") == {"v": 1}
+        assert cache.get_stats()["disk_hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_disk_tier_is_bounded_and_swept(self, tmp_path):
+        """Test LRU eviction past the disk cap, sweeping of expired files and re-indexing on start"""
+        def files():
+            return sorted(str(path) for path in tmp_path.rglob("*.json"))
+        
+        cache = ResultCache(max_entries=1, disk_path=str(tmp_path), disk_max_entries=2)
+        await cache.set("a", {"v": 1})
+        await cache.set("b", {"v": 2})
+        cache.clear()
+        assert await cache.get("a") == {"v": 1}
+        await cache.set("c", {"v": 3})
+        
+        # "b" was the least recently used file
+        cache.clear()
+        assert await cache.get("b") is None
+        assert len(files()) == 2
+        assert cache.get_stats()["disk_evictions"] == 1
+        
+        # A restarted cache indexes the existing files and sweeps them once expired
+        restarted = ResultCache(disk_path=str(tmp_path), ttl_seconds=0.05, disk_sweep_seconds=0)
+        assert restarted.get_stats()["disk_entries"] == 2
+        time.sleep(0.1)
+        assert restarted.sweep_disk() == 2
+        assert files() == []
+        assert restarted.get_stats()["disk_bytes"] == 0
+
+class TestSingleFlight:
+    """Test in-flight request coalescing"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_share_one_call(self):
+        """Test that concurrent calls with the same key run the work once"""
+        single_flight = SingleFlight()
+        calls = []
+        
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+        
+        outcomes = await asyncio.gather(*[single_flight.do("key", work) for _ in range(5)])
+        assert [result for result, _ in outcomes] == ["result"] * 5
+        assert sorted(coalesced for _, coalesced in outcomes) == [False, True, True, True, True]
+        assert len(calls) == 1
+        assert single_flight.get_stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_errors_reach_all_waiters_and_clear_key(self):
+        """Test that a failure is shared and the next call starts fresh"""
+        single_flight = SingleFlight()
+        
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        outcomes = await asyncio.gather(single_flight.do("key", failing), single_flight.do("key", failing), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        
+        async def succeeding():
+            return 42
+        
+        assert await single_flight.do("key", succeeding) == (42, False)
+    
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_does_not_cancel_followers(self):
+        """Test that a disconnecting first caller leaves the shared work running"""
+        single_flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+        
+        leader = asyncio.ensure_future(single_flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("done", True)
+
+def create_gradient_image(size=(320, 240), format="JPEG", quality=90) -> bytes:
+    """Create a test image with enough structure for perceptual hashing"""
+    img = Image.new("RGB", size)
+    img.putdata([
+        ((x * 255) // size[0], (y * 255) // size[1], ((x // 40 + y // 40) % 2) * 200)
+        for y in range(size[1]) for x in range(size[0])
+    ])
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format=format, quality=quality)
+    return img_bytes.getvalue()
+
+class TestPerceptualHash:
+    """Test perceptual hashing and the near-duplicate index"""
+    
+    def test_resized_recompressed_image_is_close(self):
+        """Test that resizing and recompression barely change the dHash of the model input"""
+        original = create_gradient_image()
+        resized = Image.open(io.BytesIO(original)).resize((160, 120))
+        resized_bytes = io.BytesIO()
+        resized.save(resized_bytes, format="PNG")
+        
+        distance = hamming_distance(dhash(decode_for_model(original)), dhash(decode_for_model(resized_bytes.getvalue())))
+        assert distance <= 6
+    
+    def test_bk_tree_matches_brute_force(self):
+        """Test that BK-tree range queries return exactly the brute-force matches"""
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+        
+        query = hashes[0] ^ 0b1011
+        expected = sorted(i for i, h in enumerate(hashes) if hamming_distance(query, h) <= 20)
+        found = sorted(value for _, _, value in tree.search(query, 20))
+        assert found == expected
+    
+    def test_index_lookup_and_rebuild(self):
+        """Test near-duplicate lookups and bounded index size"""
+        index = NearDuplicateIndex(max_distance=2, max_entries=4)
+        index.add(0b1111, "a")
+        assert index.lookup(0b1110) == ("a", 1 - 1 / 64)
+        assert index.lookup(0b0000) is None
+        
+        for i in range(5):
+            index.add(1 << (10 + i * 4), f"d{i}")
+        stats = index.get_stats()
+        assert stats["rebuilds"] == 1
+        assert stats["entries"] <= 4
+
+class TestDecode:
+    """Test the header-only validation and reduced decode path"""
+    
+    def test_read_image_info_from_header(self):
+        """Test that metadata comes back without decoding pixels"""
+        info = read_image_info(create_gradient_image(size=(320, 240)))
+        assert info["width"] == 320
+        assert info["height"] == 240
+        assert info["format"] == "JPEG"
+    
+    def test_invalid_images_are_rejected(self):
+        """Test that non-images and oversized images fail validation"""
+        with pytest.raises(ImageDecodeError):
+            read_image_info(b"This is not an image")
+        
+        img_bytes = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(img_bytes, format="GIF")
+        with pytest.raises(ImageDecodeError):
+            read_image_info(img_bytes.getvalue())
+    
+    def test_decode_scales_to_model_input(self):
+        """Test that large JPEGs and PNGs decode with the shorter side at the model size"""
+        jpeg = decode_for_model(create_gradient_image(size=(1600, 1200)), target=224)
+        assert jpeg.size == (299, 224)
+        assert jpeg.mode == "RGB"
+        
+        png = decode_for_model(create_gradient_image(size=(600, 800), format="PNG"), target=224)
+        assert png.size == (224, 299)
+    
+    def create_field_photo(self, size=(2400, 1800), patch=(1600, 200, 2200, 800), format="JPEG") -> bytes:
+        """A smooth background with a small, busy green subject"""
+        width, height = size
+        rng = np.random.default_rng(0)
+        x = np.linspace(0, 30, width)[None, :]
+        y = np.linspace(0, 30, height)[:, None]
+        pixels = np.stack(np.broadcast_arrays(150 + x, 140 + y, 120 + 0 * x), axis=-1)
+        left, top, right, bottom = patch
+        texture = rng.integers(0, 256, (bottom - top, right - left, 3))
+        texture[..., 1] = np.clip(texture[..., 1] + 80, 0, 255)
+        pixels[top:bottom, left:right] = texture
+        img_bytes = io.BytesIO()
+        Image.fromarray(pixels.astype(np.uint8)).save(img_bytes, format=format)
+        return img_bytes.getvalue()
+    
+    def test_roi_finds_salient_region(self):
+        """Test that the region covers the subject and a featureless frame yields none"""
+        draft = Image.open(io.BytesIO(self.create_field_photo())).resize((320, 240))
+        left, top, right, bottom = find_roi(draft)
+        assert left <= 1600 / 2400 and right >= 2200 / 2400
+        assert top <= 200 / 1800 and bottom >= 800 / 1800
+        assert (right - left) * (bottom - top) < 0.25
+        
+        assert find_roi(Image.new("RGB", (320, 240), (90, 140, 60))) is None
+    
+    def test_roi_decode_crops_at_model_resolution(self):
+        """Test that the crop is decoded from a finer DCT scale than the plain path and is counted"""
+        data = self.create_field_photo()
+        plain, plain_pixels = decode_model_input(data, target=224)
+        crop, decoded_pixels, region = decode_roi_for_model(data, target=224)
+        
+        assert crop.size == (224, 224)
+        assert region[0] <= 1600 and region[2] >= 2200
+        # Draft plus a crop-sized decode; the plain path decodes one frame at 1/8 scale
+        assert plain_pixels == 300 * 225
+        assert decoded_pixels > plain_pixels
+        assert decoded_pixels < 2400 * 1800 // 3
+        
+        png_crop, png_pixels, png_region = decode_roi_for_model(self.create_field_photo(format="PNG"), target=224)
+        assert png_pixels == 2400 * 1800
+        assert png_region[0] <= 1600 and png_region[2] >= 2200
+
+class TestPreprocessor:
+    """Test the vectorized preprocessing pipeline"""
+    
+    def test_batch_layout_and_normalization(self):
+        """Test that images become a normalized contiguous NCHW float32 batch"""
+        preprocessor = Preprocessor(size=64)
+        image = Image.open(io.BytesIO(create_gradient_image(size=(96, 64), format="PNG")))
+        batch = preprocessor([image, image])
+        
+        assert batch.shape == (2, 3, 64, 64)
+        assert batch.dtype == np.float32
+        assert batch.flags["C_CONTIGUOUS"]
+        
+        expected = np.asarray(image.crop((16, 0, 80, 64)), dtype=np.float32) / 255
+        expected = (expected - np.array(IMAGENET_MEAN, dtype=np.float32)) / np.array(IMAGENET_STD, dtype=np.float32)
+        np.testing.assert_allclose(batch[1], expected.transpose(2, 0, 1), atol=1e-5)
+    
+    def test_buffer_is_reused(self):
+        """Test that consecutive batches reuse the same preallocated buffer"""
+        preprocessor = Preprocessor(size=32)
+        images = [Image.new("RGB", (48, 32), (10, 20, 30))] * 4
+        first = preprocessor(images)
+        second = preprocessor(images[:2])
+        assert np.shares_memory(first, second)
+    
+    def test_grayscale_input_is_converted(self):
+        """Test that non-RGB images are converted before normalization"""
+        batch = Preprocessor(size=16)([Image.new("L", (16, 16), 128)])
+        assert batch.shape == (1, 3, 16, 16)
+    
+    def test_augmented_views_share_one_normalization(self):
+        """Test that TTA views are crops and flips of a single normalized image"""
+        preprocessor = Preprocessor(size=56)
+        image = Image.open(io.BytesIO(create_gradient_image(size=(96, 64), format="PNG")))
+        batch = preprocessor.augment([image, image], views=6)
+        assert batch.shape == (12, 3, 56, 56)
+        
+        full = preprocessor.augment([image], views=1)  # center crop of the 64x64 TTA resize
+        np.testing.assert_array_equal(batch[1], batch[0][:, :, ::-1])
+        np.testing.assert_array_equal(batch[6:], batch[:6])
+        assert not np.array_equal(batch[2], batch[5])
+        np.testing.assert_array_equal(full[0], batch[0])
+        
+        with pytest.raises(ValueError):
+            preprocessor.augment([image], views=11)
+
+def create_linear_model(path, version="linear-v1", grid=4, num_species=3):
+    """Write a tiny CPU model whose species i responds to channel i brightness"""
+    weights = np.zeros((3 * grid * grid, num_species), dtype=np.float32)
+    for species in range(num_species):
+        weights[species % 3 * grid * grid:(species % 3 + 1) * grid * grid, species] = 1.0
+    labels = [
+        {
+            "species_id": f"species_{i}",
+            "scientific_name": f"Species {i}",
+            "common_name": f"Species {i}",
+            "family": "Testaceae",
+            "genus": "Species"
+        }
+        for i in range(num_species)
+    ]
+    save_linear_model(str(path), weights, labels, version=version, grid=grid)
+
+class TestModelBackends:
+    """Test the pluggable model backends"""
+    
+    def test_cpu_backend_lazy_load_and_predict(self, tmp_path):
+        """Test that the CPU backend loads on first use, warms up and predicts"""
+        create_linear_model(tmp_path)
+        backend = CPUModelBackend(str(tmp_path), top_k=2, warmup_iterations=1, input_size=32)
+        assert backend.version == "linear-v1"
+        assert backend.state == "unloaded"
+        
+        green = Image.new("RGB", (32, 32), (0, 255, 0))
+        results = backend.predict(green)
+        
+        assert backend.state == "ready"
+        assert backend.get_status()["warmup_time"] is not None
+        assert isinstance(backend.weights, np.memmap)
+        assert len(results) == 2
+        assert results[0]["species_id"] == "species_1"
+        assert results[0]["confidence"] >= results[1]["confidence"]
+    
+    def test_augmented_prediction_averages_logits(self, tmp_path):
+        """Test that TTA runs all views as one batch and averages their logits"""
+        create_linear_model(tmp_path)
+        backend = CPUModelBackend(str(tmp_path), warmup_iterations=0, input_size=32)
+        images = [Image.new("RGB", (40, 40), (200, 30, 30)), Image.new("RGB", (40, 40), (30, 30, 200))]
+        
+        results = backend.predict_augmented(images, views=4)
+        assert [r[0]["species_id"] for r in results] == ["species_0", "species_2"]
+        
+        views = backend.preprocessor.augment(images, views=4).copy()
+        logits = backend._logits(views).reshape(2, 4, -1).mean(axis=1)
+        expected = np.exp(logits - logits.max(axis=1, keepdims=True))
+        expected /= expected.sum(axis=1, keepdims=True)
+        assert results[1][0]["confidence"] == round(float(expected[1].max()), 3)
+    
+    def test_missing_model_reports_failure(self, tmp_path):
+        """Test that a missing model directory fails cleanly"""
+        backend = CPUModelBackend(str(tmp_path / "missing"), input_size=32)
+        with pytest.raises(ModelNotAvailable):
+            backend.predict(Image.new("RGB", (32, 32)))
+        assert backend.get_status()["state"] == "failed"
+    
+    def test_pickling_ships_recipe_not_weights(self, tmp_path):
+        """Test that process pools receive a small picklable backend"""
+        create_linear_model(tmp_path)
+        backend = CPUModelBackend(str(tmp_path), input_size=32)
+        backend.load()
+        restored = pickle.loads(pickle.dumps(backend))
+        assert restored.model_path == backend.model_path
+        assert pickle.loads(pickle.dumps(backend)) is restored
+    
+    @pytest.mark.asyncio
+    async def test_process_executor_runs_backend(self):
+        """Test that batched prediction works on a process pool"""
+        executor = InferenceExecutor(kind="process", max_workers=1, queue_size=1)
+        backend = MockModelBackend(input_size=32)
+        try:
+            batch = np.zeros((2, 3, 32, 32), dtype=np.float32)
+            results = await executor.run(backend.predict_batch, batch)
+            assert len(results) == 2
+        finally:
+            executor.shutdown()
+
+class TestModelRegistry:
+    """Test the versioned model registry and hot swapping"""
+    
+    def create_registry(self, tmp_path) -> ModelRegistry:
+        registry = ModelRegistry(str(tmp_path / "registry"))
+        for version in ("v1", "v2"):
+            create_linear_model(tmp_path / version, version=version)
+            registry.register(version, str(tmp_path / version))
+        registry.activate("v1")
+        return registry
+    
+    def test_activate_and_rollback(self, tmp_path):
+        """Test that rollback is a single registry operation"""
+        registry = self.create_registry(tmp_path)
+        registry.activate("v2")
+        assert registry.active_version() == "v2"
+        
+        assert registry.rollback() == "v1"
+        assert registry.active_version() == "v1"
+        assert {entry["version"] for entry in registry.list_versions()} == {"v1", "v2"}
+        
+        with pytest.raises(RegistryError):
+            registry.activate("v3")
+    
+    @pytest.mark.asyncio
+    async def test_manager_hot_swaps_after_warm_up(self, tmp_path):
+        """Test that the manager swaps to the newly active version and tags predictions"""
+        registry = self.create_registry(tmp_path)
+        manager = ModelManager(registry.create_backend("v1"), registry)
+        batch = np.zeros((1, 3, 224, 224), dtype=np.float32)
+        assert manager.predict_batch(batch)[0][0] == "v1"
+        
+        assert await manager.check_for_update() is False
+        registry.activate("v2")
+        assert await manager.check_for_update() is True
+        assert manager.current.is_ready
+        assert manager.predict_batch(batch)[0][0] == "v2"
+        
+        registry.rollback()
+        assert await manager.check_for_update() is True
+        assert manager.version == "v1"
+        assert manager.get_status()["registry"]["swaps"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_broken_version_keeps_serving_old_model(self, tmp_path):
+        """Test that a version that fails to load is not swapped in"""
+        registry = self.create_registry(tmp_path)
+        os.remove(os.path.join(registry.version_path("v2"), "weights.npy"))
+        manager = ModelManager(registry.create_backend("v1"), registry)
+        
+        registry.activate("v2")
+        assert await manager.check_for_update() is False
+        assert manager.version == "v1"
+        assert manager.get_status()["registry"]["failed_version"] == "v2"
+    
+    @pytest.mark.asyncio
+    async def test_add_species_registers_a_new_version(self, tmp_path):
+        """Test that appended species arrive as a new version that hot-swaps in, leaving the base intact"""
+        rng = np.random.default_rng(2)
+        grid = 4
+        labels = [{"species_id": name, "scientific_name": name.title()} for name in ("red", "blue")]
+        save_embedding_model(str(tmp_path / "emb"), rng.normal(size=(3 * grid * grid, 16)), rng.normal(size=(2, 16)), labels, version="emb-v1", grid=grid)
+        registry = ModelRegistry(str(tmp_path / "registry"))
+        registry.register("emb-v1", str(tmp_path / "emb"), backend="embedding", activate=True)
+        manager = ModelManager(registry.create_backend("emb-v1"), registry)
+        
+        yellow = Image.new("RGB", (64, 64), (230, 220, 20))
+        manager.load()
+        prototype = manager.current.embed(manager.current.preprocessor([yellow]))
+        registry.add_species("emb-v2", "emb-v1", prototype, [{"species_id": "yellow", "scientific_name": "Yellow"}])
+        with pytest.raises(RegistryError):
+            registry.add_species("emb-v3", "emb-v1", prototype, labels[:1])
+        assert not os.path.exists(tmp_path / "registry" / "emb-v3")
+        
+        registry.activate("emb-v2")
+        assert await manager.check_for_update() is True
+        version, results = manager.predict_batch([yellow])[0]
+        assert version == "emb-v2"
+        assert results[0]["species_id"] == "yellow"
+        base = registry.create_backend("emb-v1")
+        base.load()
+        assert base.get_status()["species_index"]["species"] == 2
+
+class TestJobQueue:
+    """Test the persistent identification job queue"""
+    
+    @pytest.mark.asyncio
+    async def test_job_completes_and_drops_image(self, session_factory):
+        """Test that a queued job is processed by the worker pool and long-polled"""
+        async def process(job):
+            return {"size": len(job["image_data"]), "user_id": job["user_id"]}
+        
+        queue = JobQueue(process, session_factory=session_factory, workers=2, poll_seconds=0.05)
+        await queue.start()
+        try:
+            job_id = await queue.enqueue(b"abc", "leaf.jpg", "user_1", "basic")
+            job = await queue.wait(job_id, timeout=5)
+        finally:
+            await queue.stop()
+        
+        assert job["status"] == "completed"
+        assert job["result"] == {"size": 3, "user_id": "user_1"}
+        assert job["attempts"] == 1
+        assert job["completed_at"] is not None
+        assert queue.get_stats()["completed"] == 1
+        assert await queue.get("missing") is None
+    
+    @pytest.mark.asyncio
+    async def test_retryable_errors_are_requeued(self, session_factory):
+        """Test that retryable errors requeue the job until max_attempts"""
+        async def process(job):
+            raise InferenceQueueFull("busy")
+        
+        queue = JobQueue(
+            process,
+            session_factory=session_factory,
+            workers=1,
+            poll_seconds=0.01,
+            max_attempts=2,
+            retry_exceptions=(InferenceQueueFull,)
+        )
+        await queue.start()
+        try:
+            job_id = await queue.enqueue(b"abc", "leaf.jpg", "user_1", "free")
+            job = await queue.wait(job_id, timeout=5)
+        finally:
+            await queue.stop()
+        
+        assert job["status"] == "failed"
+        assert job["attempts"] == 2
+        assert job["error"] == "busy"
+        assert queue.get_stats()["retried"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stale_jobs_are_recovered_on_start(self, session_factory):
+        """Test that jobs left processing by a crashed worker are picked up again"""
+        crashed = JobQueue(None, session_factory=session_factory)
+        job_id = await crashed.enqueue(b"abc", "leaf.jpg", "user_1", "free")
+        assert (await asyncio.to_thread(crashed._claim))["id"] == job_id
+        
+        async def process(job):
+            return {"ok": True}
+        
+        queue = JobQueue(process, session_factory=session_factory, workers=1, poll_seconds=0.05, stale_seconds=0)
+        await queue.start()
+        try:
+            job = await queue.wait(job_id, timeout=5)
+        finally:
+            await queue.stop()
+        
+        assert job["status"] == "completed"
+        assert job["attempts"] == 2
+        assert queue.get_stats()["recovered"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stale_jobs_are_recovered_while_running(self, session_factory):
+        """Test periodic recovery, and that a job out of attempts is failed rather than requeued"""
+        crashed = JobQueue(None, session_factory=session_factory, max_attempts=2)
+        
+        async def process(job):
+            return {"ok": True}
+        
+        # Both jobs are claimed just before the pool starts, so they are not stale yet when
+        # start() checks and only the periodic recovery can pick them up
+        orphan_id = await crashed.enqueue(b"abc", "leaf.jpg", "user_1", "free")
+        assert (await asyncio.to_thread(crashed._claim))["id"] == orphan_id
+        # A poison job that has already used both its attempts
+        poison_id = await crashed.enqueue(b"abc", "poison.jpg", "user_1", "free")
+        await asyncio.to_thread(crashed._update, poison_id, {
+            IdentificationJob.status: "processing",
+            IdentificationJob.started_at: datetime.utcnow(),
+            IdentificationJob.attempts: 2
+        })
+        
+        queue = JobQueue(process, session_factory=session_factory, workers=1, poll_seconds=0.05, stale_seconds=1.0, max_attempts=2)
+        await queue.start()
+        try:
+            assert queue.get_stats()["recovered"] == 0
+            orphan = await queue.wait(orphan_id, timeout=5)
+            poison = await queue.wait(poison_id, timeout=5)
+        finally:
+            await queue.stop()
+        
+        assert orphan["status"] == "completed"
+        assert orphan["attempts"] == 2
+        assert poison["status"] == "failed"
+        assert poison["attempts"] == 2
+        assert "attempt" in poison["error"]
+
+class TestIdentificationWriter:
+    """Test the write-behind identification history writer"""
+    
+    def make_row(self, i):
+        return {
+            "request_id": f"req-{i}",
+            "api_user_id": "user_1",
+            "image_path": f"sha256:{i:064x}",
+            "species_code": "RT001",
+            "confidence_score": 0.9,
+            "status": "completed"
+        }
+    
+    def count_rows(self, session_factory):
+        db = session_factory()
+        try:
+            return db.query(Identification).count()
+        finally:
+            db.close()
+    
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_early(self, session_factory):
+        """Test that reaching the batch size triggers one bulk insert without waiting for the timer"""
+        writer = IdentificationWriter(session_factory=session_factory, max_batch=4, flush_interval=60)
+        await writer.start()
+        try:
+            for i in range(4):
+                writer.record(self.make_row(i))
+            for _ in range(100):
+                if writer.get_stats()["written"] == 4:
+                    break
+                await asyncio.sleep(0.01)
+            
+            stats = writer.get_stats()
+            assert stats["written"] == 4
+            assert stats["flushes"] == 1
+            assert stats["buffered"] == 0
+            assert stats["flush_latency_ms"]["p50"] > 0
+            assert self.count_rows(session_factory) == 4
+        finally:
+            await writer.stop()
+    
+    @pytest.mark.asyncio
+    async def test_stop_flushes_remaining_records(self, session_factory):
+        """Test that records below the batch size survive a graceful shutdown"""
+        writer = IdentificationWriter(session_factory=session_factory, max_batch=100, flush_interval=60)
+        await writer.start()
+        for i in range(3):
+            writer.record(self.make_row(i))
+        assert writer.get_stats()["buffered"] == 3
+        assert self.count_rows(session_factory) == 0
+        
+        await writer.stop()
+        assert self.count_rows(session_factory) == 3
+        assert writer.get_stats()["buffered"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_full_buffer_drops_and_failed_flush_requeues(self, session_factory):
+        """Test that the buffer stays bounded and rows from a failed insert are kept for the next flush"""
+        writer = IdentificationWriter(session_factory=session_factory, max_batch=2, max_buffer=2)
+        writer._buffer.extend(self.make_row(i) for i in range(2))
+        writer.record(self.make_row(2))
+        assert writer.get_stats()["dropped"] == 1
+        
+        def broken_factory():
+            raise RuntimeError("database is locked")
+        
+        writer.session_factory = broken_factory
+        assert await writer.flush() == 0
+        assert writer.get_stats()["failed_flushes"] == 1
+        assert writer.get_stats()["buffered"] == 2
+        
+        writer.session_factory = session_factory
+        assert await writer.flush() == 2
+        assert self.count_rows(session_factory) == 2
+
+class TestPredictionCodec:
+    """Test the packed prediction_data format and its aggregates"""
+    
+    def test_encode_decode_round_trip(self):
+        """Test that predictions pack into 4 bytes per candidate and decode within float16 precision"""
+        blob = encode_predictions([3, 1, 7], [0.912, 0.051, 0.004])
+        assert len(blob) == 3 * PREDICTION_DTYPE.itemsize
+        
+        records = decode_predictions(blob)
+        assert records["species"].tolist() == [3, 1, 7]
+        assert np.allclose(records["confidence"], [0.912, 0.051, 0.004], atol=1e-3)
+        assert len(decode_predictions(None)) == 0
+        with pytest.raises(ValueError):
+            decode_predictions(b"\x00\x01\x02")
+        # Ids beyond uint16 are refused rather than wrapped onto another species
+        with pytest.raises(ValueError):
+            encode_predictions([70000], [0.5])
+    
+    def test_decode_many_reports_ranks(self):
+        """Test that rows decode together with each candidate's rank inside its row"""
+        records, ranks = decode_many([encode_predictions([1, 2], [0.7, 0.2]), None, encode_predictions([2], [0.9])])
+        assert records["species"].tolist() == [1, 2, 2]
+        assert ranks.tolist() == [0, 1, 0]
+    
+    def test_codebook_assigns_stable_ids(self, session_factory):
+        """Test that species codes get persistent ids shared by a fresh codebook"""
+        codebook = SpeciesCodebook(session_factory)
+        blob = codebook.encode([("ficus_benjamina", 0.8), ("plumeria_rubra", 0.1)])
+        assert codebook.ids(["plumeria_rubra", "ficus_benjamina"]) == [2, 1]
+        
+        decoded = SpeciesCodebook(session_factory).decode(blob)
+        assert [p["species_id"] for p in decoded] == ["ficus_benjamina", "plumeria_rubra"]
+        assert decoded[0]["confidence"] == pytest.approx(0.8, abs=1e-3)
+        
+        # The id value is checked, not just the number of codes
+        db = session_factory()
+        db.add(SpeciesCode(id=70000, code="legacy_code"))
+        db.commit()
+        db.close()
+        with pytest.raises(ValueError):
+            codebook.ids(["dendrobium_nobile"])
+    
+    @pytest.mark.asyncio
+    async def test_aggregates_over_written_history(self, session_factory):
+        """Test that writer rows are packed and aggregated without per-row parsing"""
+        writer = IdentificationWriter(session_factory=session_factory, max_batch=10, flush_interval=60)
+        history = [
+            [("ficus_benjamina", 0.8), ("plumeria_rubra", 0.1)],
+            [("ficus_benjamina", 0.6), ("hibiscus_rosa_sinensis", 0.3)],
+            [("plumeria_rubra", 0.9)]
+        ]
+        for i, predictions in enumerate(history):
+            writer.record({
+                "image_path": f"sha256:{i}",
+                "species_code": predictions[0][0],
+                "confidence_score": predictions[0][1],
+                "predictions": predictions
+            })
+        await writer.stop()
+        
+        db = session_factory()
+        try:
+            top = top_species_counts(db)
+            assert top[0] == {"species_id": "ficus_benjamina", "identifications": 2, "mean_confidence": 0.7}
+            
+            stats = {row["species_id"]: row for row in candidate_statistics(db, writer.codebook, chunk_rows=2)}
+        finally:
+            db.close()
+        assert stats["plumeria_rubra"]["candidate_count"] == 2
+        assert stats["plumeria_rubra"]["top1_count"] == 1
+        assert stats["plumeria_rubra"]["mean_confidence"] == pytest.approx(0.5, abs=1e-3)
+        assert stats["hibiscus_rosa_sinensis"]["top1_count"] == 0
+
+class TestTierScheduler:
+    """Test tier-aware priority scheduling of inference slots"""
+    
+    @pytest.mark.asyncio
+    async def test_paid_tiers_are_served_first(self):
+        """Test that freed slots go to the highest-priority waiter"""
+        scheduler = TierScheduler(max_concurrency=1)
+        order = []
+        
+        async def identify(tier, name):
+            async with scheduler.slot(tier):
+                order.append(name)
+                await asyncio.sleep(0.01)
+        
+        await scheduler.acquire("free")
+        tasks = [asyncio.create_task(identify("free", "free")), asyncio.create_task(identify("professional", "professional"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(identify("partner", "partner")))
+        await asyncio.sleep(0)
+        scheduler.release("free")
+        await asyncio.gather(*tasks)
+        
+        assert order == ["partner", "professional", "free"]
+        assert scheduler.get_stats()["active"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_tier_cap_leaves_room_for_paid_tiers(self):
+        """Test that free-tier requests cannot take every slot and are shed past their queue"""
+        scheduler = TierScheduler(max_concurrency=3, tier_limits={"free": 1}, queue_limits={"free": 1})
+        await scheduler.acquire("free")
+        waiting = asyncio.create_task(scheduler.acquire(None))
+        await asyncio.sleep(0)
+        
+        with pytest.raises(InferenceQueueFull):
+            await scheduler.acquire("free")
+        assert await scheduler.acquire("enterprise") == "enterprise"
+        
+        stats = scheduler.get_stats()["tiers"]
+        assert stats["free"]["active"] == 1
+        assert stats["free"]["waiting"] == 1
+        assert stats["free"]["shed"] == 1
+        
+        scheduler.release("free")
+        assert await waiting == "free"
+    
+    @pytest.mark.asyncio
+    async def test_capped_higher_tier_does_not_block_free_slots(self):
+        """Test that waiters of a tier at its own cap do not hold back lower tiers"""
+        scheduler = TierScheduler(max_concurrency=4, tier_limits={"enterprise": 2}, queue_limits={"free": 0})
+        await scheduler.acquire("enterprise")
+        await scheduler.acquire("enterprise")
+        waiting = asyncio.create_task(scheduler.acquire("enterprise"))
+        await asyncio.sleep(0)
+        
+        assert scheduler.estimated_wait("free") == 0.0
+        assert await scheduler.acquire("free") == "free"
+        stats = scheduler.get_stats()["tiers"]
+        assert stats["free"]["shed"] == 0
+        assert stats["enterprise"]["waiting"] == 1
+        
+        scheduler.release("enterprise")
+        assert await waiting == "enterprise"
+    
+    @pytest.mark.asyncio
+    async def test_middleware_sheds_before_reading_body(self):
+        """Test that a request that cannot be served in time is answered without receiving its body"""
+        scheduler = TierScheduler(max_concurrency=1)
+        await scheduler.acquire("partner")
+        scheduler._service_time = 5.0
+        
+        async def app(scope, receive, send):
+            raise AssertionError("request reached the endpoint")
+        
+        async def receive():
+            raise AssertionError("request body was read")
+        
+        sent = []
+        async def send(message):
+            sent.append(message)
+        
+        middleware = AdmissionMiddleware(app, get_scheduler=lambda: scheduler, paths=["/identify/"])
+        scope = {
+            "type": "http", "method": "POST", "path": "/identify/", "query_string": b"",
+            "headers": [(b"x-request-timeout", b"1")], "state": {"user": {"tier": "free"}}
+        }
+        await middleware(scope, receive, send)
+        start = sent[0]
+        assert start["status"] == 503
+        assert (b"retry-after", b"5") in start["headers"]
+        assert scheduler.get_stats()["tiers"]["free"]["shed_by_reason"]["deadline"] == 1
+        
+        # Async requests become jobs and are not checked
+        passed = []
+        async def job_app(scope, receive, send):
+            passed.append(scope["path"])
+        await AdmissionMiddleware(job_app, get_scheduler=lambda: scheduler, paths=["/identify/"])(
+            {**scope, "query_string": b"async=true"}, receive, send
+        )
+        assert passed == ["/identify/"]
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """Test that a waiter cancelled while queued gives up its place"""
+        scheduler = TierScheduler(max_concurrency=1)
+        await scheduler.acquire("professional")
+        waiting = asyncio.create_task(scheduler.acquire("free"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        
+        scheduler.release("professional")
+        assert scheduler.get_stats()["active"] == 0
+        assert scheduler.get_stats()["tiers"]["free"]["waiting"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_deadlines_shed_requests(self):
+        """Test early rejection on estimated wait and expiry while queued"""
+        scheduler = TierScheduler(max_concurrency=1)
+        await scheduler.acquire("partner")
+        scheduler._service_time = 10.0
+        
+        with pytest.raises(AdmissionRejected) as rejected:
+            await scheduler.acquire("free", deadline=time.monotonic() + 1)
+        assert rejected.value.reason == "deadline"
+        assert rejected.value.retry_after == 10
+        
+        scheduler._service_time = 0.01
+        with pytest.raises(AdmissionRejected) as expired:
+            await scheduler.acquire("free", deadline=time.monotonic() + 0.05)
+        assert expired.value.reason == "expired"
+        
+        stats = scheduler.get_stats()
+        assert stats["waiting"] == 0
+        assert stats["tiers"]["free"]["shed_by_reason"] == {"queue_full": 0, "deadline": 1, "expired": 1}
+
+class TestStreamingUpload:
+    """Test chunked upload reading and early size enforcement"""
+    
+    class CountingFile(io.BytesIO):
+        def __init__(self, data: bytes):
+            super().__init__(data)
+            self.bytes_read = 0
+        
+        def read(self, size: int = -1) -> bytes:
+            chunk = super().read(size)
+            self.bytes_read += len(chunk)
+            return chunk
+    
+    @pytest.mark.asyncio
+    async def test_hash_is_computed_while_reading(self):
+        """Test that chunked reads return the full bytes and their digest"""
+        data = create_gradient_image(size=(400, 300), format="PNG")
+        upload = UploadFile(file=io.BytesIO(data))
+        
+        image_data, digest = await read_upload(upload, chunk_size=1024)
+        assert image_data == data
+        assert digest == hashlib.sha256(data).hexdigest() == content_hash(data)
+    
+    @pytest.mark.asyncio
+    async def test_oversized_upload_stops_early(self):
+        """Test that reading stops at the first chunk past the limit"""
+        fileobj = self.CountingFile(b"\xff\xd8\xff" + b"\0" * 100000)
+        with pytest.raises(UploadTooLarge):
+            await read_upload(UploadFile(file=fileobj), max_size=10000, chunk_size=4096)
+        assert fileobj.bytes_read <= 10000 + 4096
+        
+        # A declared size over the limit is rejected without reading at all
+        fileobj = self.CountingFile(b"\xff\xd8\xff" + b"\0" * 100000)
+        with pytest.raises(UploadTooLarge):
+            await read_upload(UploadFile(file=fileobj, size=100003), max_size=10000)
+        assert fileobj.bytes_read == 0
+    
+    @pytest.mark.asyncio
+    async def test_non_image_upload_stops_after_first_chunk(self):
+        """Test that data without an image signature is rejected after one chunk"""
+        fileobj = self.CountingFile(b"MZ" + b"\0" * 100000)
+        with pytest.raises(ImageDecodeError):
+            await read_upload(UploadFile(file=fileobj), chunk_size=4096)
+        assert fileobj.bytes_read == 4096
+    
+    @pytest.mark.asyncio
+    async def test_middleware_cuts_off_chunked_body(self):
+        """Test that a streamed body without Content-Length is cut off at the limit"""
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect" or not message.get("more_body"):
+                    break
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+        
+        middleware = UploadLimitMiddleware(app, paths=["/upload"], max_body_size=10000)
+        chunks_sent = 0
+        
+        async def receive():
+            nonlocal chunks_sent
+            chunks_sent += 1
+            return {"type": "http.request", "body": b"\0" * 4096, "more_body": True}
+        
+        sent = []
+        async def send(message):
+            sent.append(message)
+        
+        scope = {"type": "http", "method": "POST", "path": "/upload", "headers": []}
+        await middleware(scope, receive, send)
+        assert chunks_sent == 3
+        assert [m["status"] for m in sent if m["type"] == "http.response.start"] == [413]
+
+class TestSpeciesEmbeddingIndex:
+    """Test the memory-mapped species embedding index and nearest-prototype backend"""
+    
+    def create_labels(self, names):
+        return [{"species_id": name, "scientific_name": name.title(), "common_name": name, "family": "Testaceae", "genus": "Species"} for name in names]
+    
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_search_matches_brute_force(self, tmp_path, dtype):
+        """Test that quantized top-k search agrees with exact float32 cosine search"""
+        rng = np.random.default_rng(0)
+        prototypes = rng.normal(size=(500, 32)).astype(np.float32)
+        save_species_index(str(tmp_path), prototypes, self.create_labels([f"s{i}" for i in range(500)]), dtype=dtype)
+        index = SpeciesEmbeddingIndex(str(tmp_path), block_rows=128)
+        assert isinstance(index.embeddings, np.memmap)
+        assert index.embeddings.dtype == np.dtype(dtype)
+        
+        queries = prototypes[:20] + rng.normal(scale=0.1, size=(20, 32)).astype(np.float32)
+        indices, similarities = index.search(queries, k=5)
+        
+        normalized = prototypes / np.linalg.norm(prototypes, axis=1, keepdims=True)
+        exact = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+        assert (indices[:, 0] == np.arange(20)).all()
+        assert (np.diff(similarities, axis=1) <= 0).all()
+        np.testing.assert_allclose(similarities, np.take_along_axis(exact, indices, axis=1), atol=0.02)
+    
+    def test_backend_identifies_and_appends_species(self, tmp_path):
+        """Test nearest-prototype identification and adding a species without retraining"""
+        rng = np.random.default_rng(1)
+        grid = 4
+        projection = rng.normal(size=(3 * grid * grid, 16)).astype(np.float32)
+        names = ["red", "green", "blue"]
+        save_embedding_model(str(tmp_path), projection, rng.normal(size=(3, 16)), self.create_labels(names), version="emb-v1", grid=grid)
+        
+        colors = {"red": (220, 30, 30), "green": (30, 200, 40), "blue": (20, 40, 230), "yellow": (230, 220, 20)}
+        backend = EmbeddingModelBackend(str(tmp_path), warmup_iterations=0)
+        backend.load()
+        embeddings = {name: backend.embed(backend.preprocessor([Image.new("RGB", (64, 64), color)]))[0] for name, color in colors.items()}
+        
+        index_path = str(tmp_path / "species_index")
+        save_species_index(index_path, np.stack([embeddings[name] for name in names]), self.create_labels(names))
+        backend = EmbeddingModelBackend(str(tmp_path), warmup_iterations=0)
+        results = backend.predict(Image.new("RGB", (64, 64), colors["green"]))
+        assert results[0]["species_id"] == "green"
+        assert results[0]["confidence"] > 0.99
+        assert backend.version == "emb-v1"
+        
+        append_species(index_path, embeddings["yellow"][None, :], self.create_labels(["yellow"]))
+        with pytest.raises(ValueError):
+            append_species(index_path, embeddings["yellow"][None, :], self.create_labels(["yellow"]))
+        backend = EmbeddingModelBackend(str(tmp_path), warmup_iterations=0)
+        assert backend.predict(Image.new("RGB", (64, 64), colors["yellow"]))[0]["species_id"] == "yellow"
+        assert backend.get_status()["species_index"]["species"] == 4
+
+class TestANNIndex:
+    """Test the IVF-PQ approximate nearest-neighbour index"""
+    
+    def create_vectors(self, count=4000, dim=16, seed=0):
+        rng = np.random.default_rng(seed)
+        centres = rng.normal(size=(40, dim))
+        vectors = centres[rng.integers(0, 40, count)] + rng.normal(scale=0.4, size=(count, dim))
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    
+    def test_recall_against_brute_force(self, tmp_path):
+        """Test that a saved, memory-mapped index finds most exact neighbours"""
+        vectors = self.create_vectors()
+        ids = np.arange(len(vectors)) + 1000
+        build_index(vectors, ids, nlist=16, m=4, nprobe=4).save(str(tmp_path))
+        index = IVFPQIndex.load(str(tmp_path))
+        assert isinstance(index.codes, np.memmap)
+        assert len(index) == len(vectors)
+        
+        queries = vectors[:30]
+        found, similarities = index.search(queries, k=10)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :10] + 1000
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, truth)])
+        assert recall > 0.9
+        assert (found[:, 0] == ids[:30]).all()
+        np.testing.assert_allclose(similarities[:, 0], 1.0, atol=1e-2)
+    
+    def test_add_keeps_lists_grouped(self):
+        """Test that adding vectors after building merges them into the inverted lists"""
+        vectors = self.create_vectors(count=2000)
+        index = build_index(vectors[:1000], np.arange(1000), nlist=8, m=4, store_vectors=False)
+        index.add(vectors[1000:], np.arange(1000, 2000))
+        
+        assert len(index) == 2000 and index.offsets[-1] == 2000
+        lists, _ = index.encode(vectors)
+        assert (np.sort(lists) == np.repeat(np.arange(8), np.diff(index.offsets))).all()
+        found, _ = index.search(vectors[1500:1501], k=5, nprobe=8)
+        assert 1500 in found[0]
+    
+    def test_embedding_backend_returns_similar_observations(self, tmp_path):
+        """Test that embedding models with an observations index find past identifications"""
+        rng = np.random.default_rng(2)
+        grid = 4
+        projection = rng.normal(size=(3 * grid * grid, 8)).astype(np.float32)
+        labels = [{"species_id": f"s{i}", "scientific_name": f"S{i}", "common_name": f"s{i}", "family": "Testaceae", "genus": "S"} for i in range(3)]
+        save_embedding_model(str(tmp_path), projection, rng.normal(size=(3, 8)), labels, version="emb-v2", grid=grid)
+        backend = EmbeddingModelBackend(str(tmp_path), warmup_iterations=0)
+        assert not backend.has_observations
+        
+        images = [create_gradient_image(size=(64, 64)), create_gradient_image(size=(48, 80))]
+        decoded = [Image.open(io.BytesIO(data)).convert("RGB") for data in images]
+        embeddings = backend.embed(backend.preprocessor(decoded))
+        past = np.concatenate([embeddings, rng.normal(size=(400, 8)).astype(np.float32)])
+        build_index(past, np.arange(len(past)) + 1, nlist=4, m=2).save(str(tmp_path / "observations"))
+        
+        backend = EmbeddingModelBackend(str(tmp_path), warmup_iterations=0)
+        assert backend.has_observations
+        matches = backend.similar_observations(decoded, k=3)
+        assert [row[0]["identification_id"] for row in matches] == [1, 2]
+        assert matches[0][0]["similarity"] > 0.99
+        assert backend.get_status()["observations"]["vectors"] == 402
\ No newline at end of file